@@ -5,7 +5,7 @@ from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
 
 from alembic import context
-from src.sender.entities import Base, Metric, User
+from src.sender.entities import Base, Metric, MetricRollup, User
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,161 @@
+"""partition metrics and add rollups
+
+Revision ID: 24460010ea8a
+Revises: cafb17543192
+Create Date: 2026-10-19 11:21:05.633107
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "24460010ea8a"
+down_revision: Union[str, Sequence[str], None] = "cafb17543192"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Monthly partitions created in advance, `manage_metrics create-partitions` then
+# keeps creating them
+MONTHS_AHEAD = 3
+
+
+def partition_metrics() -> None:
+    # A partitioned table cannot be created from an existing one: rows are moved
+    # to a new partitioned table. Its primary key must contain the partition key.
+    op.execute(
+        "UPDATE metrics SET request_date = COALESCE(sent_to_llm_date, response_date, now()) "
+        "WHERE request_date IS NULL"
+    )
+    op.execute("ALTER TABLE metrics RENAME TO metrics_unpartitioned")
+    op.execute(
+        "ALTER TABLE metrics_unpartitioned RENAME CONSTRAINT metrics_pkey TO metrics_unpartitioned_pkey"
+    )
+    op.execute(
+        "CREATE TABLE metrics (LIKE metrics_unpartitioned INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (request_date)"
+    )
+    op.execute("ALTER TABLE metrics ALTER COLUMN request_date SET NOT NULL")
+    op.execute(
+        "ALTER TABLE metrics ADD CONSTRAINT metrics_pkey PRIMARY KEY (id, request_date)"
+    )
+    # The id sequence would be dropped with the old table
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            id_sequence text := pg_get_serial_sequence('metrics_unpartitioned', 'id');
+        BEGIN
+            IF id_sequence IS NOT NULL THEN
+                EXECUTE format('ALTER SEQUENCE %s OWNED BY metrics.id', id_sequence);
+            END IF;
+        END $$
+        """
+    )
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT month_start::date FROM generate_series(
+                    (
+                        SELECT date_trunc('month', COALESCE(MIN(request_date), now()))
+                        FROM metrics_unpartitioned
+                    ),
+                    date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+                    interval '1 month'
+                ) AS month_start
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF metrics FOR VALUES FROM (%L) TO (%L)',
+                    'metrics_' || to_char(month, 'YYYY_MM'),
+                    month,
+                    month + interval '1 month'
+                );
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute("CREATE TABLE metrics_default PARTITION OF metrics DEFAULT")
+    op.execute("INSERT INTO metrics SELECT * FROM metrics_unpartitioned")
+    op.execute("DROP TABLE metrics_unpartitioned")
+
+
+def unpartition_metrics() -> None:
+    op.execute("ALTER TABLE metrics RENAME TO metrics_partitioned")
+    op.execute(
+        "ALTER TABLE metrics_partitioned RENAME CONSTRAINT metrics_pkey TO metrics_partitioned_pkey"
+    )
+    op.execute("CREATE TABLE metrics (LIKE metrics_partitioned INCLUDING DEFAULTS)")
+    op.execute("ALTER TABLE metrics ALTER COLUMN request_date DROP NOT NULL")
+    op.execute("ALTER TABLE metrics ADD CONSTRAINT metrics_pkey PRIMARY KEY (id)")
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            id_sequence text := pg_get_serial_sequence('metrics_partitioned', 'id');
+        BEGIN
+            IF id_sequence IS NOT NULL THEN
+                EXECUTE format('ALTER SEQUENCE %s OWNED BY metrics.id', id_sequence);
+            END IF;
+        END $$
+        """
+    )
+    op.execute("INSERT INTO metrics SELECT * FROM metrics_partitioned")
+    # Partitions are dropped with their parent
+    op.execute("DROP TABLE metrics_partitioned")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        partition_metrics()
+    op.create_index(
+        "ix_metrics_request_date_model", "metrics", ["request_date", "model"]
+    )
+    op.create_index(
+        "ix_metrics_user_name_request_date", "metrics", ["user_name", "request_date"]
+    )
+
+    op.create_table(
+        "metric_rollups",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("granularity", sa.String(length=16), nullable=False),
+        sa.Column("bucket", sa.DateTime(), nullable=False),
+        sa.Column("model", sa.String(length=255), nullable=True),
+        sa.Column("server", sa.String(length=255), nullable=True),
+        sa.Column("server_organization", sa.String(length=255), nullable=True),
+        sa.Column("user_name", sa.String(length=255), nullable=True),
+        sa.Column("user_organization", sa.String(length=255), nullable=True),
+        sa.Column("request_count", sa.Integer(), nullable=False),
+        sa.Column("prompt_tokens", sa.BigInteger(), nullable=False),
+        sa.Column("completion_tokens", sa.BigInteger(), nullable=False),
+        sa.Column("queue_wait_p50", sa.Float(), nullable=True),
+        sa.Column("queue_wait_p95", sa.Float(), nullable=True),
+        sa.Column("ttft_p50", sa.Float(), nullable=True),
+        sa.Column("ttft_p95", sa.Float(), nullable=True),
+        sa.Column("duration_p50", sa.Float(), nullable=True),
+        sa.Column("duration_p95", sa.Float(), nullable=True),
+        sa.Column("tokens_per_second_p50", sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_metric_rollups_granularity_bucket",
+        "metric_rollups",
+        ["granularity", "bucket"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_metric_rollups_granularity_bucket", table_name="metric_rollups")
+    op.drop_table("metric_rollups")
+    op.drop_index("ix_metrics_user_name_request_date", table_name="metrics")
+    op.drop_index("ix_metrics_request_date_model", table_name="metrics")
+    if op.get_bind().dialect.name == "postgresql":
+        unpartition_metrics()
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -10,4 +12,8 @@ class MessageData(BaseModel):
     max_parallel_requests: int
     current_parallel_requests: int | None = None
     forwarded_priority: int | None = None
+    effective_priority: int | None = None
     performance_score: float | None = None
+    # Time the consumer granted the request, timezone aware as clocks of the
+    # consumer and the sender are not the same
+    granted_at: datetime | None = None
@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+
+
+class RequestData(BaseModel):
+    routing_mode: str = "any"
+    organization: str | None = None
+    user: str | None = None
+    user_priority: int | None = None
+    prefix_hash: str | None = None
+    prompt_tokens: int | None = None
+    max_tokens: int | None = None
+    # Servers that already failed to answer the request
+    excluded_servers: list[str] = []
+
+    @property
+    def context_tokens(self) -> int | None:
+        """Estimated context length needed by the request (prompt and completion)"""
+        if self.prompt_tokens is None:
+            return None
+        return self.prompt_tokens + (self.max_tokens or 0)
@@ -0,0 +1,249 @@
+import json
+import random
+import re
+import sys
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import IO, Any, Iterator
+
+# W3C trace context header, also used as AMQP message header
+TRACEPARENT_HEADER = "traceparent"
+TRACEPARENT_PATTERN = re.compile(
+    r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$"
+)
+
+# OTLP span kinds
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+PRODUCER = 4
+CONSUMER = 5
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def parse_traceparent(traceparent: Any) -> tuple[str, str, bool] | None:
+    """
+    Trace id, parent span id and sampled flag of a traceparent header, or None if
+    it is missing or invalid
+    """
+    if not isinstance(traceparent, str):
+        return None
+    match = TRACEPARENT_PATTERN.match(traceparent.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags, rest = match.groups()
+    if version == "ff" or (version == "00" and rest):
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+class Span:  # pylint: disable=too-many-instance-attributes
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_span_id: str | None,
+        sampled: bool,
+        kind: int = INTERNAL,
+        attributes: dict[str, Any] | None = None,
+        started_ago: float = 0,
+    ) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = STATUS_OK
+        # Durations come from the monotonic clock, only the start is wall time
+        self.start_ns = time.time_ns() - int(started_ago * 1e9)
+        self._start_perf_ns = time.perf_counter_ns() - int(started_ago * 1e9)
+        self.end_ns: int | None = None
+
+    @property
+    def traceparent(self) -> str:
+        flags = "01" if self.sampled else "00"
+        return f"00-{self.trace_id}-{self.span_id}-{flags}"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_error(self, description: str) -> None:
+        self.status = STATUS_ERROR
+        self.set_attribute("error.message", description)
+
+    def end(self) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._start_perf_ns
+        if self.sampled:
+            self.tracer.exporter.export(self.tracer.service_name, [self])
+
+
+class SpanExporter(ABC):  # pylint: disable=too-few-public-methods
+    @abstractmethod
+    def export(self, service_name: str, spans: list[Span]) -> None:
+        pass
+
+
+class NoopExporter(SpanExporter):  # pylint: disable=too-few-public-methods
+    def export(self, service_name: str, spans: list[Span]) -> None:
+        pass
+
+
+class OTLPJsonExporter(SpanExporter):
+    """
+    Writes spans as OTLP/JSON trace requests, one per line, which an OpenTelemetry
+    collector can read with its otlpjsonfile receiver
+    """
+
+    def __init__(self, stream: IO[str]) -> None:
+        self.stream = stream
+
+    @staticmethod
+    def encode_value(value: Any) -> dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    @classmethod
+    def encode_attributes(cls, attributes: dict[str, Any]) -> list[dict[str, Any]]:
+        return [
+            {"key": key, "value": cls.encode_value(value)}
+            for key, value in attributes.items()
+            if value is not None
+        ]
+
+    @classmethod
+    def encode_span(cls, span: Span) -> dict[str, Any]:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": cls.encode_attributes(span.attributes),
+            "status": {"code": span.status},
+        }
+        if span.parent_span_id:
+            encoded["parentSpanId"] = span.parent_span_id
+        return encoded
+
+    def export(self, service_name: str, spans: list[Span]) -> None:
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": self.encode_attributes(
+                            {"service.name": service_name}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "aristote-dispatcher"},
+                            "spans": [self.encode_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        self.stream.write(json.dumps(request, separators=(",", ":")) + "\n")
+        self.stream.flush()
+
+
+class Tracer:
+    """
+    Creates spans following the W3C trace context of their parent.
+
+    Spans inherit the sampling decision of their parent, so that a trace is
+    either fully exported or not at all; traces started here are sampled with
+    probability `sample_ratio`. Spans that are not sampled still carry the trace
+    context to propagate, but are never exported.
+    """
+
+    def __init__(
+        self, service_name: str, exporter: SpanExporter, sample_ratio: float
+    ) -> None:
+        self.service_name = service_name
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    def start_span(
+        self,
+        name: str,
+        parent: Span | str | None = None,
+        kind: int = INTERNAL,
+        attributes: dict[str, Any] | None = None,
+        started_ago: float = 0,
+    ) -> Span:
+        """
+        Starts a span, child of a span or of a traceparent header value, which
+        began `started_ago` seconds ago. It is exported once ended.
+        """
+        if isinstance(parent, Span):
+            context = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            context = parse_traceparent(parent)
+
+        if context is None:
+            trace_id = random.getrandbits(128).to_bytes(16, "big").hex()
+            parent_span_id = None
+            sampled = random.random() < self.sample_ratio
+        else:
+            trace_id, parent_span_id, sampled = context
+        return Span(
+            self,
+            name,
+            trace_id,
+            parent_span_id,
+            sampled,
+            kind,
+            attributes if sampled else None,
+            started_ago,
+        )
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        parent: Span | str | None = None,
+        kind: int = INTERNAL,
+        attributes: dict[str, Any] | None = None,
+    ) -> Iterator[Span]:
+        span = self.start_span(name, parent, kind, attributes)
+        try:
+            yield span
+        except Exception as e:
+            span.set_error(str(e))
+            raise
+        finally:
+            span.end()
+
+
+def create_tracer(
+    service_name: str, exporter: str, sample_ratio: float, file_path: str
+) -> Tracer:
+    if exporter == "stdout":
+        return Tracer(service_name, OTLPJsonExporter(sys.stdout), sample_ratio)
+    if exporter == "file":
+        # pylint: disable-next=consider-using-with
+        stream = open(file_path, "a", encoding="utf-8")
+        return Tracer(service_name, OTLPJsonExporter(stream), sample_ratio)
+    if exporter == "none":
+        # Trace contexts received are still propagated
+        return Tracer(service_name, NoopExporter(), 0)
+    raise ValueError(f"Unknown tracing exporter: {exporter}")
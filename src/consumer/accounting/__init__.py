@@ -0,0 +1,2 @@
+from src.consumer.accounting._base_accounting import BaseAccounting, Grant
+from src.consumer.accounting.replicator import AccountingReplicator
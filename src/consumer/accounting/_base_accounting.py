@@ -0,0 +1,153 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List
+
+from src.common.request_data import RequestData
+from src.consumer.vllm_server import VLLMServer
+
+
+@dataclass(frozen=True)
+class Grant:
+    cost: float
+    organization: str | None = None
+    granted_at: float = field(default_factory=time.monotonic)
+
+
+class BaseAccounting(ABC):
+    """
+    Keeps track of the requests granted to each server and of the load they
+    represent, expressed in the accounting unit (requests, tokens...).
+    """
+
+    def __init__(
+        self, servers: List[VLLMServer], reservation_idle_seconds: float = 0
+    ) -> None:
+        # VLLMServer can be used as dict key because it is a dataclass with frozen
+        # and eq set to True so a hash is used:
+        # https://github.com/python/cpython/blob/main/Lib/dataclasses.py#L891
+        self.in_flight: dict[VLLMServer, dict[str, Grant]] = {
+            server: {} for server in servers
+        }
+        # An organization's reservations can be borrowed by others once it has not
+        # asked for the model for reservation_idle_seconds
+        self.reservation_idle_seconds = reservation_idle_seconds
+        self.last_demand: dict[str, float] = {}
+        # Grants of the other consumer replicas of the model, by replica id then
+        # server url, kept up to date by an AccountingReplicator
+        self.remote_in_flight: dict[str, dict[str, dict[str, Grant]]] = {}
+        # Called on local grants and releases, e.g. to share them with other replicas
+        self.on_grant: Callable[[VLLMServer, str, Grant], None] = lambda *_: None
+        self.on_release: Callable[[VLLMServer, str], None] = lambda *_: None
+
+    @abstractmethod
+    def cost(self, request_data: RequestData | None) -> float:
+        pass
+
+    @abstractmethod
+    def capacity(self, server: VLLMServer) -> float:
+        pass
+
+    def effective_capacity(self, server: VLLMServer, factor: float = 1.0) -> float:
+        return self.capacity(server) * factor
+
+    def grant(
+        self,
+        server: VLLMServer,
+        correlation_id: str,
+        request_data: RequestData | None = None,
+    ) -> None:
+        grant = Grant(
+            cost=self.cost(request_data),
+            organization=request_data.organization if request_data else None,
+        )
+        self.in_flight[server][correlation_id] = grant
+        self.on_grant(server, correlation_id, grant)
+
+    def release(self, server: VLLMServer, correlation_id: str) -> bool:
+        released = self.in_flight[server].pop(correlation_id, None) is not None
+        if released:
+            self.on_release(server, correlation_id)
+        return released
+
+    def is_in_flight(self, server: VLLMServer, correlation_id: str) -> bool:
+        return correlation_id in self.in_flight[server]
+
+    def grants(self, server: VLLMServer) -> Iterator[Grant]:
+        """
+        Grants in flight on the server, from this consumer and from other replicas
+        """
+        yield from self.in_flight[server].values()
+        for replica_in_flight in self.remote_in_flight.values():
+            yield from replica_in_flight.get(server.url, {}).values()
+
+    def count(self, server: VLLMServer) -> int:
+        return sum(1 for _ in self.grants(server))
+
+    def load(self, server: VLLMServer) -> float:
+        return sum(grant.cost for grant in self.grants(server))
+
+    def organization_load(self, server: VLLMServer, organization: str) -> float:
+        return sum(
+            grant.cost
+            for grant in self.grants(server)
+            if grant.organization == organization
+        )
+
+    def record_demand(self, organization: str | None) -> None:
+        if organization:
+            self.last_demand[organization] = time.monotonic()
+
+    def is_idle(self, organization: str) -> bool:
+        last_demand = self.last_demand.get(organization, -math.inf)
+        return time.monotonic() - last_demand > self.reservation_idle_seconds
+
+    def reserved_capacity(
+        self, server: VLLMServer, organization: str, factor: float = 1.0
+    ) -> float:
+        share = server.reserved_share(organization) / server.max_parallel_requests
+        return self.effective_capacity(server, factor) * share
+
+    def usage(
+        self,
+        server: VLLMServer,
+        organization: str | None = None,
+        factor: float = 1.0,
+    ) -> float:
+        """
+        Load of the server as seen by a request of `organization`: the current load,
+        plus the capacity reserved to other organizations that they are not using
+        and cannot lend because they are not idle.
+        """
+        held_back = 0
+        for reserving_organization, _ in server.reservations:
+            if reserving_organization == organization or self.is_idle(
+                reserving_organization
+            ):
+                continue
+            held_back += max(
+                0,
+                self.reserved_capacity(server, reserving_organization, factor)
+                - self.organization_load(server, reserving_organization),
+            )
+        return self.load(server) + held_back
+
+    def is_saturated(
+        self,
+        server: VLLMServer,
+        request_data: RequestData | None = None,
+        factor: float = 1.0,
+    ) -> bool:
+        """
+        Whether the request does not fit in the capacity left to it on the server.
+        An idle server admits any request it is not holding back for reservations,
+        so that requests larger than its capacity are not starved.
+        """
+        usage = self.usage(
+            server, request_data.organization if request_data else None, factor
+        )
+        capacity = self.effective_capacity(server, factor)
+        if self.load(server) == 0:
+            return usage >= capacity
+        return usage + self.cost(request_data) > capacity
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Callable, List
+
+from aio_pika import ExchangeType, Message
+from aio_pika.abc import AbstractChannel, AbstractExchange, AbstractIncomingMessage
+
+from src.consumer.accounting._base_accounting import BaseAccounting, Grant
+from src.consumer.vllm_server import VLLMServer
+
+GRANT_EVENT = "grant"
+RELEASE_EVENT = "release"
+SNAPSHOT_EVENT = "snapshot"
+LEAVE_EVENT = "leave"
+
+
+class AccountingReplicator:  # pylint: disable=too-many-instance-attributes
+    """
+    Shares the grants of the consumer replicas of a model through a fanout
+    exchange, so that every replica admits requests against the load of the whole
+    fleet.
+
+    Each replica is the only writer of its own slot of the shared state: it
+    publishes its grants and releases as they happen, and a full snapshot of its
+    slot every `snapshot_interval` seconds. Messages are numbered, and a replica
+    keeps, for each other replica, the slot with the highest sequence number
+    seen, so slots converge whatever messages were lost or duplicated. Slots of
+    replicas silent for `3 * snapshot_interval` seconds are dropped.
+    """
+
+    def __init__(
+        self,
+        accounting: BaseAccounting,
+        servers: List[VLLMServer],
+        exchange_name: str,
+        snapshot_interval: float,
+    ) -> None:
+        self.accounting = accounting
+        self.servers = {server.url: server for server in servers}
+        self.exchange_name = exchange_name
+        self.snapshot_interval = snapshot_interval
+        self.replica_id = uuid.uuid4().hex
+        self.seq = 0
+        self.last_seq: dict[str, int] = {}
+        self.last_seen: dict[str, float] = {}
+        # Called when another replica releases one of our grants (its consumer
+        # received the completion message)
+        self.on_remote_release: Callable[[VLLMServer, str], None] = lambda *_: None
+        self.exchange: AbstractExchange | None = None
+        self._outbox: asyncio.Queue[dict] = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        accounting.on_grant = self.publish_grant
+        accounting.on_release = self.publish_release
+
+    async def setup(self, channel: AbstractChannel) -> None:
+        """
+        Declares the exchange and a queue of this replica bound to it on the
+        channel. Called again with the new channel after a reconnection.
+        """
+        self.exchange = await channel.declare_exchange(
+            self.exchange_name, ExchangeType.FANOUT, auto_delete=True
+        )
+        queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+        await queue.bind(self.exchange)
+        await queue.consume(self.on_event, no_ack=True)
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._publish_outbox()),
+                asyncio.create_task(self._publish_snapshots()),
+            ]
+        self.enqueue(SNAPSHOT_EVENT, in_flight=self.snapshot())
+
+    async def close(self) -> None:
+        if self.exchange is not None:
+            self.enqueue(LEAVE_EVENT)
+            # Events left unpublished are dropped: other replicas forget this
+            # one once it is silent for long enough anyway
+            try:
+                await asyncio.wait_for(
+                    self._outbox.join(), timeout=self.snapshot_interval
+                )
+            except asyncio.TimeoutError:
+                logging.warning(
+                    "%s accounting events not published before closing",
+                    self._outbox.qsize(),
+                )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, event_type: str, **payload) -> None:
+        # Events go through a single publishing task to keep them ordered
+        self.seq += 1
+        self._outbox.put_nowait(
+            {"replica": self.replica_id, "seq": self.seq, "type": event_type} | payload
+        )
+
+    def publish_grant(self, server: VLLMServer, correlation_id: str, grant: Grant):
+        self.enqueue(
+            GRANT_EVENT,
+            server=server.url,
+            correlation_id=correlation_id,
+            cost=grant.cost,
+            organization=grant.organization,
+        )
+
+    def publish_release(self, server: VLLMServer, correlation_id: str):
+        self.enqueue(RELEASE_EVENT, server=server.url, correlation_id=correlation_id)
+
+    def snapshot(self) -> dict[str, dict[str, list]]:
+        return {
+            server.url: {
+                correlation_id: [grant.cost, grant.organization]
+                for correlation_id, grant in grants.items()
+            }
+            for server, grants in self.accounting.in_flight.items()
+            if grants
+        }
+
+    async def _publish_outbox(self) -> None:
+        while True:
+            event = await self._outbox.get()
+            try:
+                await self.exchange.publish(
+                    Message(
+                        body=json.dumps(event).encode("utf-8"),
+                        expiration=self.snapshot_interval,
+                    ),
+                    routing_key="",
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # the next snapshot will make up for the lost event
+                logging.warning("Could not publish accounting event: %s", e)
+            finally:
+                self._outbox.task_done()
+
+    async def _publish_snapshots(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            self.enqueue(SNAPSHOT_EVENT, in_flight=self.snapshot())
+            self.forget_silent_replicas()
+
+    def forget_silent_replicas(self) -> None:
+        deadline = time.monotonic() - 3 * self.snapshot_interval
+        for replica, last_seen in list(self.last_seen.items()):
+            if last_seen < deadline:
+                logging.info("Consumer replica %s is gone", replica)
+                self.forget(replica)
+
+    def forget(self, replica: str) -> None:
+        self.accounting.remote_in_flight.pop(replica, None)
+        self.last_seq.pop(replica, None)
+        self.last_seen.pop(replica, None)
+
+    async def on_event(self, message: AbstractIncomingMessage) -> None:
+        try:
+            event = json.loads(message.body)
+            replica = event["replica"]
+            if replica == self.replica_id:
+                return
+            if event["seq"] <= self.last_seq.get(replica, 0):
+                return
+
+            new_replica = replica not in self.last_seq
+            self.last_seq[replica] = event["seq"]
+            self.last_seen[replica] = time.monotonic()
+            slot = self.accounting.remote_in_flight.setdefault(replica, {})
+
+            if event["type"] == SNAPSHOT_EVENT:
+                self.accounting.remote_in_flight[replica] = {
+                    url: {
+                        correlation_id: Grant(cost=cost, organization=organization)
+                        for correlation_id, (cost, organization) in grants.items()
+                    }
+                    for url, grants in event["in_flight"].items()
+                }
+            elif event["type"] == GRANT_EVENT:
+                slot.setdefault(event["server"], {})[event["correlation_id"]] = Grant(
+                    cost=event["cost"], organization=event["organization"]
+                )
+            elif event["type"] == RELEASE_EVENT:
+                released = (
+                    slot.get(event["server"], {}).pop(event["correlation_id"], None)
+                    is not None
+                )
+                if not released and event["server"] in self.servers:
+                    # Completion messages are shared between replicas: the one
+                    # that received it may not be the one that granted the request
+                    self.on_remote_release(
+                        self.servers[event["server"]], event["correlation_id"]
+                    )
+            elif event["type"] == LEAVE_EVENT:
+                self.forget(replica)
+
+            if new_replica and event["type"] != LEAVE_EVENT:
+                # Let the newcomer know about our grants without waiting
+                self.enqueue(SNAPSHOT_EVENT, in_flight=self.snapshot())
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error("Error processing accounting event: %s", e)
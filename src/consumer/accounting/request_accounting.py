@@ -0,0 +1,23 @@
+import math
+
+from src.common.request_data import RequestData
+from src.consumer.accounting._base_accounting import BaseAccounting
+from src.consumer.vllm_server import VLLMServer
+
+
+class RequestAccounting(BaseAccounting):
+    """
+    Every grant counts as one request, against the server's max_parallel_requests
+    """
+
+    def cost(self, request_data: RequestData | None) -> float:
+        return 1
+
+    def capacity(self, server: VLLMServer) -> float:
+        return server.max_parallel_requests
+
+    def effective_capacity(self, server: VLLMServer, factor: float = 1.0) -> int:
+        return max(1, math.ceil(self.capacity(server) * factor))
+
+    def load(self, server: VLLMServer) -> int:
+        return self.count(server)
@@ -0,0 +1,35 @@
+from typing import List
+
+from src.common.request_data import RequestData
+from src.consumer.accounting._base_accounting import BaseAccounting
+from src.consumer.vllm_server import VLLMServer
+
+
+class TokenAccounting(BaseAccounting):
+    """
+    Every grant counts as its estimated prefill cost plus its decode budget,
+    against the server's max_outstanding_tokens
+    """
+
+    def __init__(
+        self,
+        servers: List[VLLMServer],
+        default_max_tokens: int,
+        prefill_cost_weight: float,
+        reservation_idle_seconds: float = 0,
+    ) -> None:
+        super().__init__(servers, reservation_idle_seconds)
+        self.default_max_tokens = default_max_tokens
+        self.prefill_cost_weight = prefill_cost_weight
+
+    def cost(self, request_data: RequestData | None) -> float:
+        prompt_tokens = 0
+        max_tokens = self.default_max_tokens
+        if request_data is not None:
+            prompt_tokens = request_data.prompt_tokens or 0
+            if request_data.max_tokens is not None:
+                max_tokens = request_data.max_tokens
+        return self.prefill_cost_weight * prompt_tokens + max_tokens
+
+    def capacity(self, server: VLLMServer) -> float:
+        return server.max_outstanding_tokens
@@ -6,9 +6,15 @@ from typing import Literal, TypeAlias
 WARNING_LOG_QOS = "warning-log"
 PERFORMANCE_BASED_REQUEUE_QOS = "performance-based-requeue"
 PARALLEL_REQUESTS_THRESHOLD_REQUEUE_QOS = "parallel-requests-threshold-requeue"
+KV_CACHE_PRESSURE_REQUEUE_QOS = "kv-cache-pressure-requeue"
+TOKEN_THROUGHPUT_REQUEUE_QOS = "token-throughput-requeue"
 
 AllowedQualityOfServicePolicies: TypeAlias = Literal[
-    "warning-log", "performance-based-requeue", "parallel-requests-threshold-requeue"
+    "warning-log",
+    "performance-based-requeue",
+    "parallel-requests-threshold-requeue",
+    "kv-cache-pressure-requeue",
+    "token-throughput-requeue",
 ]
 
 ######################
@@ -16,8 +22,12 @@ AllowedQualityOfServicePolicies: TypeAlias = Literal[
 ######################
 LEAST_BUSY = "least-busy"
 ROUND_ROBIN = "round-robin"
+PREFIX_AFFINITY = "prefix-affinity"
+QUEUE_DEPTH = "queue-depth"
 
-AllowedRoutingStrategies: TypeAlias = Literal["least-busy", "round-robin"]
+AllowedRoutingStrategies: TypeAlias = Literal[
+    "least-busy", "round-robin", "prefix-affinity", "queue-depth"
+]
 
 #####################
 # PRIORITY HANDLERS #
@@ -26,3 +36,11 @@ IGNORE_PRIORITY_HANDLER = "ignore"
 VLLM_PRIORITY_HANDLER = "vllm"
 
 AllowedPriorityHandlers: TypeAlias = Literal["ignore", "vllm"]
+
+#######################
+# CAPACITY ACCOUNTING #
+#######################
+REQUESTS_ACCOUNTING = "requests"
+TOKENS_ACCOUNTING = "tokens"
+
+AllowedCapacityAccountings: TypeAlias = Literal["requests", "tokens"]
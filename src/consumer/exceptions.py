@@ -18,7 +18,7 @@ class ServerNotFound(Exception):
 
 class UnknownStrategy(Exception):
     def __init__(self, passed_strategy):
-        message = f'"{passed_strategy}" not recognized; strategy must be either round-robin or least-busy'
+        message = f'"{passed_strategy}" not recognized; strategy must be either round-robin, least-busy, prefix-affinity or queue-depth'
         super().__init__(message)
 
 
@@ -38,7 +38,7 @@ class PercentileComputationError(Exception):
 
 class UnknownQOSPolicy(Exception):
     def __init__(self, passed_policy):
-        message = f'"{passed_policy} not recognized; policy must either be "warning-log" or "requeue"'
+        message = f'"{passed_policy} not recognized; policy must be one of "warning-log", "performance-based-requeue", "parallel-requests-threshold-requeue", "kv-cache-pressure-requeue" or "token-throughput-requeue"'
         super().__init__(message)
 
 
@@ -46,3 +46,12 @@ class UnknownLocalPriorityModel(Exception):
     def __init__(self, passed_model):
         message = f'"{passed_model} not recognized; model must either be "private-first" or "private-only"'
         super().__init__(message)
+
+
+class UnknownCapacityAccounting(Exception):
+    def __init__(self, passed_accounting):
+        message = (
+            f'"{passed_accounting}" not recognized; capacity accounting must be '
+            'either "requests" or "tokens"'
+        )
+        super().__init__(message)
@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict, deque
+
+from aio_pika.abc import AbstractIncomingMessage
+
+from src.common.request_data import RequestData
+
+
+class FairScheduler:
+    """
+    Deficit round-robin across users inside each priority level.
+
+    Messages of the highest priority level are always served first; inside a
+    level, each user gets a share of the grants proportional to its weight
+    (its priority as a user), so that a single user flooding the queue
+    cannot starve the others.
+    """
+
+    def __init__(self, quantum: float = 1.0) -> None:
+        self.quantum = quantum
+        # priority -> user -> (weight, pending messages), users in round-robin order
+        self.queues: dict[
+            int,
+            OrderedDict[
+                str,
+                tuple[float, deque[tuple[AbstractIncomingMessage, RequestData, float]]],
+            ],
+        ] = {}
+        self.deficits: dict[tuple[int, str], float] = {}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def clear(self) -> int:
+        """
+        Forgets every held message, e.g. when the channel they were delivered on is
+        closed and the broker delivers them again. Returns how many were dropped.
+        """
+        dropped = self.size
+        self.queues.clear()
+        self.deficits.clear()
+        self.size = 0
+        return dropped
+
+    def push(self, message: AbstractIncomingMessage, request_data: RequestData) -> None:
+        priority = message.priority or 0
+        user = request_data.user or ""
+        weight = max(request_data.user_priority or 1, 1)
+
+        users = self.queues.setdefault(priority, OrderedDict())
+        if user not in users:
+            users[user] = (weight, deque())
+        users[user][1].append((message, request_data, time.monotonic()))
+        self.size += 1
+
+    def pop(self) -> tuple[AbstractIncomingMessage, RequestData, float] | None:
+        """
+        Returns the next message to dispatch, along with its request data and
+        the (monotonic) time at which it was received
+        """
+        for priority in sorted(self.queues, reverse=True):
+            users = self.queues[priority]
+            if not users:
+                continue
+
+            while True:
+                user, (weight, messages) = next(iter(users.items()))
+                key = (priority, user)
+
+                # a user reaching the front of the round gets its quantum
+                if self.deficits.get(key, 0) < 1:
+                    self.deficits[key] = self.deficits.get(key, 0) + (
+                        self.quantum * weight
+                    )
+                    if self.deficits[key] < 1:
+                        users.move_to_end(user)
+                        continue
+
+                self.deficits[key] -= 1
+                item = messages.popleft()
+                self.size -= 1
+                if not messages:
+                    del users[user]
+                    del self.deficits[key]
+                elif self.deficits[key] < 1:
+                    users.move_to_end(user)
+                return item
+
+        return None
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Iterable, List
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from src.common.tracing import create_tracer
+from src.consumer.settings import settings
+
+if TYPE_CHECKING:
+    from src.consumer.rpc_server import RPCServer
+
+# Decisions taken on the messages of the model queues
+GRANTED = "granted"
+DEFERRED = "deferred"  # the QoS policy requeued the message
+SPILLED_OVER = "spilled_over"  # a private-first request granted to a public server
+NO_SERVER = "no_server"
+EXPIRED = "expired"  # held by the fair scheduler longer than its TTL
+
+DISPATCH_DECISIONS = Counter(
+    "consumer_dispatch_decisions_total",
+    "Decisions taken on the requests of each model",
+    ["model", "server", "decision"],
+)
+QUEUE_RESIDENCE = Histogram(
+    "consumer_queue_residence_seconds",
+    "Time from the publication of a request by the sender to its grant",
+    ["model"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+SCRAPE_DURATION = Histogram(
+    "consumer_scrape_duration_seconds",
+    "Duration of the successful scrapes of vllm metrics",
+    ["server"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+SCRAPE_FAILURES = Counter(
+    "consumer_scrape_failures_total",
+    "Failed scrapes of vllm metrics (the server is then unhealthy)",
+    ["server"],
+)
+REAPER_EXPIRATIONS = Counter(
+    "consumer_reaper_expirations_total",
+    "Grants released because their completion never came",
+    ["model", "server"],
+)
+EVENT_LOOP_LAG = Gauge(
+    "consumer_event_loop_lag_seconds",
+    "Delay of the last event loop lag probe wake up",
+)
+
+TRACER = create_tracer(
+    "aristote-consumer",
+    settings.TRACING_EXPORTER,
+    settings.TRACING_SAMPLE_RATIO,
+    settings.TRACING_FILE,
+)
+
+
+class RPCServersCollector(Collector):  # pylint: disable=too-few-public-methods
+    """
+    Reads the in-flight requests, limits and scores of the RPC servers when
+    metrics are collected
+    """
+
+    def __init__(self, rpc_servers: List["RPCServer"]) -> None:
+        self.rpc_servers = rpc_servers
+
+    def collect(self) -> Iterable[GaugeMetricFamily]:
+        in_flight = GaugeMetricFamily(
+            "consumer_in_flight_requests",
+            "Requests granted and not completed yet, including other replicas'",
+            labels=["model", "server"],
+        )
+        load = GaugeMetricFamily(
+            "consumer_load",
+            "Load of the granted requests, in capacity accounting units",
+            labels=["model", "server"],
+        )
+        capacity = GaugeMetricFamily(
+            "consumer_capacity",
+            "Capacity of the server, in capacity accounting units",
+            labels=["model", "server"],
+        )
+        score = GaugeMetricFamily(
+            "consumer_strategy_score",
+            "Score of the server for the routing strategy (lower is better)",
+            labels=["model", "server"],
+        )
+        healthy = GaugeMetricFamily(
+            "consumer_healthy_server",
+            "Whether the server is part of the healthy servers of the strategy",
+            labels=["model", "server"],
+        )
+        for rpc_server in self.rpc_servers:
+            healthy_urls = {server.url for server in rpc_server.strategy.servers}
+            for server in rpc_server.servers:
+                labels = [rpc_server.model, server.url]
+                in_flight.add_metric(labels, rpc_server.accounting.count(server))
+                load.add_metric(labels, rpc_server.accounting.load(server))
+                capacity.add_metric(labels, rpc_server.effective_capacity(server))
+                healthy.add_metric(labels, int(server.url in healthy_urls))
+                server_score = rpc_server.strategy.get_server_score(server.url)
+                if server_score is not None:
+                    score.add_metric(labels, server_score)
+        yield from (in_flight, load, capacity, score, healthy)
+
+
+async def monitor_event_loop_lag(interval: float = 1) -> None:
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(time.monotonic() - start - interval, 0))
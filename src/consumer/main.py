@@ -1,77 +1,124 @@
 import asyncio
 import logging
 import signal
+from typing import List
 
+from aio_pika import connect_robust
+
+from src.consumer.accounting import AccountingReplicator
+from src.consumer.accounting.request_accounting import RequestAccounting
+from src.consumer.accounting.token_accounting import TokenAccounting
 from src.consumer.constants import (
     IGNORE_PRIORITY_HANDLER,
+    KV_CACHE_PRESSURE_REQUEUE_QOS,
     LEAST_BUSY,
     PARALLEL_REQUESTS_THRESHOLD_REQUEUE_QOS,
     PERFORMANCE_BASED_REQUEUE_QOS,
+    PREFIX_AFFINITY,
+    QUEUE_DEPTH,
+    REQUESTS_ACCOUNTING,
     ROUND_ROBIN,
+    TOKEN_THROUGHPUT_REQUEUE_QOS,
+    TOKENS_ACCOUNTING,
     VLLM_PRIORITY_HANDLER,
     WARNING_LOG_QOS,
 )
 from src.consumer.exceptions import (
+    UnknownCapacityAccounting,
     UnknownPriorityHandler,
     UnknownQOSPolicy,
     UnknownStrategy,
 )
+from src.consumer.fair_scheduler import FairScheduler
 from src.consumer.metrics import wait_for_vllms
 from src.consumer.priority_handler.ignore_priority_handler import (
     IgnorePriorityHandler,
 )
 from src.consumer.priority_handler.vllm_priority_handler import VllmPriorityHandler
 from src.consumer.probes import Prober
+from src.consumer.quality_of_service_policy.kv_cache_pressure_requeue_policy import (
+    KvCachePressureRequeuePolicy,
+)
 from src.consumer.quality_of_service_policy.parallel_requests_threshold_requeue_policy import (
     ParallelRequestsThresholdRequeuePolicy,
 )
 from src.consumer.quality_of_service_policy.performance_based_requeue_policy import (
     PerformanceBasedRequeuePolicy,
 )
+from src.consumer.quality_of_service_policy.qos_policy import QualityOfServiceBasePolicy
+from src.consumer.quality_of_service_policy.token_throughput_requeue_policy import (
+    TokenThroughputRequeuePolicy,
+)
 from src.consumer.quality_of_service_policy.warning_log_policy import WarningLogPolicy
+from src.consumer.reaper import ExpiryReaper
 from src.consumer.rpc_server import RPCServer
-from src.consumer.server_pinger import ServerPinger
 from src.consumer.settings import settings
 from src.consumer.strategy.least_busy import LeastBusy
-from src.consumer.strategy.metrics_based_strategy import MetricsBasedStrategy
+from src.consumer.strategy.metrics_tracker import MetricsTracker
+from src.consumer.strategy.prefix_affinity import PrefixAffinity
+from src.consumer.strategy.queue_depth import QueueDepth
 from src.consumer.strategy.round_robin import RoundRobin
 from src.consumer.strategy.server_selection_strategy import ServerSelectionStrategy
+from src.consumer.vllm_server import VLLMServer
 
-VLLM_SERVERS = settings.VLLM_SERVERS
+MODEL_SERVERS = settings.MODEL_SERVERS
+# A server shared by several models is scraped once
+VLLM_SERVERS = list(
+    {
+        server.url: server for servers in MODEL_SERVERS.values() for server in servers
+    }.values()
+)
 RABBITMQ_URL = settings.RABBITMQ_URL
 ROUTING_STRATEGY = settings.ROUTING_STRATEGY
-TIME_TO_FIRST_TOKEN_THRESHOLD = settings.TIME_TO_FIRST_TOKEN_THRESHOLD
+# Threshold of the performance indicator returned by the routing strategy
+PERFORMANCE_THRESHOLD = (
+    settings.QUEUE_DEPTH_THRESHOLD
+    if ROUTING_STRATEGY == QUEUE_DEPTH
+    else settings.TIME_TO_FIRST_TOKEN_THRESHOLD
+)
 METRICS_REFRESH_RATE = settings.METRICS_REFRESH_RATE
 REFRESH_COUNT_PER_WINDOW = settings.REFRESH_COUNT_PER_WINDOW
 PING_REFRESH_RATE = settings.PING_REFRESH_RATE
+METRICS_MAX_REFRESH_RATE = settings.METRICS_MAX_REFRESH_RATE
 
 shutdown_signal = asyncio.Event()
 
 
-async def main_consumer(p_strategy: ServerSelectionStrategy, p_rpc_server: RPCServer):
+async def main_consumer(
+    p_rpc_servers: List[RPCServer],
+    p_tracker: MetricsTracker,
+    p_reaper: ExpiryReaper,
+):
     await wait_for_vllms(VLLM_SERVERS)
 
-    await p_rpc_server.first_connect()
+    # The RPC servers of all models share one connection
+    connection = await connect_robust(url=RABBITMQ_URL)
+    for rpc_server in p_rpc_servers:
+        await rpc_server.first_connect(connection)
 
-    pinger = ServerPinger(
-        servers=VLLM_SERVERS,
-        time_interval=PING_REFRESH_RATE,
-        strategy=p_strategy,
-    )
-    await pinger.monitor()
+    async def update_servers(healthy_servers: List[VLLMServer]) -> None:
+        healthy_urls = {server.url for server in healthy_servers}
+        for rpc_server in p_rpc_servers:
+            await rpc_server.strategy.update_servers(
+                [server for server in rpc_server.servers if server.url in healthy_urls]
+            )
+
+    # The metrics scrape also tells which servers are healthy
+    p_tracker.on_health_change = update_servers
+    await p_tracker.monitor()
+    await p_reaper.monitor()
 
     # Consumer is running until shutdown signal is received
     # Until then, all action occurs in the on_message_callback
     # of the RPCServer class
     await shutdown_signal.wait()
 
-    await p_rpc_server.close()
-
-    await pinger.stop_monitor()
+    for rpc_server in p_rpc_servers:
+        await rpc_server.close()
+    await connection.close()
 
-    # we need to explicitly stop monitoring
-    if isinstance(p_strategy, MetricsBasedStrategy):
-        await p_strategy.tracker.stop_monitor()
+    await p_reaper.stop_monitor()
+    await p_tracker.stop_monitor()
 
 
 def shutdown():
@@ -79,25 +126,62 @@ def shutdown():
     shutdown_signal.set()
 
 
-if __name__ == "__main__":
-    logging.info("Starting consumer")
-
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
+def create_strategy(
+    servers: List[VLLMServer], metrics_tracker: MetricsTracker
+) -> ServerSelectionStrategy:
     if ROUTING_STRATEGY == LEAST_BUSY:
-        strategy = loop.run_until_complete(
-            LeastBusy.create(
-                VLLM_SERVERS,
-                METRICS_REFRESH_RATE,
-                REFRESH_COUNT_PER_WINDOW,
-            )
-        )  # monitoring starts via the LeastBusy create method, no need to explicitly start it here
+        strategy = LeastBusy(servers, metrics_tracker)
     elif ROUTING_STRATEGY == ROUND_ROBIN:
-        strategy = RoundRobin(VLLM_SERVERS)
+        strategy = RoundRobin(servers)
+    elif ROUTING_STRATEGY == PREFIX_AFFINITY:
+        strategy = PrefixAffinity(
+            servers,
+            settings.PREFIX_AFFINITY_TABLE_SIZE,
+            settings.PREFIX_AFFINITY_VIRTUAL_NODES,
+        )
+    elif ROUTING_STRATEGY == QUEUE_DEPTH:
+        strategy = QueueDepth(
+            servers,
+            metrics_tracker,
+            settings.QUEUE_DEPTH_RUNNING_WEIGHT,
+            settings.QUEUE_DEPTH_WAITING_WEIGHT,
+            settings.QUEUE_DEPTH_IN_FLIGHT_WEIGHT,
+        )
     else:
         raise UnknownStrategy(ROUTING_STRATEGY)
+    return strategy
 
+
+def create_quality_of_service_policy(
+    metrics_tracker: MetricsTracker,
+) -> QualityOfServiceBasePolicy:
+    if settings.QUALITY_OF_SERVICE_POLICY == WARNING_LOG_QOS:
+        quality_of_service_policy = WarningLogPolicy(PERFORMANCE_THRESHOLD)
+    elif settings.QUALITY_OF_SERVICE_POLICY == PERFORMANCE_BASED_REQUEUE_QOS:
+        quality_of_service_policy = PerformanceBasedRequeuePolicy(PERFORMANCE_THRESHOLD)
+    elif settings.QUALITY_OF_SERVICE_POLICY == PARALLEL_REQUESTS_THRESHOLD_REQUEUE_QOS:
+        quality_of_service_policy = ParallelRequestsThresholdRequeuePolicy(None)
+    elif settings.QUALITY_OF_SERVICE_POLICY == KV_CACHE_PRESSURE_REQUEUE_QOS:
+        quality_of_service_policy = KvCachePressureRequeuePolicy(
+            None,
+            metrics_tracker,
+            settings.MAX_KV_CACHE_USAGE,
+            settings.MAX_PREEMPTIONS_PER_SECOND,
+        )
+    elif settings.QUALITY_OF_SERVICE_POLICY == TOKEN_THROUGHPUT_REQUEUE_QOS:
+        quality_of_service_policy = TokenThroughputRequeuePolicy(
+            None,
+            metrics_tracker,
+            settings.MIN_TOKENS_PER_SECOND_PER_USER,
+        )
+    else:
+        raise UnknownQOSPolicy(settings.QUALITY_OF_SERVICE_POLICY)
+    return quality_of_service_policy
+
+
+def create_rpc_server(
+    model: str, servers: List[VLLMServer], metrics_tracker: MetricsTracker
+) -> RPCServer:
     if settings.PRIORITY_HANDLER == IGNORE_PRIORITY_HANDLER:
         priority_handler = IgnorePriorityHandler(settings.BEST_PRIORITY)
     elif settings.PRIORITY_HANDLER == VLLM_PRIORITY_HANDLER:
@@ -105,25 +189,70 @@ if __name__ == "__main__":
     else:
         raise UnknownPriorityHandler(settings.PRIORITY_HANDLER)
 
-    if settings.QUALITY_OF_SERVICE_POLICY == WARNING_LOG_QOS:
-        quality_of_service_policy = WarningLogPolicy(TIME_TO_FIRST_TOKEN_THRESHOLD)
-    elif settings.QUALITY_OF_SERVICE_POLICY == PERFORMANCE_BASED_REQUEUE_QOS:
-        quality_of_service_policy = PerformanceBasedRequeuePolicy(
-            TIME_TO_FIRST_TOKEN_THRESHOLD
+    if settings.CAPACITY_ACCOUNTING == REQUESTS_ACCOUNTING:
+        accounting = RequestAccounting(servers, settings.RESERVATION_IDLE_SECONDS)
+    elif settings.CAPACITY_ACCOUNTING == TOKENS_ACCOUNTING:
+        accounting = TokenAccounting(
+            servers,
+            settings.DEFAULT_MAX_TOKENS_ESTIMATE,
+            settings.PREFILL_COST_WEIGHT,
+            settings.RESERVATION_IDLE_SECONDS,
         )
-    elif settings.QUALITY_OF_SERVICE_POLICY == PARALLEL_REQUESTS_THRESHOLD_REQUEUE_QOS:
-        quality_of_service_policy = ParallelRequestsThresholdRequeuePolicy(None)
     else:
-        raise UnknownQOSPolicy(settings.QUALITY_OF_SERVICE_POLICY)
+        raise UnknownCapacityAccounting(settings.CAPACITY_ACCOUNTING)
 
-    rpc_server = RPCServer(
+    return RPCServer(
         url=RABBITMQ_URL,
-        strategy=strategy,
-        quality_of_service_policy=quality_of_service_policy,
+        model=model,
+        servers=servers,
+        strategy=create_strategy(servers, metrics_tracker),
+        quality_of_service_policy=create_quality_of_service_policy(metrics_tracker),
         priority_handler=priority_handler,
+        accounting=accounting,
+        scheduler=(
+            FairScheduler(settings.FAIR_QUEUING_QUANTUM)
+            if settings.USE_FAIR_QUEUING
+            else None
+        ),
+        replicator=(
+            AccountingReplicator(
+                accounting,
+                servers,
+                f"{model}_accounting",
+                settings.ACCOUNTING_SNAPSHOT_INTERVAL,
+            )
+            if settings.SHARED_ACCOUNTING
+            else None
+        ),
+        tracker=metrics_tracker,
     )
 
-    prober = Prober(rpc_server)
+
+if __name__ == "__main__":
+    logging.info("Starting consumer")
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # Shared by all models, metrics based strategies and QoS policies,
+    # and used for health checks
+    tracker = MetricsTracker(
+        VLLM_SERVERS,
+        METRICS_REFRESH_RATE,
+        REFRESH_COUNT_PER_WINDOW,
+        max_refresh_rate=METRICS_MAX_REFRESH_RATE,
+        unhealthy_refresh_rate=PING_REFRESH_RATE,
+        timeout=settings.METRICS_SCRAPE_TIMEOUT,
+        jitter=settings.METRICS_SCRAPE_JITTER,
+    )
+
+    rpc_servers = [
+        create_rpc_server(model, servers, tracker)
+        for model, servers in MODEL_SERVERS.items()
+    ]
+    reaper = ExpiryReaper(rpc_servers, settings.VLLM_TREATMENT_TIMEOUT_SECONDS)
+
+    prober = Prober(rpc_servers)
 
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, shutdown)
@@ -132,7 +261,7 @@ if __name__ == "__main__":
         loop.run_until_complete(prober.setup())
 
     try:
-        loop.run_until_complete(main_consumer(strategy, rpc_server))
+        loop.run_until_complete(main_consumer(rpc_servers, tracker, reaper))
     except Exception as e:
         logging.fatal("Consumer fatal error: %s", e)
         raise
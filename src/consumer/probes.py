@@ -1,34 +1,55 @@
+import asyncio
+from typing import List
+
 from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 
+from src.consumer.instrumentation import RPCServersCollector, monitor_event_loop_lag
 from src.consumer.rpc_server import RPCServer
 from src.consumer.settings import settings
 
 
 class Prober:
-    def __init__(self, rpc_server: RPCServer):
+    def __init__(self, rpc_servers: List[RPCServer]):
         self.app = web.Application()
-        self.rpc_server = rpc_server
+        self.rpc_servers = rpc_servers
         self.app.router.add_get("/health", self.handle_health_check)
         self.app.router.add_get("/ready", self.handle_ready_check)
+        self.app.router.add_get("/metrics", self.handle_metrics)
         self.runner = web.AppRunner(self.app)
         self.site = None
+        self.collector = RPCServersCollector(rpc_servers)
+        self._lag_task: asyncio.Task | None = None
 
     async def setup(self):
         await self.runner.setup()
         self.site = web.TCPSite(self.runner, "0.0.0.0", settings.PROBE_PORT)
         await self.site.start()
+        REGISTRY.register(self.collector)
+        self._lag_task = asyncio.create_task(monitor_event_loop_lag())
 
     async def cleanup(self):
+        self._lag_task.cancel()
+        REGISTRY.unregister(self.collector)
         await self.site.stop()
         await self.runner.cleanup()
 
-    async def handle_health_check(self):
+    async def handle_health_check(self, _request: web.Request):
         # Consumer is self-healing, it is unhealthy only if it has crashed
         # It will then stop answering to health checks
         return web.Response(text="OK", status=200)
 
-    async def handle_ready_check(self):
-        # Consumer is ready when it is connected to RabbitMQ
-        if self.rpc_server.check_connection():
+    async def handle_ready_check(self, _request: web.Request):
+        # Consumer is ready when the RPC servers of all its models are connected
+        # to RabbitMQ
+        if all(
+            [await rpc_server.check_connection() for rpc_server in self.rpc_servers]
+        ):
             return web.Response(text="OK", status=200)
         return web.Response(text="NOK", status=503)
+
+    async def handle_metrics(self, _request: web.Request):
+        # content_type of aiohttp responses cannot hold the charset parameter
+        return web.Response(
+            body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST}
+        )
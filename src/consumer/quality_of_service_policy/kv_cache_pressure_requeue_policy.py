@@ -0,0 +1,73 @@
+import logging
+
+from aio_pika.abc import AbstractExchange, AbstractIncomingMessage, AbstractQueue
+
+from src.consumer.quality_of_service_policy.qos_policy import QualityOfServiceBasePolicy
+from src.consumer.quality_of_service_policy.utils import refuse
+from src.consumer.settings import settings
+from src.consumer.strategy.metrics_tracker import MetricsTracker
+from src.consumer.vllm_server import VLLMServer
+
+
+class KvCachePressureRequeuePolicy(QualityOfServiceBasePolicy):
+    """
+    Defers grants to a server whose KV cache usage or preemption rate, as last
+    scraped by the metrics tracker, exceeds its threshold, so that servers are
+    kept just below the point where vllm starts preempting and recomputing.
+    """
+
+    def __init__(
+        self,
+        performance_threshold: float | None,
+        tracker: MetricsTracker,
+        max_kv_cache_usage: float,
+        max_preemptions_per_second: float,
+    ) -> None:
+        super().__init__(performance_threshold)
+        self.tracker = tracker
+        self.max_kv_cache_usage = max_kv_cache_usage
+        self.max_preemptions_per_second = max_preemptions_per_second
+
+    def is_under_pressure(self, server: VLLMServer | None) -> bool:
+        if server is None:
+            return False
+        kv_cache_usage = self.tracker.kv_cache_usage.get(server.url)
+        preemption_rate = self.tracker.preemption_rate.get(server.url)
+        # Missing metrics (server not scraped yet) do not block requests
+        return (
+            kv_cache_usage is not None and kv_cache_usage >= self.max_kv_cache_usage
+        ) or (
+            preemption_rate is not None
+            and preemption_rate > self.max_preemptions_per_second
+        )
+
+    def apply_policy(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        performance_indicator: float | None,
+        current_parallel_requests: int,
+        max_parallel_requests: int,
+        exchange: AbstractExchange,
+        message: AbstractIncomingMessage | None = None,
+        target_requeue: AbstractQueue | None = None,
+        delay: int | None = None,
+        server: VLLMServer | None = None,
+        requeue_on_refusal: bool = True,
+    ) -> bool:
+        if (
+            isinstance(message.priority, int)
+            and message.priority >= settings.BEST_PRIORITY - 1
+        ):
+            return True
+
+        under_pressure = self.is_under_pressure(server)
+        if under_pressure or current_parallel_requests >= max_parallel_requests:
+            if under_pressure:
+                logging.info(
+                    "Server %s under KV cache pressure (usage: %s, preemptions/s: %s); requeuing",
+                    server.url,
+                    self.tracker.kv_cache_usage.get(server.url),
+                    self.tracker.preemption_rate.get(server.url),
+                )
+            return refuse(message, exchange, target_requeue, delay, requeue_on_refusal)
+
+        return True
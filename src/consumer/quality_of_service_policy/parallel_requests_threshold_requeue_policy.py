@@ -1,14 +1,13 @@
-import asyncio
-
 from aio_pika.abc import AbstractExchange, AbstractIncomingMessage, AbstractQueue
 
 from src.consumer.quality_of_service_policy.qos_policy import QualityOfServiceBasePolicy
-from src.consumer.quality_of_service_policy.utils import requeue
+from src.consumer.quality_of_service_policy.utils import refuse
 from src.consumer.settings import settings
+from src.consumer.vllm_server import VLLMServer
 
 
 class ParallelRequestsThresholdRequeuePolicy(QualityOfServiceBasePolicy):
-    def apply_policy(
+    def apply_policy(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
         performance_indicator: float | None,
         current_parallel_requests: int,
@@ -17,6 +16,8 @@ class ParallelRequestsThresholdRequeuePolicy(QualityOfServiceBasePolicy):
         message: AbstractIncomingMessage | None = None,
         target_requeue: AbstractQueue | None = None,
         delay: int | None = None,
+        server: VLLMServer | None = None,
+        requeue_on_refusal: bool = True,
     ) -> bool:
         if (
             isinstance(message.priority, int)
@@ -25,10 +26,6 @@ class ParallelRequestsThresholdRequeuePolicy(QualityOfServiceBasePolicy):
             return True
 
         if current_parallel_requests >= max_parallel_requests:
-            asyncio.create_task(
-                requeue(message, exchange, queue=target_requeue, delay=delay)
-            )
-
-            return False
+            return refuse(message, exchange, target_requeue, delay, requeue_on_refusal)
 
         return True
@@ -1,15 +1,14 @@
-import asyncio
 import logging
 
 from aio_pika.abc import AbstractExchange, AbstractIncomingMessage, AbstractQueue
 
 from src.consumer.quality_of_service_policy.qos_policy import QualityOfServiceBasePolicy
-from src.consumer.quality_of_service_policy.utils import requeue
-from src.consumer.settings import settings
+from src.consumer.quality_of_service_policy.utils import refuse
+from src.consumer.vllm_server import VLLMServer
 
 
 class PerformanceBasedRequeuePolicy(QualityOfServiceBasePolicy):
-    def apply_policy(
+    def apply_policy(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
         performance_indicator: float | None,
         current_parallel_requests: int,
@@ -18,9 +17,14 @@ class PerformanceBasedRequeuePolicy(QualityOfServiceBasePolicy):
         message: AbstractIncomingMessage | None = None,
         target_requeue: AbstractQueue | None = None,
         delay: int | None = None,
+        server: VLLMServer | None = None,
+        requeue_on_refusal: bool = True,
     ) -> bool:
         if isinstance(performance_indicator, (float, int)) and (
-            (performance_indicator > self.performance_threshold)
+            (
+                self.performance_threshold is not None
+                and performance_indicator > self.performance_threshold
+            )
             or (current_parallel_requests >= max_parallel_requests)
         ):
             logging.info(
@@ -28,10 +32,7 @@ class PerformanceBasedRequeuePolicy(QualityOfServiceBasePolicy):
                 performance_indicator,
                 self.performance_threshold,
                 current_parallel_requests,
-                settings.MAX_PARALLEL_REQUESTS,
-            )
-            asyncio.create_task(
-                requeue(message, exchange, queue=target_requeue, delay=delay)
+                max_parallel_requests,
             )
-            return False
+            return refuse(message, exchange, target_requeue, delay, requeue_on_refusal)
         return True
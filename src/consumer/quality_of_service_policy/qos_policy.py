@@ -2,17 +2,24 @@ from abc import ABC, abstractmethod
 
 from aio_pika.abc import AbstractExchange, AbstractIncomingMessage, AbstractQueue
 
+from src.consumer.vllm_server import VLLMServer
+
 
 class QualityOfServiceBasePolicy(ABC):  # pylint: disable=too-few-public-methods
     """
     Abstract base class for qos policies
+
+    current_parallel_requests and max_parallel_requests are expressed in the unit of
+    the capacity accounting in use (requests or estimated tokens), server is the one
+    the message would be granted to. A refused message is requeued, unless
+    requeue_on_refusal is False (the caller then decides what to do with it).
     """
 
     def __init__(self, performance_threshold: float | None) -> None:
         self.performance_threshold = performance_threshold
 
     @abstractmethod
-    def apply_policy(
+    def apply_policy(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
         performance_indicator: float | None,
         current_parallel_requests: int,
@@ -21,5 +28,7 @@ class QualityOfServiceBasePolicy(ABC):  # pylint: disable=too-few-public-methods
         message: AbstractIncomingMessage | None = None,
         target_requeue: AbstractQueue | None = None,
         delay: int | None = None,
+        server: VLLMServer | None = None,
+        requeue_on_refusal: bool = True,
     ) -> bool:
         pass
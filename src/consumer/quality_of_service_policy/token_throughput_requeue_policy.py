@@ -0,0 +1,71 @@
+import logging
+
+from aio_pika.abc import AbstractExchange, AbstractIncomingMessage, AbstractQueue
+
+from src.consumer.quality_of_service_policy.qos_policy import QualityOfServiceBasePolicy
+from src.consumer.quality_of_service_policy.utils import refuse
+from src.consumer.settings import settings
+from src.consumer.strategy.metrics_tracker import MetricsTracker
+from src.consumer.vllm_server import VLLMServer
+
+
+class TokenThroughputRequeuePolicy(QualityOfServiceBasePolicy):
+    """
+    Defers grants to a server when one more running request would bring the decode
+    throughput of each of its users below `min_tokens_per_second`, assuming the
+    tokens generated per second are shared evenly among running requests.
+    """
+
+    def __init__(
+        self,
+        performance_threshold: float | None,
+        tracker: MetricsTracker,
+        min_tokens_per_second: float,
+    ) -> None:
+        super().__init__(performance_threshold)
+        self.tracker = tracker
+        self.min_tokens_per_second = min_tokens_per_second
+
+    def predicted_tokens_per_second(self, server: VLLMServer | None) -> float | None:
+        if server is None:
+            return None
+        generation_tokens_rate = self.tracker.generation_tokens_rate.get(server.url)
+        running = self.tracker.num_requests_running.get(server.url)
+        # An idle server (or one not scraped yet) tells nothing about its throughput
+        if generation_tokens_rate is None or not running:
+            return None
+        return generation_tokens_rate / (running + 1)
+
+    def apply_policy(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        performance_indicator: float | None,
+        current_parallel_requests: int,
+        max_parallel_requests: int,
+        exchange: AbstractExchange,
+        message: AbstractIncomingMessage | None = None,
+        target_requeue: AbstractQueue | None = None,
+        delay: int | None = None,
+        server: VLLMServer | None = None,
+        requeue_on_refusal: bool = True,
+    ) -> bool:
+        if (
+            isinstance(message.priority, int)
+            and message.priority >= settings.BEST_PRIORITY - 1
+        ):
+            return True
+
+        tokens_per_second = self.predicted_tokens_per_second(server)
+        too_slow = (
+            tokens_per_second is not None
+            and tokens_per_second < self.min_tokens_per_second
+        )
+        if too_slow or current_parallel_requests >= max_parallel_requests:
+            if too_slow:
+                logging.info(
+                    "Server %s would only decode %.1f tokens/s per user; requeuing",
+                    server.url,
+                    tokens_per_second,
+                )
+            return refuse(message, exchange, target_requeue, delay, requeue_on_refusal)
+
+        return True
@@ -1,8 +1,47 @@
 import asyncio
+import time
 
 from aio_pika import DeliveryMode, Message
 from aio_pika.abc import AbstractExchange, AbstractIncomingMessage, AbstractQueue
 
+from src.consumer.settings import settings
+
+
+def aged_priority(
+    original_priority: int | None, requeue_count: int, waited_seconds: float
+) -> int | None:
+    """
+    Raise the priority of a requeued message by one level every
+    `PRIORITY_AGING_REQUEUE_STEP` requeues or `PRIORITY_AGING_WAIT_STEP` seconds
+    spent in queue, capped below the `BEST_PRIORITY - 1` bypass of the QoS policies
+    (a message already at or above that cap keeps its priority).
+    """
+    if original_priority is None:
+        return None
+
+    steps = 0
+    if settings.PRIORITY_AGING_REQUEUE_STEP:
+        steps = max(steps, requeue_count // settings.PRIORITY_AGING_REQUEUE_STEP)
+    if settings.PRIORITY_AGING_WAIT_STEP:
+        steps = max(steps, int(waited_seconds // settings.PRIORITY_AGING_WAIT_STEP))
+
+    ceiling = min(settings.BEST_PRIORITY - 2, settings.RPC_MAX_PRIORITY)
+    if original_priority >= ceiling:
+        return original_priority
+    return min(original_priority + steps, ceiling)
+
+
+def first_published_at(msg: AbstractIncomingMessage) -> float | None:
+    """
+    Time (epoch seconds) the sender first published the message, kept by requeues
+    """
+    headers = msg.headers or {}
+    if "x-first-published-at" in headers:
+        return float(headers["x-first-published-at"])
+    if msg.timestamp is not None:
+        return msg.timestamp.timestamp()
+    return None
+
 
 async def requeue(
     msg: AbstractIncomingMessage,
@@ -11,7 +50,7 @@ async def requeue(
     delay: int | None = None,
 ) -> None:
     """
-    Requeue a message with an incremented retry counter.
+    Requeue a message with an incremented retry counter and an aged priority.
 
     - If `queue` is provided, republishes directly there.
     - If no `queue` is provided, republishes to the original exchange/routing key
@@ -19,6 +58,10 @@ async def requeue(
     """
     headers = dict(msg.headers or {})
     headers["x-requeue-count"] = headers.get("x-requeue-count", 0) + 1
+    # Aging is always computed from the priority and time of the first publication
+    headers.setdefault("x-original-priority", msg.priority)
+    if "x-first-published-at" not in headers:
+        headers["x-first-published-at"] = first_published_at(msg) or time.time()
 
     new_msg = Message(
         body=msg.body,
@@ -26,8 +69,13 @@ async def requeue(
         content_type=msg.content_type,
         correlation_id=msg.correlation_id,
         delivery_mode=msg.delivery_mode or DeliveryMode.PERSISTENT,
-        priority=msg.priority,
+        priority=aged_priority(
+            headers["x-original-priority"],
+            headers["x-requeue-count"],
+            time.time() - headers["x-first-published-at"],
+        ),
         reply_to=msg.reply_to,
+        timestamp=msg.timestamp,
     )
 
     await msg.ack()
@@ -41,3 +89,19 @@ async def requeue(
         routing_key = msg.routing_key
 
     await exchange.publish(new_msg, routing_key=routing_key)
+
+
+def refuse(
+    msg: AbstractIncomingMessage,
+    exchange: AbstractExchange,
+    queue: AbstractQueue | None,
+    delay: int | None,
+    requeue_on_refusal: bool,
+) -> bool:
+    """
+    Requeues a message refused by a QoS policy in the background, unless the
+    caller handles it itself, and returns False
+    """
+    if requeue_on_refusal:
+        asyncio.create_task(requeue(msg, exchange, queue=queue, delay=delay))
+    return False
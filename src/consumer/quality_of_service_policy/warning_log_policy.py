@@ -3,11 +3,12 @@ import logging
 from aio_pika.abc import AbstractExchange, AbstractIncomingMessage, AbstractQueue
 
 from src.consumer.quality_of_service_policy.qos_policy import QualityOfServiceBasePolicy
+from src.consumer.vllm_server import VLLMServer
 
 
 class WarningLogPolicy(QualityOfServiceBasePolicy):
 
-    def apply_policy(
+    def apply_policy(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
         performance_indicator: float | None,
         current_parallel_requests: int,
@@ -16,9 +17,14 @@ class WarningLogPolicy(QualityOfServiceBasePolicy):
         message: AbstractIncomingMessage | None = None,
         target_requeue: AbstractQueue | None = None,
         delay: int | None = None,
+        server: VLLMServer | None = None,
+        requeue_on_refusal: bool = True,
     ) -> bool:
         if isinstance(performance_indicator, (float, int)):
-            if performance_indicator > self.performance_threshold:
+            if (
+                self.performance_threshold is not None
+                and performance_indicator > self.performance_threshold
+            ):
                 logging.warning(
                     "Performance indicator exceeds threshold (%s > %s)",
                     performance_indicator,
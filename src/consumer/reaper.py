@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from typing import List
+
+from src.consumer.rpc_server import RPCServer
+
+
+class ExpiryReaper:
+    """
+    Periodically releases the grants of every RPC server whose completion never
+    came (e.g. the sender crashed), so that they do not hold capacity forever.
+    """
+
+    def __init__(
+        self, rpc_servers: List[RPCServer], timeout: float, interval: float = 1
+    ) -> None:
+        self.rpc_servers = rpc_servers
+        self.timeout = timeout
+        self.interval = interval
+        self.monitoring = False
+        self._monitor_task: asyncio.Task | None = None
+
+    async def _reap(self) -> None:
+        while self.monitoring:
+            for rpc_server in self.rpc_servers:
+                try:
+                    rpc_server.expire_requests(self.timeout)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.error(
+                        "Error expiring requests of %s: %s", rpc_server.model, e
+                    )
+            await asyncio.sleep(self.interval)
+
+    async def monitor(self) -> None:
+        if self.monitoring:
+            logging.debug("Expiry reaper is already running.")
+            return
+
+        self.monitoring = True
+        self._monitor_task = asyncio.create_task(self._reap())
+        logging.debug("Started expiry reaper")
+
+    async def stop_monitor(self) -> None:
+        if not self.monitoring:
+            logging.debug("Expiry reaper is not running.")
+            return
+
+        self.monitoring = False
+        self._monitor_task.cancel()
+        await asyncio.gather(self._monitor_task, return_exceptions=True)
+        logging.debug("Expiry reaper stopped.")
@@ -2,6 +2,8 @@ import asyncio
 import json
 import logging
 import random
+import time
+from datetime import datetime, timezone
 from typing import List
 
 from aio_pika import DeliveryMode, Message, connect_robust
@@ -11,97 +13,118 @@ from aio_pika.abc import (
     AbstractIncomingMessage,
     AbstractQueue,
 )
+from pydantic import ValidationError
 from pydantic.json import pydantic_encoder
 
 from src.common.message_data import MessageData
+from src.common.request_data import RequestData
+from src.common.tracing import CONSUMER, TRACEPARENT_HEADER, Span
+from src.consumer.accounting import AccountingReplicator, BaseAccounting
 from src.consumer.exceptions import ServerNotFound, UnknownLocalPriorityModel
+from src.consumer.fair_scheduler import FairScheduler
+from src.consumer.instrumentation import (
+    DEFERRED,
+    DISPATCH_DECISIONS,
+    EXPIRED,
+    GRANTED,
+    NO_SERVER,
+    QUEUE_RESIDENCE,
+    REAPER_EXPIRATIONS,
+    SPILLED_OVER,
+    TRACER,
+)
 from src.consumer.priority_handler import BasePriorityHandler
 from src.consumer.quality_of_service_policy.qos_policy import QualityOfServiceBasePolicy
+from src.consumer.quality_of_service_policy.utils import (
+    first_published_at,
+    requeue,
+)
 from src.consumer.settings import settings
+from src.consumer.strategy.metrics_tracker import MetricsTracker
 from src.consumer.strategy.server_selection_strategy import ServerSelectionStrategy
 from src.consumer.vllm_server import VLLMServer
 
 # === Set constants ===
 
-MODEL = settings.MODEL
+# The in-flight resynchronization after a reconnection waits at most
+# RESYNC_MAX_ATTEMPTS * RESYNC_POLL_INTERVAL seconds for each of its steps
+RESYNC_MAX_ATTEMPTS = 100
+RESYNC_POLL_INTERVAL = 0.1
 
 
-class RPCServer:
-    def __init__(
+class RPCServer:  # pylint: disable=too-many-public-methods
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
         url: str,
+        model: str,
+        servers: List[VLLMServer],
         strategy: ServerSelectionStrategy,
         quality_of_service_policy: QualityOfServiceBasePolicy,
         priority_handler: BasePriorityHandler,
+        accounting: BaseAccounting,
+        scheduler: FairScheduler | None = None,
+        replicator: AccountingReplicator | None = None,
+        tracker: MetricsTracker | None = None,
     ) -> None:
         self.url = url
+        self.model = model
+        self.servers = servers
         self.strategy = strategy
         self.quality_of_service_policy = quality_of_service_policy
         self.priority_handler = priority_handler
+        self.accounting = accounting
+        self.scheduler = scheduler
+        self.replicator = replicator
+        self.tracker = tracker
+        if self.replicator is not None:
+            self.replicator.on_remote_release = self.release
+        self.capacity_released = asyncio.Event()
+        self._dispatch_task: asyncio.Task | None = None
         self.connection: AbstractConnection = None
+        self._owns_connection = True
         self.channel: AbstractChannel = None
         self.queue: AbstractQueue = None
         self.completion_queue: AbstractQueue = None
-        # VLLMServer can be used as dict key because it is a dataclass with frozen and eq set to True
-        # so a hash is used: https://github.com/python/cpython/blob/main/Lib/dataclasses.py#L891
-        self.current_parallel_requests: dict[VLLMServer, set[str]] = {
-            server: set() for server in settings.VLLM_SERVERS
-        }
-
-    async def first_connect(self) -> None:
-        logging.debug("Connecting consumer to RabbitMQ...")
+        self.strategy.saturation_check = self.is_saturated
+        self.strategy.in_flight_count = self.accounting.count
+
+    async def first_connect(self, connection: AbstractConnection | None = None) -> None:
+        """
+        Connects to RabbitMQ, or opens a channel on `connection` when it is shared
+        with the RPC servers of other models (it is then closed by its owner)
+        """
+        logging.debug("Connecting consumer of %s to RabbitMQ...", self.model)
         try:
-            self.connection = await connect_robust(url=self.url)
+            self._owns_connection = connection is None
+            self.connection = connection or await connect_robust(url=self.url)
             self.connection.reconnect_callbacks.add(self.reconnect_callback)
-            self.channel = await self.connection.channel()
-            await self.channel.set_qos(prefetch_count=1)
-            self.queue = await self.channel.declare_queue(
-                name=MODEL,
-                durable=True,
-                arguments={
-                    "x-expires": settings.RPC_QUEUE_EXPIRATION,
-                    "x-message-ttl": settings.RPC_MESSAGE_EXPIRATION,
-                    "x-max-priority": settings.RPC_MAX_PRIORITY,
-                },
-            )
-            await self.queue.consume(
-                self.on_message_callback,
-            )
-            self.completion_queue = await self.channel.declare_queue(
-                name=f"{MODEL}_completed",
-                durable=True,
-                arguments={
-                    "x-expires": settings.RPC_QUEUE_EXPIRATION,
-                },
-            )
-            await self.completion_queue.consume(
-                self.on_completion_callback,
-            )
-            for server in settings.VLLM_SERVERS:
-                server_queue = await self.channel.declare_queue(
-                    name=f"{MODEL}_{server.organization}_private",
-                    durable=True,
-                    arguments={
-                        "x-expires": settings.RPC_QUEUE_EXPIRATION,
-                    },
-                )
-                await server_queue.consume(
-                    self.server_specific_callback,
-                )
-
+            await self.declare_topology(self.connection)
         except Exception as e:
             logging.error("Error connecting to RabbitMQ: %s", e)
             raise
         else:
             logging.info("Consumer connected to RabbitMQ")
 
-    async def reconnect_callback(self, connection: AbstractConnection) -> None:
-        logging.info("Reconnecting to RabbitMQ...")
-        self.connection = connection
+    async def declare_topology(self, connection: AbstractConnection) -> None:
+        """
+        Opens a channel and declares and consumes every queue of the consumer
+        """
         self.channel = await connection.channel()
-        await self.channel.set_qos(prefetch_count=1)
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
+        # Completions are consumed first, so that after a reconnection the ones
+        # that piled up free capacity before new requests are granted
+        self.completion_queue = await self.channel.declare_queue(
+            name=f"{self.model}_completed",
+            durable=True,
+            arguments={
+                "x-expires": settings.RPC_QUEUE_EXPIRATION,
+            },
+        )
+        await self.completion_queue.consume(
+            self.on_completion_callback,
+        )
         self.queue = await self.channel.declare_queue(
-            name=MODEL,
+            name=self.model,
             durable=True,
             arguments={
                 "x-expires": settings.RPC_QUEUE_EXPIRATION,
@@ -112,13 +135,101 @@ class RPCServer:
         await self.queue.consume(
             self.on_message_callback,
         )
+        # Several servers can belong to the same organization, which has only one
+        # private queue: consuming it once per server would duplicate consumers
+        for organization in sorted({server.organization for server in self.servers}):
+            server_queue = await self.channel.declare_queue(
+                name=f"{self.model}_{organization}_private",
+                durable=True,
+                arguments={
+                    "x-expires": settings.RPC_QUEUE_EXPIRATION,
+                },
+            )
+            await server_queue.consume(
+                self.server_specific_callback,
+            )
+        if self.replicator is not None:
+            await self.replicator.setup(self.channel)
+
+    async def reconnect_callback(self, connection: AbstractConnection) -> None:
+        logging.info("Reconnecting to RabbitMQ...")
+        reconnected_at = time.monotonic()
+        self.connection = connection
+        # Consumers of the previous channel would duplicate the new ones
+        if self.channel is not None and not self.channel.is_closed:
+            try:
+                await self.channel.close()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.debug("Could not close previous channel: %s", e)
+        if self.scheduler is not None:
+            # Unacknowledged messages are delivered again by the broker
+            dropped = self.scheduler.clear()
+            if dropped:
+                logging.info("Dropped %s messages held before reconnecting", dropped)
+        await self.declare_topology(connection)
+        asyncio.create_task(self.resync_in_flight(reconnected_at))
         logging.info("Reconnected to RabbitMQ")
 
+    async def resync_in_flight(self, reconnected_at: float) -> None:
+        """
+        Reconciles the grants issued before a reconnection: once the completions
+        that piled up meanwhile are consumed, grants that vllm does not account
+        for anymore (their completion was lost with the broker) are released,
+        oldest first, instead of waiting for their expiry.
+        """
+        try:
+            for _ in range(RESYNC_MAX_ATTEMPTS):
+                completion_queue = await self.channel.declare_queue(
+                    name=f"{self.model}_completed", passive=True
+                )
+                if not completion_queue.declaration_result.message_count:
+                    break
+                await asyncio.sleep(RESYNC_POLL_INTERVAL)
+            drained_at = time.monotonic()
+
+            if self.tracker is None:
+                return
+            for server in self.servers:
+                # Only trust a scrape taken after the backlog was drained
+                for _ in range(RESYNC_MAX_ATTEMPTS):
+                    if self.tracker.scraped_at.get(server.url, 0) > drained_at:
+                        break
+                    await asyncio.sleep(RESYNC_POLL_INTERVAL)
+                else:
+                    continue
+
+                running = self.tracker.num_requests_running.get(server.url)
+                waiting = self.tracker.num_requests_waiting.get(server.url)
+                if running is None or waiting is None:
+                    continue
+                excess = int(self.accounting.count(server) - running - waiting)
+                stale_grants = sorted(
+                    (grant.granted_at, correlation_id)
+                    for correlation_id, grant in self.accounting.in_flight[
+                        server
+                    ].items()
+                    if grant.granted_at < reconnected_at
+                )
+                for _, correlation_id in stale_grants[: max(excess, 0)]:
+                    self.release(server, correlation_id)
+                    logging.info(
+                        "Released request %s granted before reconnecting, unknown to %s",
+                        correlation_id,
+                        server.url,
+                    )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error("Error resynchronizing in-flight requests: %s", e)
+
     async def close(self) -> None:
         logging.debug("Closing RPC connection...")
+        if self.replicator is not None:
+            await self.replicator.close()
         if await self.check_connection():
             try:
-                await self.connection.close()
+                if self._owns_connection:
+                    await self.connection.close()
+                else:
+                    await self.channel.close()
             except Exception as e:
                 logging.error("Could not close RPC connection: %s", e)
             else:
@@ -126,64 +237,233 @@ class RPCServer:
                 self.channel = None
                 logging.info("RPC disconnected")
 
+    def effective_capacity(self, server: VLLMServer) -> float:
+        return self.accounting.effective_capacity(
+            server, self.strategy.slow_start_factor(server.url)
+        )
+
+    def usage(
+        self, server: VLLMServer, request_data: RequestData | None = None
+    ) -> float:
+        return self.accounting.usage(
+            server,
+            request_data.organization if request_data else None,
+            self.strategy.slow_start_factor(server.url),
+        )
+
+    def is_saturated(
+        self, server: VLLMServer, request_data: RequestData | None = None
+    ) -> bool:
+        return self.accounting.is_saturated(
+            server, request_data, self.strategy.slow_start_factor(server.url)
+        )
+
+    def is_held_back(
+        self, server: VLLMServer, request_data: RequestData | None = None
+    ) -> bool:
+        """
+        Whether the capacity of a server with reservations left to the request is
+        used up. Reservations are enforced here whatever the QoS policy, which may
+        admit requests above capacity.
+        """
+        return bool(server.reservations) and self.is_saturated(server, request_data)
+
+    @staticmethod
+    def parse_request_data(message: AbstractIncomingMessage) -> RequestData:
+        try:
+            return RequestData.model_validate_json(message.body)
+        except ValidationError:
+            # Older senders only publish b"AVAILABLE?" on the model queue
+            return RequestData()
+
+    @property
+    def prefetch_count(self) -> int:
+        # The fair scheduler needs to hold several messages to reorder them
+        if self.scheduler is not None:
+            return settings.FAIR_QUEUING_PREFETCH
+        return 1
+
     async def on_message_callback(self, message: AbstractIncomingMessage):
-        logging.debug("Message consumed on queue %s", MODEL)
+        logging.debug("Message consumed on queue %s", self.model)
+
+        request_data = RPCServer.parse_request_data(message)
+        # Demand from an organization reclaims its reservations on every server
+        self.accounting.record_demand(request_data.organization)
+        if self.scheduler is not None:
+            self.scheduler.push(message, request_data)
+            if self._dispatch_task is None or self._dispatch_task.done():
+                self._dispatch_task = asyncio.create_task(self._fair_dispatch())
+            return
 
+        await self.dispatch(message, request_data)
+
+    async def _fair_dispatch(self) -> None:
+        while self.scheduler:
+            # Reservations only lower the capacity left to some organizations: they
+            # are enforced per message by dispatch, once its organization is known
+            if self.strategy.servers and all(
+                self.accounting.load(server) >= self.effective_capacity(server)
+                for server in self.strategy.servers
+            ):
+                # Wait for a request to complete instead of requeuing held messages
+                self.capacity_released.clear()
+                try:
+                    await asyncio.wait_for(
+                        self.capacity_released.wait(),
+                        timeout=settings.METRICS_REFRESH_RATE,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            message, request_data, received_at = self.scheduler.pop()
+            # Age counts from the publication by the sender, time spent in the
+            # broker queue included
+            published_at = first_published_at(message)
+            if published_at is not None:
+                age = time.time() - published_at
+            else:
+                age = time.monotonic() - received_at
+            if age > settings.RPC_MESSAGE_EXPIRATION / 1000:
+                # Same as the queue message TTL: the sender is not waiting anymore
+                logging.info("Dropping expired message %s", message.correlation_id)
+                DISPATCH_DECISIONS.labels(self.model, "", EXPIRED).inc()
+                self.end_span(self.start_span("dispatch", message), EXPIRED)
+                await message.ack()
+                continue
+
+            try:
+                await self.dispatch(message, request_data)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # the scheduler keeps dispatching the other messages
+                logging.error("Error dispatching fairly scheduled message: %s", e)
+
+    def start_span(self, name: str, message: AbstractIncomingMessage) -> Span:
+        return TRACER.start_span(
+            name,
+            parent=message.headers.get(TRACEPARENT_HEADER),
+            kind=CONSUMER,
+            attributes={
+                "model": self.model,
+                "requeue_count": message.headers.get("x-requeue-count", 0),
+            },
+        )
+
+    @staticmethod
+    def end_span(span: Span, decision: str, server: VLLMServer | None = None) -> None:
+        span.set_attribute("decision", decision)
+        if server is not None:
+            span.set_attribute("server", server.url)
+        span.end()
+
+    async def dispatch(
+        self, message: AbstractIncomingMessage, request_data: RequestData
+    ) -> None:
+        span = self.start_span("dispatch", message)
         try:
-            vllm_server, performance_indicator = self.strategy.choose_server()
+            try:
+                vllm_server, performance_indicator = self.strategy.choose_server(
+                    request_data
+                )
+            except ServerNotFound:
+                await self.reply(
+                    message,
+                    MessageData(
+                        strategy=settings.ROUTING_STRATEGY,
+                        requeue_count=message.headers.get("x-requeue-count", 0),
+                        max_parallel_requests=settings.DEFAULT_MAX_PARALLEL_REQUESTS,
+                    ),
+                )
+                logging.info("No server found for model %s", self.model)
+                DISPATCH_DECISIONS.labels(self.model, "", NO_SERVER).inc()
+                self.end_span(span, NO_SERVER)
+                return
+
             priority_to_forward = self.priority_handler.apply_priority(message.priority)
+            if self.is_held_back(vllm_server, request_data):
+                asyncio.create_task(
+                    requeue(
+                        message,
+                        self.channel.default_exchange,
+                        delay=settings.METRICS_REFRESH_RATE,
+                    )
+                )
+                DISPATCH_DECISIONS.labels(self.model, vllm_server.url, DEFERRED).inc()
+                self.end_span(span, DEFERRED, vllm_server)
+                return
             if not self.quality_of_service_policy.apply_policy(
                 performance_indicator,
-                len(self.current_parallel_requests[vllm_server]),
-                vllm_server.max_parallel_requests,
+                self.usage(vllm_server, request_data),
+                self.effective_capacity(vllm_server),
                 self.channel.default_exchange,
                 message,
                 delay=settings.METRICS_REFRESH_RATE,
+                server=vllm_server,
             ):
+                DISPATCH_DECISIONS.labels(self.model, vllm_server.url, DEFERRED).inc()
+                self.end_span(span, DEFERRED, vllm_server)
                 return
-            llm_params = MessageData(
+            await self.grant(
+                message,
+                request_data,
+                vllm_server,
+                performance_indicator,
+                priority_to_forward,
+            )
+            self.end_span(span, GRANTED, vllm_server)
+        except Exception as e:
+            logging.error("An error occurred while publishing message: %s", e)
+            span.set_error(str(e))
+            span.end()
+            raise
+
+    async def reply(
+        self, message: AbstractIncomingMessage, llm_params: MessageData
+    ) -> None:
+        await self.channel.default_exchange.publish(
+            Message(
+                body=json.dumps(llm_params.dict(), default=pydantic_encoder).encode(
+                    "utf-8"
+                ),
+                delivery_mode=DeliveryMode.PERSISTENT,
+                correlation_id=str(message.correlation_id),
+            ),
+            routing_key=message.reply_to,
+        )
+        await message.ack()
+
+    async def grant(
+        self,
+        message: AbstractIncomingMessage,
+        request_data: RequestData,
+        vllm_server: VLLMServer,
+        performance_indicator: float | None,
+        priority_to_forward: int | None,
+    ) -> None:
+        await self.reply(
+            message,
+            MessageData(
                 llm_url=vllm_server.url,
                 llm_token=vllm_server.token,
                 llm_organization=vllm_server.organization,
                 strategy=settings.ROUTING_STRATEGY,
                 requeue_count=message.headers.get("x-requeue-count", 0),
                 max_parallel_requests=vllm_server.max_parallel_requests,
-                current_parallel_requests=len(
-                    self.current_parallel_requests[vllm_server]
-                ),
+                current_parallel_requests=self.accounting.count(vllm_server),
                 forwarded_priority=priority_to_forward,
+                effective_priority=message.priority,
                 performance_score=performance_indicator,
+                granted_at=datetime.now(timezone.utc),
+            ),
+        )
+        # Grants without completion are released by the ExpiryReaper
+        self.accounting.grant(vllm_server, str(message.correlation_id), request_data)
+        DISPATCH_DECISIONS.labels(self.model, vllm_server.url, GRANTED).inc()
+        if message.timestamp is not None:
+            QUEUE_RESIDENCE.labels(self.model).observe(
+                max(time.time() - message.timestamp.timestamp(), 0)
             )
-        except ServerNotFound:
-            vllm_server = None
-            llm_params = MessageData(
-                strategy=settings.ROUTING_STRATEGY,
-                requeue_count=message.headers.get("x-requeue-count", 0),
-                max_parallel_requests=settings.DEFAULT_MAX_PARALLEL_REQUESTS,
-            )
-        try:
-            await self.channel.default_exchange.publish(
-                Message(
-                    body=json.dumps(llm_params.dict(), default=pydantic_encoder).encode(
-                        "utf-8"
-                    ),
-                    delivery_mode=DeliveryMode.PERSISTENT,
-                    correlation_id=str(message.correlation_id),
-                ),
-                routing_key=message.reply_to,
-            )
-            await message.ack()
-            if vllm_server:
-                self.current_parallel_requests[vllm_server].add(
-                    str(message.correlation_id)
-                )
-                asyncio.create_task(
-                    self._expire_request(vllm_server, str(message.correlation_id))
-                )
-            logging.info("LLM URL for model %s sent to API", MODEL)
-        except Exception as e:
-            logging.error("An error occurred while publishing message: %s", e)
-            raise
+        logging.info("LLM URL for model %s sent to API", self.model)
 
     async def on_completion_callback(self, message: AbstractIncomingMessage):
         try:
@@ -196,19 +476,22 @@ class RPCServer:
 
             used_server = None
             server_url = data.get("server")
-            for server in settings.VLLM_SERVERS:
+            for server in self.servers:
                 if server.url == server_url:
                     used_server = server
 
             if used_server is not None:
-                self.current_parallel_requests[used_server].discard(
-                    str(data.get("message_id"))
+                released = self.release(used_server, str(data.get("message_id")))
+                if not released and self.replicator is not None:
+                    # The request may have been granted by another replica
+                    self.replicator.publish_release(
+                        used_server, str(data.get("message_id"))
+                    )
+                logging.debug(
+                    "number of current parallel requests for server %s = %s",
+                    used_server,
+                    self.accounting.count(used_server),
                 )
-            logging.debug(
-                "number of current parallel requests for server %s = %s",
-                used_server,
-                len(self.current_parallel_requests[used_server]),
-            )
             await message.ack()
         except Exception as e:
             logging.error("Error processing completion message: %s", e)
@@ -231,70 +514,102 @@ class RPCServer:
         )
 
     async def server_specific_callback(self, message: AbstractIncomingMessage):
+        span = self.start_span("dispatch_private", message)
         try:
-            data = json.loads(message.body.decode("utf-8"))
-            routing_mode = data.get("routing_mode")
-            organization = data.get("organization")
+            request_data = RPCServer.parse_request_data(message)
+            routing_mode = request_data.routing_mode
+            organization = request_data.organization
+            self.accounting.record_demand(organization)
             priority_to_forward = self.priority_handler.apply_priority(message.priority)
 
             matching_servers = [
-                server
-                for server in settings.VLLM_SERVERS
-                if server.organization == organization
+                server for server in self.servers if server.organization == organization
             ]
-            target_server, score = self.choose_among_duplicates(matching_servers)
+            target_server, score = self.choose_among_duplicates(
+                self.strategy.candidate_servers(request_data, matching_servers)
+            )
 
             target_requeue = None
             if routing_mode == "private-first":
                 target_requeue = self.queue
+                if self.is_saturated(target_server, request_data):
+                    # Spill over to public servers right away rather than waiting
+                    # and requeuing at the back of the model queue
+                    try:
+                        public_server, public_score = self.strategy.choose_server(
+                            request_data
+                        )
+                    except ServerNotFound:
+                        public_server = None
+                    # The public server goes through the QoS policy too, a refusal
+                    # falls back on the private server
+                    if (
+                        public_server is not None
+                        and not self.is_saturated(public_server, request_data)
+                        and self.quality_of_service_policy.apply_policy(
+                            public_score,
+                            self.usage(public_server, request_data),
+                            self.effective_capacity(public_server),
+                            self.channel.default_exchange,
+                            message,
+                            server=public_server,
+                            requeue_on_refusal=False,
+                        )
+                    ):
+                        logging.debug(
+                            "Private servers of %s are busy, spilling over to %s",
+                            organization,
+                            public_server.url,
+                        )
+                        DISPATCH_DECISIONS.labels(
+                            self.model, public_server.url, SPILLED_OVER
+                        ).inc()
+                        await self.grant(
+                            message,
+                            request_data,
+                            public_server,
+                            public_score,
+                            priority_to_forward,
+                        )
+                        self.end_span(span, SPILLED_OVER, public_server)
+                        return
             elif routing_mode != "private-only":
                 raise UnknownLocalPriorityModel(routing_mode)
 
+            if self.is_held_back(target_server, request_data):
+                asyncio.create_task(
+                    requeue(
+                        message,
+                        self.channel.default_exchange,
+                        queue=target_requeue,
+                        delay=settings.METRICS_REFRESH_RATE,
+                    )
+                )
+                DISPATCH_DECISIONS.labels(self.model, target_server.url, DEFERRED).inc()
+                self.end_span(span, DEFERRED, target_server)
+                return
             if not self.quality_of_service_policy.apply_policy(
                 score,
-                len(self.current_parallel_requests[target_server]),
-                target_server.max_parallel_requests,
+                self.usage(target_server, request_data),
+                self.effective_capacity(target_server),
                 self.channel.default_exchange,
                 message,
                 target_requeue,
                 settings.METRICS_REFRESH_RATE,
+                server=target_server,
             ):
+                DISPATCH_DECISIONS.labels(self.model, target_server.url, DEFERRED).inc()
+                self.end_span(span, DEFERRED, target_server)
                 return
 
-            llm_params = MessageData(
-                llm_url=target_server.url,
-                llm_token=target_server.token,
-                llm_organization=target_server.organization,
-                strategy=settings.ROUTING_STRATEGY,
-                requeue_count=message.headers.get("x-requeue-count", 0),
-                max_parallel_requests=target_server.max_parallel_requests,
-                current_parallel_requests=len(
-                    self.current_parallel_requests[target_server]
-                ),
-                forwarded_priority=priority_to_forward,
-                performance_score=score,
+            await self.grant(
+                message, request_data, target_server, score, priority_to_forward
             )
-
-            await self.channel.default_exchange.publish(
-                Message(
-                    body=json.dumps(llm_params.dict(), default=pydantic_encoder).encode(
-                        "utf-8"
-                    ),
-                    delivery_mode=DeliveryMode.PERSISTENT,
-                    correlation_id=str(message.correlation_id),
-                ),
-                routing_key=message.reply_to,
-            )
-            await message.ack()
-            self.current_parallel_requests[target_server].add(
-                str(message.correlation_id)
-            )
-            asyncio.create_task(
-                self._expire_request(target_server, str(message.correlation_id))
-            )
-            logging.info("LLM URL for model %s sent to API", MODEL)
+            self.end_span(span, GRANTED, target_server)
         except Exception as e:
             logging.error("Error processing server specific message: %s", e)
+            span.set_error(str(e))
+            span.end()
 
     async def check_connection(self) -> bool:
         if self.connection and self.channel:
@@ -302,12 +617,28 @@ class RPCServer:
                 return True
         return False
 
-    async def _expire_request(self, vllm_server, correlation_id: str):
-        await asyncio.sleep(settings.VLLM_TREATMENT_TIMEOUT_SECONDS)
-        if correlation_id in self.current_parallel_requests[vllm_server]:
-            logging.info(
-                "Force removing request %s from counter; no response for %ss",
-                correlation_id,
-                settings.VLLM_TREATMENT_TIMEOUT_SECONDS,
-            )
-        self.current_parallel_requests[vllm_server].discard(correlation_id)
+    def release(self, vllm_server: VLLMServer, correlation_id: str) -> bool:
+        released = self.accounting.release(vllm_server, correlation_id)
+        if released:
+            self.capacity_released.set()
+        return released
+
+    def expire_requests(self, timeout: float) -> None:
+        """
+        Releases the grants that have not been completed for `timeout` seconds
+        """
+        deadline = time.monotonic() - timeout
+        for vllm_server, grants in self.accounting.in_flight.items():
+            expired = [
+                correlation_id
+                for correlation_id, grant in grants.items()
+                if grant.granted_at < deadline
+            ]
+            for correlation_id in expired:
+                if self.release(vllm_server, correlation_id):
+                    REAPER_EXPIRATIONS.labels(self.model, vllm_server.url).inc()
+                    logging.info(
+                        "Force removing request %s from counter; no response for %ss",
+                        correlation_id,
+                        timeout,
+                    )
@@ -8,7 +8,9 @@ from pydantic_settings import BaseSettings
 
 from src.consumer.constants import (
     IGNORE_PRIORITY_HANDLER,
+    REQUESTS_ACCOUNTING,
     WARNING_LOG_QOS,
+    AllowedCapacityAccountings,
     AllowedPriorityHandlers,
     AllowedQualityOfServicePolicies,
     AllowedRoutingStrategies,
@@ -18,7 +20,7 @@ from src.consumer.vllm_server import VLLMServer
 
 class Settings(BaseSettings):
     LOG_LEVEL: int = Field(default=logging.INFO)
-    MODEL: str = Field(default=None)
+    MODEL: Optional[str] = Field(default=None)
     RABBITMQ_HOST: str = Field(default="rabbitmq")
     RABBITMQ_PASSWORD: str = Field(default="guest")
     RABBITMQ_USER: str = Field(default="guest")
@@ -28,22 +30,73 @@ class Settings(BaseSettings):
     RPC_MAX_PRIORITY: int = Field(ge=1, default=5)
     USE_PROBES: int = Field(default=0)
     PROBE_PORT: int = Field(default=8081)
-    DEFAULT_VLLM_SERVERS: str = Field(default=None, alias="VLLM_SERVERS")
+    DEFAULT_VLLM_SERVERS: Optional[str] = Field(default=None, alias="VLLM_SERVERS")
+    # JSON mapping each model to its VLLM_SERVERS, to serve several models from
+    # one consumer process (MODEL and VLLM_SERVERS are then ignored)
+    DEFAULT_MODELS: Optional[str] = Field(default=None, alias="MODELS")
     MAX_VLLM_CONNECTION_ATTEMPTS: int = Field(default=100)
     INITIAL_METRICS_WAIT: int = Field(default=5)
     ROUTING_STRATEGY: AllowedRoutingStrategies = Field(default=None)
     PRIORITY_HANDLER: AllowedPriorityHandlers = Field(default=IGNORE_PRIORITY_HANDLER)
     BEST_PRIORITY: int = Field(default=5)
+    # Requeued messages gain one priority level every PRIORITY_AGING_REQUEUE_STEP
+    # requeues or PRIORITY_AGING_WAIT_STEP seconds spent in queue (0 disables),
+    # without ever reaching the BEST_PRIORITY - 1 bypass
+    PRIORITY_AGING_REQUEUE_STEP: int = Field(ge=0, default=0)
+    PRIORITY_AGING_WAIT_STEP: int = Field(ge=0, default=0)  # in seconds
     TIME_TO_FIRST_TOKEN_THRESHOLD: Optional[float] = None
     METRICS_REFRESH_RATE: int = Field(ge=1, default=1)  # in seconds
     REFRESH_COUNT_PER_WINDOW: int = Field(ge=1, default=24)
     # A time window would then be of duration METRICS_REFRESH_RATE * REFRESH_COUNT_PER_WINDOW
+    # for busy servers (longer for idle servers, which are scraped less often)
+    # Idle servers are scraped less and less often, up to METRICS_MAX_REFRESH_RATE,
+    # and unreachable ones every PING_REFRESH_RATE
+    METRICS_MAX_REFRESH_RATE: int = Field(ge=1, default=8)  # in seconds
+    METRICS_SCRAPE_TIMEOUT: float = Field(gt=0, default=5)  # in seconds
+    METRICS_SCRAPE_JITTER: float = Field(ge=0, lt=1, default=0.1)
     PING_REFRESH_RATE: int = Field(ge=1, default=30)  # in seconds
+    SLOW_START_DURATION: int = Field(ge=0, default=0)  # in seconds, 0 disables it
+    SLOW_START_MIN_FRACTION: float = Field(gt=0, le=1, default=0.1)
+    # A server (re)joining the healthy set starts at SLOW_START_MIN_FRACTION of its
+    # capacity and linearly ramps up to full capacity over SLOW_START_DURATION
+    PREFIX_AFFINITY_TABLE_SIZE: int = Field(ge=1, default=10_000)
+    PREFIX_AFFINITY_VIRTUAL_NODES: int = Field(ge=1, default=100)
+    # Used by queue-depth strategy only: a server's score is the weighted sum of the
+    # requests vllm runs and queues and of the requests in flight from this consumer,
+    # divided by its max_parallel_requests
+    QUEUE_DEPTH_RUNNING_WEIGHT: float = Field(ge=0, default=1.0)
+    QUEUE_DEPTH_WAITING_WEIGHT: float = Field(ge=0, default=2.0)
+    QUEUE_DEPTH_IN_FLIGHT_WEIGHT: float = Field(ge=0, default=0.5)
+    # Score above which the QoS policies consider a server too busy
+    QUEUE_DEPTH_THRESHOLD: float = Field(gt=0, default=2.0)
     QUALITY_OF_SERVICE_POLICY: AllowedQualityOfServicePolicies = Field(
         default=WARNING_LOG_QOS
     )
+    # Used by kv-cache-pressure-requeue policy only
+    MAX_KV_CACHE_USAGE: float = Field(gt=0, le=1, default=0.9)
+    MAX_PREEMPTIONS_PER_SECOND: float = Field(ge=0, default=0.0)
+    # Used by token-throughput-requeue policy only
+    MIN_TOKENS_PER_SECOND_PER_USER: float = Field(ge=0, default=10.0)
     DEFAULT_MAX_PARALLEL_REQUESTS: int = Field(default=100)
+    CAPACITY_ACCOUNTING: AllowedCapacityAccountings = Field(default=REQUESTS_ACCOUNTING)
+    RESERVATION_IDLE_SECONDS: int = Field(ge=0, default=30)
+    # Used by tokens accounting only
+    DEFAULT_MAX_OUTSTANDING_TOKENS: int = Field(ge=1, default=500_000)
+    DEFAULT_MAX_TOKENS_ESTIMATE: int = Field(ge=0, default=512)
+    PREFILL_COST_WEIGHT: float = Field(ge=0, default=1.0)
+    # Share grants with the other consumer replicas of the model, so that they all
+    # admit requests against the load of the whole fleet
+    SHARED_ACCOUNTING: int = Field(default=0)
+    ACCOUNTING_SNAPSHOT_INTERVAL: int = Field(ge=1, default=5)  # in seconds
     VLLM_TREATMENT_TIMEOUT_SECONDS: int = Field(default=15)
+    USE_FAIR_QUEUING: int = Field(default=0)
+    # Number of messages of the model queue held by the fair scheduler
+    FAIR_QUEUING_PREFETCH: int = Field(ge=1, default=100)
+    FAIR_QUEUING_QUANTUM: float = Field(gt=0, default=1.0)
+    TRACING_EXPORTER: Literal["none", "stdout", "file"] = Field(default="none")
+    TRACING_FILE: str = Field(default="traces.jsonl")  # with the file exporter
+    # Share of the traces started here that are exported, others follow the sender
+    TRACING_SAMPLE_RATIO: float = Field(ge=0, le=1, default=0.01)
 
     @property
     def VLLM_SERVERS(self) -> List[VLLMServer]:
@@ -55,6 +108,33 @@ class Settings(BaseSettings):
         except json.JSONDecodeError as e:
             raise ValueError("Invalid JSON format for VLLM_SERVERS") from e
 
+        return self.parse_vllm_servers(raw_servers)
+
+    @property
+    def MODEL_SERVERS(  # pylint: disable=invalid-name
+        self,
+    ) -> dict[str, List[VLLMServer]]:
+        """
+        Servers of each model served by the consumer
+        """
+        if not self.DEFAULT_MODELS:
+            if not self.MODEL:
+                raise ValueError("MODEL or MODELS env variable is required")
+            return {self.MODEL: self.VLLM_SERVERS}
+
+        try:
+            raw_models = json.loads(self.DEFAULT_MODELS)
+        except json.JSONDecodeError as e:
+            raise ValueError("Invalid JSON format for MODELS") from e
+
+        if not isinstance(raw_models, dict) or not raw_models:
+            raise ValueError("MODELS must map at least one model to its servers")
+        return {
+            model: self.parse_vllm_servers(raw_servers)
+            for model, raw_servers in raw_models.items()
+        }
+
+    def parse_vllm_servers(self, raw_servers: dict) -> List[VLLMServer]:
         servers = []
         for url, config in raw_servers.items():
             if not isinstance(config, dict):
@@ -74,14 +154,33 @@ class Settings(BaseSettings):
                     f"No organization found in LLM server {url} configuration"
                 )
 
+            reservations = config.get("reservations", {})
+            if not isinstance(reservations, dict) or not all(
+                isinstance(share, int) and share >= 0 for share in reservations.values()
+            ):
+                raise ValueError(
+                    f"Reservations of LLM server {url} must map organizations "
+                    "to a number of requests"
+                )
+            max_parallel_requests = config.get(
+                "max_parallel_requests", self.DEFAULT_MAX_PARALLEL_REQUESTS
+            )
+            if sum(reservations.values()) > max_parallel_requests:
+                raise ValueError(
+                    f"Reservations of LLM server {url} exceed its max_parallel_requests"
+                )
+
             servers.append(
                 VLLMServer(
                     url=url,
                     token=config.get("token"),
                     organization=organization,
-                    max_parallel_requests=config.get(
-                        "max_parallel_requests", self.DEFAULT_MAX_PARALLEL_REQUESTS
+                    max_parallel_requests=max_parallel_requests,
+                    max_outstanding_tokens=config.get(
+                        "max_outstanding_tokens", self.DEFAULT_MAX_OUTSTANDING_TOKENS
                     ),
+                    max_context_length=config.get("max_context_length"),
+                    reservations=tuple(reservations.items()),
                 )
             )
         return servers
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import random
-from typing import List
 
+from src.common.request_data import RequestData
 from src.consumer.exceptions import PercentileComputationError, ServerNotFound
 from src.consumer.strategy.metrics_based_strategy import MetricsBasedStrategy
 from src.consumer.strategy.metrics_tracker import MetricsTracker
@@ -17,20 +17,6 @@ class LeastBusy(MetricsBasedStrategy):
     def tracker(self) -> MetricsTracker:
         return self._tracker
 
-    # This allows to setup the async monitoring task at instanciation time
-    @classmethod
-    async def create(
-        cls,
-        servers: List[VLLMServer],
-        refresh_rate: int,
-        refresh_count_per_window: int,
-    ) -> LeastBusy:
-        tracker = MetricsTracker(
-            [s.url for s in servers], refresh_rate, refresh_count_per_window
-        )
-        await tracker.monitor()
-        return cls(servers, tracker)
-
     @staticmethod
     def get_percentile(
         histogram: dict, percentile: float = 0.95
@@ -88,22 +74,51 @@ class LeastBusy(MetricsBasedStrategy):
         candidates = [k for k, v in scores.items() if v == min_value]
         return random.choice(candidates), min_value
 
-    def choose_server(self) -> tuple[VLLMServer, float | None]:
+    def choose_server(
+        self, request_data: RequestData | None = None
+    ) -> tuple[VLLMServer, float | None]:
         scores = {}
+        weighted_scores = {}
         url_least_busy = None
         current_time_to_first_token = None
 
+        candidate_urls = {server.url for server in self.candidate_servers(request_data)}
+        saturated_urls = {
+            server.url
+            for server in self.servers
+            if self.is_saturated(server, request_data)
+        }
+
         for url in self.tracker.urls:
+            if url not in candidate_urls:
+                continue
+
             scores[url] = self.get_server_score(url)
 
+            # saturated servers are only chosen as a last resort
+            if url in saturated_urls:
+                continue
+
             # edge case: when a server has never received any request,
             # histograms are not exposed and so business score is -1
             # but then it needs a request for us to start effectively monitoring, so we prioritize it
+            # (unless it is still warming up, in which case it only gets its share of the ramp)
             if scores[url] == -1:
-                url_least_busy = url
-
-        if scores and not url_least_busy:
-            url_least_busy, current_time_to_first_token = LeastBusy.least_busy(scores)
+                if self.admit_warming_server(url):
+                    url_least_busy = url
+                continue
+
+            # warming up servers look busier than they are, proportionally to their ramp
+            weighted_scores[url] = scores[url] / self.slow_start_factor(url)
+
+        if not url_least_busy:
+            if weighted_scores:
+                url_least_busy, _ = LeastBusy.least_busy(weighted_scores)
+                current_time_to_first_token = scores[url_least_busy]
+            elif scores:
+                # only saturated or warming up servers: pick one anyway
+                url_least_busy = random.choice(list(scores.keys()))
+                current_time_to_first_token = scores[url_least_busy]
 
         for server in self.servers:
             if server.url == url_least_busy:
@@ -1,25 +1,57 @@
 import asyncio
 import logging
-from typing import List
+import random
+import re
+import time
+from typing import Awaitable, Callable, Iterable, List
 
 import aiohttp
 
+from src.consumer.instrumentation import SCRAPE_DURATION, SCRAPE_FAILURES
 from src.consumer.strategy.histogram import Histogram
+from src.consumer.vllm_server import VLLMServer
 
 
 class MetricsTracker:
     # We can imagine different strategies based on different metrics
     # In this case, these patterns would be passed in the constructor
     time_to_first_token_pattern = r"^vllm:time_to_first_token_seconds_bucket.*$"
+    # Metric names changed across vLLM versions, the first one found is used
+    kv_cache_usage_metrics = ("vllm:gpu_cache_usage_perc", "vllm:kv_cache_usage_perc")
+    num_requests_running_metrics = ("vllm:num_requests_running",)
+    num_requests_waiting_metrics = ("vllm:num_requests_waiting",)
+    num_preemptions_metrics = ("vllm:num_preemptions_total",)
+    generation_tokens_metrics = ("vllm:generation_tokens_total",)
 
-    def __init__(
-        self, urls: List[str], refresh_rate: int, refresh_count_per_window: int
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        servers: List[VLLMServer],
+        refresh_rate: int,
+        refresh_count_per_window: int,
+        max_refresh_rate: float | None = None,
+        unhealthy_refresh_rate: float | None = None,
+        timeout: float = 5,
+        jitter: float = 0,
     ) -> None:
-        self.urls = urls
-        # The whole monitoring process only cares about urls, not complete server object,
+        self.servers = servers
+        # Metrics are stored by url rather than by server object,
         # which are less handy to use as dictionnary keys (i.e to hash)
+        self.urls = [server.url for server in servers]
+        # Busy servers are scraped every refresh_rate seconds, idle ones back off
+        # up to max_refresh_rate and unreachable ones are retried every
+        # unhealthy_refresh_rate seconds
         self.refresh_rate = refresh_rate
+        self.max_refresh_rate = max_refresh_rate or refresh_rate
+        self.unhealthy_refresh_rate = unhealthy_refresh_rate or refresh_rate
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.jitter = jitter
         self.refresh_count_per_window = refresh_count_per_window
+        self.intervals: dict[str, float] = {url: refresh_rate for url in self.urls}
+        # Servers are assumed healthy until a scrape fails, like at startup
+        self.healthy: dict[str, bool] = {url: True for url in self.urls}
+        self.on_health_change: Callable[[List[VLLMServer]], Awaitable[None]] | None = (
+            None
+        )
         self.window_indexes: dict[str, int] = {url: 0 for url in self.urls}
         self.time_to_first_token_last_histograms: dict[str, List[Histogram]] = {
             url: [Histogram() for _ in range(refresh_count_per_window)]
@@ -28,12 +60,34 @@ class MetricsTracker:
         self.time_to_first_token_diff_histograms: dict[str, Histogram] = {
             url: Histogram() for url in self.urls
         }
+        # Latest gauges values, None until the first successful scrape
+        self.kv_cache_usage: dict[str, float | None] = {url: None for url in self.urls}
+        self.num_requests_running: dict[str, float | None] = {
+            url: None for url in self.urls
+        }
+        self.num_requests_waiting: dict[str, float | None] = {
+            url: None for url in self.urls
+        }
+        # Counters rates (per second) between the last two scrapes
+        self.preemption_rate: dict[str, float | None] = {url: None for url in self.urls}
+        self.generation_tokens_rate: dict[str, float | None] = {
+            url: None for url in self.urls
+        }
+        self._last_counters: dict[tuple[str, str], tuple[float, float]] = {}
+        # Monotonic time of the last successful scrape
+        self.scraped_at: dict[str, float] = {}
         self.monitoring = False
         self._monitor_tasks = []
 
-    @staticmethod
-    async def fetch_metrics(session: aiohttp.ClientSession, url: str) -> str:
-        async with session.get(f"{url}/metrics") as response:
+    async def fetch_metrics(
+        self, session: aiohttp.ClientSession, server: VLLMServer
+    ) -> str:
+        headers = {}
+        if server.token:
+            headers["Authorization"] = f"Bearer {server.token}"
+        async with session.get(
+            f"{server.url}/metrics", headers=headers, timeout=self.timeout
+        ) as response:
             response.raise_for_status()
             return await response.text()
 
@@ -50,14 +104,119 @@ class MetricsTracker:
         last_histogram.update(new_histogram)
         diff_histogram.update(new_diff_histogram)
 
-    def update_urls(self, urls: List[str]) -> None:
-        self.urls = urls
+    @staticmethod
+    def parse_sample(
+        content: str,
+        metric_names: Iterable[str],
+        aggregate: Callable[[List[float]], float] = sum,
+    ) -> float | None:
+        """
+        Value of the first metric of `metric_names` exposed in `content`,
+        aggregated across its label sets (e.g. one per served model name)
+        """
+        for metric_name in metric_names:
+            values = [
+                float(value)
+                for value in re.findall(
+                    rf"^{re.escape(metric_name)}(?:{{[^}}]*}})? (\S+)",
+                    content,
+                    re.MULTILINE,
+                )
+            ]
+            if values:
+                return aggregate(values)
+        return None
+
+    def update_gauges(self, url: str, content: str) -> None:
+        self.scraped_at[url] = time.monotonic()
+        self.kv_cache_usage[url] = MetricsTracker.parse_sample(
+            content, MetricsTracker.kv_cache_usage_metrics, max
+        )
+        self.num_requests_running[url] = MetricsTracker.parse_sample(
+            content, MetricsTracker.num_requests_running_metrics
+        )
+        self.num_requests_waiting[url] = MetricsTracker.parse_sample(
+            content, MetricsTracker.num_requests_waiting_metrics
+        )
+        self.preemption_rate[url] = self.counter_rate(
+            url, content, MetricsTracker.num_preemptions_metrics
+        )
+        self.generation_tokens_rate[url] = self.counter_rate(
+            url, content, MetricsTracker.generation_tokens_metrics
+        )
+
+    def counter_rate(
+        self, url: str, content: str, metric_names: tuple[str, ...]
+    ) -> float | None:
+        """
+        Increase per second of a counter since the previous scrape of the server,
+        None if the counter is not exposed or was never scraped before
+        """
+        value = MetricsTracker.parse_sample(content, metric_names)
+        if value is None:
+            return None
+        now = time.monotonic()
+        last = self._last_counters.get((url, metric_names[0]))
+        self._last_counters[(url, metric_names[0])] = (now, value)
+        if last is None:
+            return None
+        last_time, last_value = last
+        # a negative difference means vllm restarted and its counter was reset
+        return max(value - last_value, 0) / max(now - last_time, 1e-3)
+
+    def healthy_servers(self) -> List[VLLMServer]:
+        return [server for server in self.servers if self.healthy[server.url]]
+
+    async def set_health(self, url: str, healthy: bool) -> None:
+        if self.healthy[url] == healthy:
+            return
+        self.healthy[url] = healthy
+        if not healthy:
+            # Do not let strategies and policies use the scores of a dead server
+            self.kv_cache_usage[url] = None
+            self.num_requests_running[url] = None
+            self.num_requests_waiting[url] = None
+            self.preemption_rate[url] = None
+            self.generation_tokens_rate[url] = None
+
+        healthy_servers = self.healthy_servers()
+        logging.info(
+            "Server %s is %s: %d OK servers",
+            url,
+            "healthy" if healthy else "unreachable",
+            len(healthy_servers),
+        )
+        if not healthy_servers:
+            logging.critical(
+                "NO HEALTHY SERVERS FOUND: user requests will not be dispatched !"
+            )
+        if self.on_health_change is not None:
+            await self.on_health_change(healthy_servers)
+
+    def next_interval(self, url: str) -> float:
+        """
+        Scrape interval of a server: reset to refresh_rate as soon as it runs or
+        queues requests, doubled at each scrape while it is idle (up to
+        max_refresh_rate), and unhealthy_refresh_rate while it is unreachable.
+        """
+        if not self.healthy[url]:
+            interval = self.unhealthy_refresh_rate
+        elif self.num_requests_running[url] or self.num_requests_waiting[url]:
+            interval = self.refresh_rate
+        else:
+            interval = min(self.intervals[url] * 2, self.max_refresh_rate)
+        self.intervals[url] = interval
+        # Jitter spreads the scrapes of the servers (and of consumer replicas)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
 
     async def update_all_metrics_for_server(
-        self, session: aiohttp.ClientSession, url: str, window_index: int
+        self, session: aiohttp.ClientSession, server: VLLMServer, window_index: int
     ) -> None:
         """Fetch metrics once and update histograms for different patterns."""
-        content = await MetricsTracker.fetch_metrics(session, url)
+        url = server.url
+        start = time.perf_counter()
+        content = await self.fetch_metrics(session, server)
+        SCRAPE_DURATION.labels(url).observe(time.perf_counter() - start)
         if not content:
             return
 
@@ -69,13 +228,15 @@ class MetricsTracker:
             self.time_to_first_token_last_histograms[url][window_index],
             self.time_to_first_token_diff_histograms[url],
         )
+        self.update_gauges(url, content)
 
-    async def _monitor_server(self, url: str) -> None:
+    async def _monitor_server(self, server: VLLMServer) -> None:
+        url = server.url
         async with aiohttp.ClientSession() as session:
             while self.monitoring:
                 try:
                     await self.update_all_metrics_for_server(
-                        session, url, self.window_indexes[url]
+                        session, server, self.window_indexes[url]
                     )
                     logging.debug("Metrics updated for %s", url)
                     logging.debug(
@@ -85,15 +246,19 @@ class MetricsTracker:
                     self.window_indexes[url] = (
                         self.window_indexes[url] + 1
                     ) % self.refresh_count_per_window
-                    await asyncio.sleep(self.refresh_rate)
+                    await self.set_health(url, True)
                 except asyncio.CancelledError:
                     logging.debug("Monitoring task cancelled for %s", url)
                     break
                 # Since we only wait for one server to start consuming (cf metrics.py),
-                # it is possible that some servers are not (yet) reachable,
-                # which leads to aiohttp.ClientConnectorError
-                except aiohttp.ClientConnectorError:
-                    continue
+                # it is possible that some servers are not (yet) reachable
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.debug("Could not scrape metrics of %s: %r", url, e)
+                    SCRAPE_FAILURES.labels(url).inc()
+                    await self.set_health(url, False)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.error("Error while updating metrics of %s: %s", url, e)
+                await asyncio.sleep(self.next_interval(url))
 
     async def monitor(self) -> None:
         if self.monitoring:
@@ -102,7 +267,7 @@ class MetricsTracker:
 
         self.monitoring = True
         self._monitor_tasks = [
-            asyncio.create_task(self._monitor_server(url)) for url in self.urls
+            asyncio.create_task(self._monitor_server(server)) for server in self.servers
         ]
         logging.debug("Started monitoring for %s servers", len(self.urls))
 
@@ -0,0 +1,118 @@
+import bisect
+import hashlib
+import random
+from collections import OrderedDict
+from typing import List
+
+from src.common.request_data import RequestData
+from src.consumer.exceptions import ServerNotFound
+from src.consumer.strategy.server_selection_strategy import ServerSelectionStrategy
+from src.consumer.vllm_server import VLLMServer
+
+
+class PrefixAffinity(ServerSelectionStrategy):  # pylint: disable=too-few-public-methods
+    """
+    Routes requests sharing a prompt prefix to the server which last served it,
+    so that vLLM's automatic prefix caching can be reused.
+    Unknown prefixes are placed with consistent hashing, and requests spill over
+    to the next server of the ring when the preferred one is saturated.
+    """
+
+    def __init__(
+        self,
+        servers: List[VLLMServer],
+        table_size: int,
+        virtual_nodes: int,
+    ) -> None:
+        super().__init__(servers)
+        self.table_size = table_size
+        self.virtual_nodes = virtual_nodes
+        # prefix hash -> url of the server which last served it, in LRU order
+        self.affinity_table: OrderedDict[str, str] = OrderedDict()
+        self.ring: List[tuple[int, VLLMServer]] = []
+        self.ring_server_count = 0
+        self._build_ring()
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(
+            hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+
+    def _build_ring(self) -> None:
+        self.ring = sorted(
+            (
+                (PrefixAffinity._hash(f"{server.url}#{i}"), server)
+                for server in self.servers
+                for i in range(self.virtual_nodes)
+            ),
+            key=lambda node: node[0],
+        )
+        self.ring_server_count = len({server for _, server in self.ring})
+
+    async def update_servers(self, servers: List[VLLMServer]) -> None:
+        await super().update_servers(servers)
+        self._build_ring()
+
+    def ring_walk(self, prefix_hash: str) -> List[VLLMServer]:
+        """
+        Distinct servers in the order they appear on the ring, starting from the
+        position of the prefix hash
+        """
+        start = bisect.bisect(
+            self.ring, PrefixAffinity._hash(prefix_hash), key=lambda node: node[0]
+        )
+        walk = []
+        seen = set()
+        for i in range(len(self.ring)):
+            server = self.ring[(start + i) % len(self.ring)][1]
+            if server not in seen:
+                seen.add(server)
+                walk.append(server)
+                if len(walk) == self.ring_server_count:
+                    break
+        return walk
+
+    def remember(self, prefix_hash: str, server: VLLMServer) -> None:
+        self.affinity_table[prefix_hash] = server.url
+        self.affinity_table.move_to_end(prefix_hash)
+        while len(self.affinity_table) > self.table_size:
+            self.affinity_table.popitem(last=False)
+
+    def choose_server(
+        self, request_data: RequestData | None = None
+    ) -> tuple[VLLMServer, None]:
+        eligible_servers = self.candidate_servers(request_data)
+        if not eligible_servers:
+            raise ServerNotFound()
+
+        prefix_hash = request_data.prefix_hash if request_data else None
+        if not prefix_hash:
+            candidates = [
+                server
+                for server in eligible_servers
+                if not self.is_saturated(server, request_data)
+            ]
+            return random.choice(candidates or eligible_servers), None
+
+        candidates = [
+            server
+            for server in self.ring_walk(prefix_hash)
+            if server in eligible_servers
+        ]
+        last_url = self.affinity_table.get(prefix_hash)
+        for server in candidates:
+            if server.url == last_url:
+                candidates.remove(server)
+                candidates.insert(0, server)
+                break
+
+        for server in candidates:
+            if not self.is_saturated(
+                server, request_data
+            ) and self.admit_warming_server(server.url):
+                self.remember(prefix_hash, server)
+                return server, None
+
+        # Every server is saturated: stick to the preferred one, QoS policy decides
+        return candidates[0], None
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import random
+from typing import List
+
+from src.common.request_data import RequestData
+from src.consumer.exceptions import ServerNotFound
+from src.consumer.strategy.metrics_based_strategy import MetricsBasedStrategy
+from src.consumer.strategy.metrics_tracker import MetricsTracker
+from src.consumer.vllm_server import VLLMServer
+
+
+class QueueDepth(MetricsBasedStrategy):
+    """
+    Routes requests to the server with the lowest expected wait, estimated from the
+    number of requests vllm is running and queuing (as of the last scrape) and the
+    number of requests this consumer has in flight on it, relative to its capacity.
+    """
+
+    def __init__(
+        self,
+        servers: List[VLLMServer],
+        tracker: MetricsTracker,
+        running_weight: float = 1.0,
+        waiting_weight: float = 1.0,
+        in_flight_weight: float = 1.0,
+    ) -> None:
+        super().__init__(servers, tracker)
+        self.running_weight = running_weight
+        self.waiting_weight = waiting_weight
+        self.in_flight_weight = in_flight_weight
+
+    @property
+    def tracker(self) -> MetricsTracker:
+        return self._tracker
+
+    def expected_wait(self, server: VLLMServer) -> float:
+        # Gauges are missing until the server has been scraped once
+        running = self.tracker.num_requests_running.get(server.url) or 0
+        waiting = self.tracker.num_requests_waiting.get(server.url) or 0
+        depth = (
+            self.running_weight * running
+            + self.waiting_weight * waiting
+            + self.in_flight_weight * self.in_flight(server)
+        )
+        return depth / server.max_parallel_requests
+
+    def get_server_score(self, url: str) -> float | None:
+        for server in self.servers:
+            if server.url == url:
+                return self.expected_wait(server)
+        return None
+
+    def choose_server(
+        self, request_data: RequestData | None = None
+    ) -> tuple[VLLMServer, float | None]:
+        candidates = self.candidate_servers(request_data)
+        if not candidates:
+            raise ServerNotFound()
+
+        scores = {server: self.expected_wait(server) for server in candidates}
+        # warming up servers look busier than they are, proportionally to their ramp,
+        # and saturated servers are only chosen as a last resort
+        weighted_scores = {
+            server: score / self.slow_start_factor(server.url)
+            for server, score in scores.items()
+            if not self.is_saturated(server, request_data)
+        }
+        if not weighted_scores:
+            weighted_scores = scores
+
+        min_score = min(weighted_scores.values())
+        chosen = random.choice(
+            [server for server, score in weighted_scores.items() if score == min_score]
+        )
+        return chosen, scores[chosen]
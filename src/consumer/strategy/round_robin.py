@@ -1,5 +1,6 @@
 from typing import List
 
+from src.common.request_data import RequestData
 from src.consumer.exceptions import ServerNotFound
 from src.consumer.strategy.server_selection_strategy import ServerSelectionStrategy
 from src.consumer.vllm_server import VLLMServer
@@ -15,9 +16,29 @@ class RoundRobin(ServerSelectionStrategy):  # pylint: disable=too-few-public-met
         self.round_robin_idx = 0
         await super().update_servers(servers)
 
-    def choose_server(self) -> tuple[VLLMServer, None]:
-        if self.servers:
-            choice = self.servers[self.round_robin_idx]
-            self.round_robin_idx = (self.round_robin_idx + 1) % len(self.servers)
-            return choice, None
-        raise ServerNotFound()
+    def choose_server(
+        self, request_data: RequestData | None = None
+    ) -> tuple[VLLMServer, None]:
+        candidates = self.candidate_servers(request_data)
+        if not candidates:
+            raise ServerNotFound()
+
+        # Servers that are not candidates or saturated are skipped, and warming up
+        # servers are skipped in proportion to their slow start factor
+        start_idx = self.round_robin_idx
+        self.round_robin_idx = (start_idx + 1) % len(self.servers)
+        fallback = None
+        for i in range(len(self.servers)):
+            choice = self.servers[(start_idx + i) % len(self.servers)]
+            if choice not in candidates:
+                continue
+            if fallback is None:
+                fallback = choice
+            if not self.is_saturated(
+                choice, request_data
+            ) and self.admit_warming_server(choice.url):
+                self.round_robin_idx = (start_idx + i + 1) % len(self.servers)
+                return choice, None
+
+        # Every candidate is saturated or warming up: the QoS policy decides
+        return fallback, None
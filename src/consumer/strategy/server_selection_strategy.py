@@ -1,6 +1,11 @@
+import math
+import random
+import time
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, List
 
+from src.common.request_data import RequestData
+from src.consumer.settings import settings
 from src.consumer.vllm_server import VLLMServer
 
 
@@ -11,13 +16,116 @@ class ServerSelectionStrategy(ABC):  # pylint: disable=too-few-public-methods
 
     def __init__(self, servers: List[VLLMServer]) -> None:
         self.servers = servers
+        # Servers known at startup are considered warm, only servers (re)joining
+        # the healthy set afterwards go through the slow start ramp
+        self.healthy_since: dict[str, float] = {}
+        # Set by the RPC server, which keeps track of requests in flight
+        self.saturation_check: Callable[[VLLMServer, RequestData | None], bool] = (
+            lambda *_: False
+        )
+        self.in_flight_count: Callable[[VLLMServer], int] = lambda _: 0
 
     @abstractmethod
-    def choose_server(self) -> tuple[VLLMServer, float | None]:
+    def choose_server(
+        self, request_data: RequestData | None = None
+    ) -> tuple[VLLMServer, float | None]:
         pass
 
     async def update_servers(self, servers: List[VLLMServer]) -> None:
+        now = time.monotonic()
+        previous_urls = {server.url for server in self.servers}
+        new_urls = {server.url for server in servers}
+        # Servers leaving the healthy set are forgotten, so that they ramp up again
+        # once they come back
+        self.healthy_since = {
+            url: joined_at
+            for url, joined_at in self.healthy_since.items()
+            if url in new_urls
+        }
+        for url in new_urls - previous_urls:
+            self.healthy_since[url] = now
         self.servers = servers
 
     def get_server_score(self, url: str) -> None | float:
         return None
+
+    def is_saturated(
+        self, server: VLLMServer, request_data: RequestData | None = None
+    ) -> bool:
+        return self.saturation_check(server, request_data)
+
+    def in_flight(self, server: VLLMServer) -> int:
+        return self.in_flight_count(server)
+
+    def candidate_servers(
+        self,
+        request_data: RequestData | None = None,
+        servers: List[VLLMServer] | None = None,
+    ) -> List[VLLMServer]:
+        """
+        Servers (among `servers`, or all healthy servers by default) whose context
+        capacity fits the request. Short requests are kept on the smallest
+        context servers that are not saturated, so that long-context servers
+        stay available for long requests. Servers that already failed to answer
+        the request are left out, unless no other server is left.
+        """
+        if servers is None:
+            servers = self.servers
+        if request_data and request_data.excluded_servers:
+            servers = [
+                server
+                for server in servers
+                if server.url not in request_data.excluded_servers
+            ] or servers
+        context_tokens = request_data.context_tokens if request_data else None
+        if context_tokens is None or not servers:
+            return servers
+
+        def context_capacity(server: VLLMServer) -> float:
+            if server.max_context_length is None:
+                return math.inf
+            return server.max_context_length
+
+        fitting = [
+            server for server in servers if context_capacity(server) >= context_tokens
+        ]
+        if not fitting:
+            # Nothing fits: largest servers will answer with a context length error
+            largest = max(context_capacity(server) for server in servers)
+            return [server for server in servers if context_capacity(server) == largest]
+
+        for capacity in sorted({context_capacity(server) for server in fitting}):
+            tier = [
+                server for server in fitting if context_capacity(server) == capacity
+            ]
+            if any(not self.is_saturated(server, request_data) for server in tier):
+                return tier
+        return fitting
+
+    def slow_start_factor(self, url: str) -> float:
+        """
+        Fraction of its capacity a server should be given, ramping linearly from
+        SLOW_START_MIN_FRACTION to 1 during SLOW_START_DURATION seconds after it
+        (re)joined the healthy set.
+        """
+        joined_at = self.healthy_since.get(url)
+        if joined_at is None or settings.SLOW_START_DURATION == 0:
+            return 1.0
+
+        elapsed = time.monotonic() - joined_at
+        if elapsed >= settings.SLOW_START_DURATION:
+            del self.healthy_since[url]
+            return 1.0
+
+        min_fraction = settings.SLOW_START_MIN_FRACTION
+        return (
+            min_fraction + (1 - min_fraction) * elapsed / settings.SLOW_START_DURATION
+        )
+
+    def admit_warming_server(self, url: str) -> bool:
+        """
+        Randomly lets a warming up server be selected, with a probability equal to
+        its slow start factor, so that its share of traffic follows the ramp.
+        """
+        factor = self.slow_start_factor(url)
+        return factor >= 1 or random.random() < factor
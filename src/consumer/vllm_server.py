@@ -7,3 +7,14 @@ class VLLMServer:
     token: str | None
     organization: str
     max_parallel_requests: int
+    max_outstanding_tokens: int
+    max_context_length: int | None = None
+    # (organization, guaranteed share of max_parallel_requests) pairs,
+    # a tuple so that the server stays hashable
+    reservations: tuple[tuple[str, int], ...] = ()
+
+    def reserved_share(self, organization: str | None) -> int:
+        for reserving_organization, share in self.reservations:
+            if reserving_organization == organization:
+                return share
+        return 0
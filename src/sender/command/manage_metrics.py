@@ -0,0 +1,463 @@
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import typer
+from sqlalchemy import DateTime, Float, Integer, delete, func, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is an optional dependency, only needed to archive
+    pa = None
+
+from src.sender.db import Database
+from src.sender.entities import Metric, MetricRollup
+from src.sender.settings import Settings
+
+app = typer.Typer(help="Metrics management CLI")
+
+GRANULARITIES = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+
+
+@dataclass
+class Aggregate:
+    request_count: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    queue_waits: list[float] = field(default_factory=list)
+    ttfts: list[float] = field(default_factory=list)
+    durations: list[float] = field(default_factory=list)
+    tokens_per_second: list[float] = field(default_factory=list)
+
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    moment = moment.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        moment = moment.replace(minute=0)
+    return moment
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """
+    Percentile with linear interpolation, like PostgreSQL's percentile_cont
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def seconds_between(start: datetime | None, end: datetime | None) -> float | None:
+    if start is None or end is None:
+        return None
+    return (end - start).total_seconds()
+
+
+def rollup_range(
+    session: Session, granularity: str, start: datetime, end: datetime
+) -> int:
+    """
+    Recomputes the rollups of the buckets between `start` (included) and `end`
+    (excluded), which must be bucket boundaries. Returns the number of rollups.
+    """
+    aggregates: dict[tuple, Aggregate] = defaultdict(Aggregate)
+    rows = (
+        session.query(
+            Metric.request_date,
+            Metric.granted_date,
+            Metric.first_byte_date,
+            Metric.response_date,
+            Metric.model,
+            Metric.server,
+            Metric.server_organization,
+            Metric.user_name,
+            Metric.user_organization,
+            Metric.prompt_tokens,
+            Metric.completion_tokens,
+        )
+        .filter(Metric.request_date >= start, Metric.request_date < end)
+        .yield_per(10_000)
+    )
+    for row in rows:
+        aggregate = aggregates[
+            (
+                truncate(row.request_date, granularity),
+                row.model,
+                row.server,
+                row.server_organization,
+                row.user_name,
+                row.user_organization,
+            )
+        ]
+        aggregate.request_count += 1
+        aggregate.prompt_tokens += row.prompt_tokens or 0
+        aggregate.completion_tokens += row.completion_tokens or 0
+        for values, latency in (
+            (
+                aggregate.queue_waits,
+                seconds_between(row.request_date, row.granted_date),
+            ),
+            (aggregate.ttfts, seconds_between(row.request_date, row.first_byte_date)),
+            (aggregate.durations, seconds_between(row.request_date, row.response_date)),
+        ):
+            if latency is not None:
+                values.append(latency)
+        decode_time = seconds_between(row.first_byte_date, row.response_date)
+        if row.completion_tokens and decode_time:
+            aggregate.tokens_per_second.append(row.completion_tokens / decode_time)
+
+    session.query(MetricRollup).filter(
+        MetricRollup.granularity == granularity,
+        MetricRollup.bucket >= start,
+        MetricRollup.bucket < end,
+    ).delete(synchronize_session=False)
+    session.add_all(
+        MetricRollup(
+            granularity=granularity,
+            bucket=bucket,
+            model=model,
+            server=server,
+            server_organization=server_organization,
+            user_name=user_name,
+            user_organization=user_organization,
+            request_count=aggregate.request_count,
+            prompt_tokens=aggregate.prompt_tokens,
+            completion_tokens=aggregate.completion_tokens,
+            queue_wait_p50=percentile(aggregate.queue_waits, 0.5),
+            queue_wait_p95=percentile(aggregate.queue_waits, 0.95),
+            ttft_p50=percentile(aggregate.ttfts, 0.5),
+            ttft_p95=percentile(aggregate.ttfts, 0.95),
+            duration_p50=percentile(aggregate.durations, 0.5),
+            duration_p95=percentile(aggregate.durations, 0.95),
+            tokens_per_second_p50=percentile(aggregate.tokens_per_second, 0.5),
+        )
+        for (
+            bucket,
+            model,
+            server,
+            server_organization,
+            user_name,
+            user_organization,
+        ), aggregate in aggregates.items()
+    )
+    return len(aggregates)
+
+
+@app.command("rollup")
+def rollup(
+    granularity: str = typer.Option(
+        "minute", help="Size of the buckets (choices: minute, hour)"
+    ),
+    lookback_minutes: int = typer.Option(
+        15,
+        help="Minutes recomputed before the last rollup, as metrics are stored once responses end",
+    ),
+    chunk_hours: int = typer.Option(
+        24, help="Hours of metrics rolled up per transaction"
+    ),
+):
+    """
+    Maintain the per-minute or per-hour aggregates of the metrics read by the
+    dashboards, from the last rollup (or the first metric) to now.
+    """
+    if granularity not in GRANULARITIES:
+        typer.echo(f"❌ Unknown granularity '{granularity}'")
+        raise typer.Exit(code=1)
+
+    settings = Settings()
+    database = Database(settings)
+
+    with database.get_session() as session:
+        last_bucket = (
+            session.query(func.max(MetricRollup.bucket))
+            .filter(MetricRollup.granularity == granularity)
+            .scalar()
+        )
+        if last_bucket is not None:
+            start = last_bucket - timedelta(minutes=lookback_minutes)
+        else:
+            start = session.query(func.min(Metric.request_date)).scalar()
+            if start is None:
+                typer.echo("ℹ️ No metrics to roll up.")
+                return
+        start = truncate(start, granularity)
+        # The current bucket is rolled up too, and recomputed by the next run
+        end = truncate(datetime.now(), granularity) + GRANULARITIES[granularity]
+
+        rollups = 0
+        while start < end:
+            chunk_end = min(start + timedelta(hours=chunk_hours), end)
+            try:
+                rollups += rollup_range(session, granularity, start, chunk_end)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                typer.echo(f"❌ Failed to roll up metrics from {start}: {e}")
+                raise typer.Exit(code=1)
+            start = chunk_end
+
+    typer.echo(f"✅ {rollups} {granularity} rollups updated up to {end}.")
+
+
+def add_months(month: date, months: int) -> date:
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + years, month=month_index + 1, day=1)
+
+
+@app.command("create-partitions")
+def create_partitions(
+    months_ahead: int = typer.Option(
+        3, help="Number of upcoming months to create partitions for"
+    ),
+):
+    """
+    Create the monthly partitions of the metrics table (PostgreSQL only) before
+    metrics fall into the default partition.
+    """
+    settings = Settings()
+    database = Database(settings)
+
+    if database.engine.dialect.name != "postgresql":
+        typer.echo("ℹ️ Metrics are only partitioned on PostgreSQL.")
+        return
+
+    current_month = date.today().replace(day=1)
+    with database.get_session() as session:
+        for months in range(months_ahead + 1):
+            month = add_months(current_month, months)
+            partition = f"metrics_{month:%Y_%m}"
+            try:
+                session.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF metrics "
+                        f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+                    )
+                )
+                session.commit()
+            except SQLAlchemyError as e:
+                # e.g. rows of that month are already in the default partition
+                session.rollback()
+                typer.echo(f"❌ Failed to create partition {partition}: {e}")
+                raise typer.Exit(code=1)
+            typer.echo(f"✅ Partition {partition} is ready.")
+
+
+def metrics_partitions(session: Session) -> list[str]:
+    return list(
+        session.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "WHERE parent.relname = 'metrics'"
+            )
+        ).scalars()
+    )
+
+
+def expired_partitions(partitions: list[str], cutoff: datetime) -> list[str]:
+    """
+    Monthly partitions whose rows are all older than `cutoff`
+    """
+    expired = []
+    for partition in partitions:
+        try:
+            month = datetime.strptime(partition, "metrics_%Y_%m")
+        except ValueError:  # default partition
+            continue
+        if datetime.combine(add_months(month.date(), 1), datetime.min.time()) <= cutoff:
+            expired.append(partition)
+    return sorted(expired)
+
+
+def arrow_schema() -> "pa.Schema":
+    fields = []
+    for column in Metric.__table__.columns:
+        if isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def archive_metrics(
+    session: Session,
+    cutoff: datetime,
+    path: Path,
+    archive_format: str,
+    batch_size: int,
+) -> tuple[int, int | None]:
+    """
+    Writes the metrics older than `cutoff` to a zstd compressed Parquet or Arrow
+    IPC file, streaming them by batches. Returns the number of rows archived and
+    their highest id.
+    """
+    schema = arrow_schema()
+    if archive_format == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(
+            str(path), schema, options=pa.ipc.IpcWriteOptions(compression="zstd")
+        )
+
+    archived, max_id = 0, None
+    with writer:
+        result = session.execute(
+            select(Metric.__table__)
+            .where(Metric.request_date < cutoff)
+            .execution_options(yield_per=batch_size)
+        )
+        for rows in result.mappings().partitions():
+            batch = [dict(row) for row in rows]
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            archived += len(batch)
+            max_id = max([max_id or 0] + [row["id"] for row in batch])
+    return archived, max_id
+
+
+@app.command("purge")
+def purge(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    retention_days: int = typer.Option(
+        ..., min=0, help="Metrics whose request is older are removed (required)"
+    ),
+    archive_dir: Path = typer.Option(
+        None,
+        file_okay=False,
+        help=(
+            "Directory where removed metrics are archived first (requires the "
+            "optional pyarrow dependency)"
+        ),
+    ),
+    archive_format: str = typer.Option(
+        "parquet", help="Format of the archive (choices: parquet, arrow)"
+    ),
+    batch_size: int = typer.Option(
+        5_000, min=1, help="Rows archived and deleted per transaction"
+    ),
+    pause: float = typer.Option(
+        0.1, min=0, help="Seconds between two batches, to leave room for writes"
+    ),
+    vacuum: bool = typer.Option(
+        False, help="Reclaim the space of deleted rows afterwards (PostgreSQL only)"
+    ),
+    dry_run: bool = typer.Option(False, help="Only count the metrics to remove"),
+):
+    """
+    Remove the metrics older than the retention period, optionally archiving them
+    to a columnar file. Rows are deleted in small batches so that the table is
+    never locked for long; on PostgreSQL, monthly partitions older than the
+    retention period are dropped at once instead.
+    """
+    if archive_format not in ("parquet", "arrow"):
+        typer.echo(f"❌ Unknown archive format '{archive_format}'")
+        raise typer.Exit(code=1)
+    if archive_dir is not None and pa is None:
+        typer.echo(
+            "❌ --archive-dir requires pyarrow, which is not installed: "
+            "pip install -r src/sender/requirements-archive.txt",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+
+    settings = Settings()
+    database = Database(settings)
+    cutoff = datetime.now() - timedelta(days=retention_days)
+
+    with database.get_session() as session:
+        to_remove = (
+            session.query(func.count(Metric.id))
+            .filter(Metric.request_date < cutoff)
+            .scalar()
+        )
+        if dry_run or not to_remove:
+            typer.echo(f"ℹ️ {to_remove} metrics older than {cutoff} to remove.")
+            return
+
+        if archive_dir is not None:
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            path = archive_dir / (
+                f"metrics_until_{cutoff:%Y%m%dT%H%M%S}"
+                f".{'parquet' if archive_format == 'parquet' else 'arrow'}"
+            )
+            archived, max_id = archive_metrics(
+                session, cutoff, path, archive_format, batch_size
+            )
+            typer.echo(f"📦 {archived} metrics archived to {path}")
+        else:
+            max_id = (
+                session.query(func.max(Metric.id))
+                .filter(Metric.request_date < cutoff)
+                .scalar()
+            )
+        if max_id is None:
+            typer.echo("ℹ️ No metrics to remove.")
+            return
+        # Metrics stored while archiving are kept for the next run, they were not
+        # archived
+        session.rollback()
+
+        removed = 0
+        if database.engine.dialect.name == "postgresql":
+            for partition in expired_partitions(metrics_partitions(session), cutoff):
+                if (
+                    archive_dir is not None
+                    and session.execute(
+                        text(f"SELECT count(*) FROM {partition} WHERE id > :max_id"),
+                        {"max_id": max_id},
+                    ).scalar()
+                ):
+                    # Rows of the partition stored after the archive are kept
+                    continue
+                session.execute(
+                    text(f"ALTER TABLE metrics DETACH PARTITION {partition}")
+                )
+                session.execute(text(f"DROP TABLE {partition}"))
+                session.commit()
+                typer.echo(f"🗑️ Partition {partition} dropped.")
+
+        while True:
+            ids = list(
+                session.execute(
+                    select(Metric.id)
+                    .where(Metric.request_date < cutoff, Metric.id <= max_id)
+                    .order_by(Metric.id)
+                    .limit(batch_size)
+                ).scalars()
+            )
+            if not ids:
+                break
+            session.execute(
+                delete(Metric)
+                .where(Metric.id.in_(ids), Metric.request_date < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            removed += len(ids)
+            time.sleep(pause)
+
+    if vacuum and database.engine.dialect.name == "postgresql":
+        # VACUUM cannot run inside a transaction
+        with database.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            connection.execute(text("VACUUM (ANALYZE) metrics"))
+        typer.echo("🧹 Metrics table vacuumed.")
+
+    typer.echo(f"✅ Metrics older than {cutoff} removed ({removed} deleted by batch).")
+
+
+if __name__ == "__main__":
+    app()
@@ -1,5 +1,14 @@
+import csv
+import json
+import sys
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+
 import typer
+from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 
 from src.sender.db import Database
 from src.sender.entities.user import User
@@ -7,6 +16,18 @@ from src.sender.settings import Settings
 
 app = typer.Typer(help="Database management CLI")
 
+USER_FIELDS = [
+    "token",
+    "name",
+    "organization",
+    "email",
+    "priority",
+    "threshold",
+    "client_type",
+    "default_routing_mode",
+]
+ROUTING_MODES = ("any", "private-first", "private-only")
+
 
 @app.command("add-user")
 def add_user(
@@ -204,5 +225,283 @@ def edit_user(
             raise typer.Exit(code=1)
 
 
+def file_format(path: Path, file_format_option: str | None) -> str:
+    if file_format_option is None:
+        file_format_option = "jsonl" if path.suffix in (".jsonl", ".json") else "csv"
+    if file_format_option not in ("csv", "jsonl"):
+        typer.echo(f"❌ Unknown format '{file_format_option}' (choices: csv, jsonl)")
+        raise typer.Exit(code=1)
+    return file_format_option
+
+
+def read_records(path: Path, records_format: str) -> Iterator[tuple[int, dict | str]]:
+    """
+    Streams the records of a CSV (with a header) or JSONL file, with their line
+    number. JSONL lines are decoded by parse_user, so that a malformed line only
+    invalidates its own record.
+    """
+    with path.open(encoding="utf-8", newline="") as file:
+        if records_format == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    yield line_number, line
+
+
+def parse_user(record: dict | str) -> dict:
+    """
+    User fields of an imported record, raising ValueError if it is invalid
+    """
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON ({e})") from e
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+
+    values = {}
+    for key in USER_FIELDS:
+        value = record.get(key)
+        if isinstance(value, str):
+            value = value.strip()
+        values[key] = None if value == "" else value
+
+    for key in ("token", "name", "priority", "threshold"):
+        if values[key] is None:
+            raise ValueError(f"missing {key}")
+    for key in ("priority", "threshold"):
+        try:
+            values[key] = int(values[key])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{key} must be an integer") from e
+    if values["default_routing_mode"] is None:
+        values["default_routing_mode"] = "any"
+    if values["default_routing_mode"] not in ROUTING_MODES:
+        raise ValueError(f"unknown routing mode {values['default_routing_mode']}")
+    return values
+
+
+def valid_users(
+    chunk: list[tuple[int, dict | str]], seen: dict[str, set], counts: dict[str, int]
+) -> list[tuple[int, dict]]:
+    """
+    Users of a chunk of records with their line number, without the invalid ones
+    and the ones whose token or name was already seen in the file
+    """
+    users = []
+    for line_number, record in chunk:
+        try:
+            values = parse_user(record)
+        except ValueError as e:
+            typer.echo(f"❌ Line {line_number}: {e}")
+            counts["invalid"] += 1
+            continue
+        duplicated = [k for k, known in seen.items() if values[k] in known]
+        if duplicated:
+            typer.echo(f"❌ Line {line_number}: {duplicated[0]} already in the file")
+            counts["invalid"] += 1
+            continue
+        for key, known in seen.items():
+            known.add(values[key])
+        users.append((line_number, values))
+    return users
+
+
+def import_chunk(
+    session: Session,
+    users: list[tuple[int, dict]],
+    match_on: str,
+    on_conflict: str,
+    counts: dict[str, int],
+) -> bool:
+    """
+    Creates or updates the users of a chunk in the session, returns whether a
+    conflict was found with --on-conflict fail
+    """
+    other_key = "name" if match_on == "token" else "token"
+    existing_users = (
+        session.query(User)
+        .filter(
+            or_(
+                User.token.in_([values["token"] for _, values in users]),
+                User.name.in_([values["name"] for _, values in users]),
+            )
+        )
+        .all()
+    )
+    by_key = {
+        key: {getattr(user, key): user for user in existing_users}
+        for key in ("token", "name")
+    }
+
+    failed = False
+    for line_number, values in users:
+        user = by_key[match_on].get(values[match_on])
+        if by_key[other_key].get(values[other_key]) not in (None, user):
+            typer.echo(
+                f"⚠️ Line {line_number}: {other_key} '{values[other_key]}' "
+                f"belongs to another user, skipped"
+            )
+            counts["skipped"] += 1
+            failed = failed or on_conflict == "fail"
+            continue
+
+        if user is None:
+            typer.echo(f"➕ {values['name']}")
+            session.add(User(**values))
+            counts["created"] += 1
+            continue
+
+        changes = {
+            key: value for key, value in values.items() if getattr(user, key) != value
+        }
+        if not changes:
+            counts["unchanged"] += 1
+            continue
+        if on_conflict != "update":
+            typer.echo(
+                f"⚠️ Line {line_number}: user '{user.name}' differs "
+                f"({', '.join(changes)}), skipped"
+            )
+            counts["skipped"] += 1
+            failed = failed or on_conflict == "fail"
+            continue
+        typer.echo(f"📝 {user.name}")
+        for key, value in changes.items():
+            typer.echo(f"   -> {key}: '{getattr(user, key)}' to '{value}'")
+            setattr(user, key, value)
+        counts["updated"] += 1
+    return failed
+
+
+@app.command("import-users")
+def import_users(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    path: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="CSV (with a header) or JSONL file"
+    ),
+    file_format_option: str = typer.Option(
+        None, "--format", help="csv or jsonl (guessed from the extension by default)"
+    ),
+    match_on: str = typer.Option(
+        "token", help="Field identifying existing users (choices: token, name)"
+    ),
+    on_conflict: str = typer.Option(
+        "update",
+        help="What to do with existing users that differ (choices: update, skip, fail)",
+    ),
+    chunk_size: int = typer.Option(
+        500,
+        min=1,
+        help="Users imported per transaction (a single one with --on-conflict fail)",
+    ),
+    dry_run: bool = typer.Option(
+        False, help="Only show the changes that would be made"
+    ),
+):
+    """
+    Create or update users in bulk from a file with the columns of add-user.
+    Every chunk of users is imported in a single transaction, except with
+    --on-conflict fail where the whole file is, so that nothing is imported if a
+    user conflicts.
+    """
+    if match_on not in ("token", "name"):
+        typer.echo(f"❌ Cannot match users on '{match_on}' (choices: token, name)")
+        raise typer.Exit(code=1)
+    if on_conflict not in ("update", "skip", "fail"):
+        typer.echo(f"❌ Unknown conflict handling '{on_conflict}'")
+        raise typer.Exit(code=1)
+    records_format = file_format(path, file_format_option)
+
+    settings = Settings()
+    database = Database(settings)
+
+    counts = {"created": 0, "updated": 0, "unchanged": 0, "skipped": 0, "invalid": 0}
+    seen = {"token": set(), "name": set()}
+    failed = False
+    records = read_records(path, records_format)
+
+    with database.get_session() as session:
+        try:
+            while chunk := list(islice(records, chunk_size)):
+                users = valid_users(chunk, seen, counts)
+                failed = import_chunk(session, users, match_on, on_conflict, counts)
+                if dry_run or failed:
+                    session.rollback()
+                elif on_conflict == "fail":
+                    # Nothing is committed before every user was checked
+                    session.flush()
+                    session.expunge_all()
+                else:
+                    session.commit()
+                if failed:
+                    typer.echo("❌ Conflicting users found, nothing imported.")
+                    break
+            if on_conflict == "fail" and not (dry_run or failed):
+                session.commit()
+        except IntegrityError as e:
+            session.rollback()
+            typer.echo(f"❌ Failed to import users: {e.orig}")
+            raise typer.Exit(code=1)
+
+    summary = ", ".join(f"{count} {state}" for state, count in counts.items())
+    if dry_run:
+        typer.echo(f"ℹ️ Dry run, nothing changed: {summary}")
+    elif failed:
+        typer.echo(f"❌ Import cancelled, nothing changed: {summary}")
+        raise typer.Exit(code=1)
+    else:
+        typer.echo(f"✅ Users imported: {summary}")
+
+
+@app.command("export-users")
+def export_users(
+    path: Path = typer.Argument(
+        None, dir_okay=False, help="Output file (standard output by default)"
+    ),
+    file_format_option: str = typer.Option(
+        None, "--format", help="csv or jsonl (guessed from the extension by default)"
+    ),
+    organization: str = typer.Option(
+        None, "--organization", help="Filter by organization name"
+    ),
+):
+    """
+    Export users to a CSV or JSONL file that import-users can read back.
+    """
+    records_format = file_format(path or Path("-.csv"), file_format_option)
+
+    settings = Settings()
+    database = Database(settings)
+
+    with database.get_session() as session:
+        query = session.query(User).order_by(User.id)
+        if organization is not None:
+            query = query.filter(User.organization == organization)
+
+        file = path.open("w", encoding="utf-8", newline="") if path else sys.stdout
+        try:
+            writer = csv.DictWriter(file, fieldnames=USER_FIELDS)
+            if records_format == "csv":
+                writer.writeheader()
+            exported = 0
+            for user in query.yield_per(1_000):
+                values = {key: getattr(user, key) for key in USER_FIELDS}
+                if records_format == "csv":
+                    writer.writerow(values)
+                else:
+                    file.write(json.dumps(values) + "\n")
+                exported += 1
+        finally:
+            if path:
+                file.close()
+
+    if path:
+        typer.echo(f"✅ {exported} users exported to {path}")
+
+
 if __name__ == "__main__":
     app()
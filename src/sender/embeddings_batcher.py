@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from src.sender.entities import User
+from src.sender.instrumentation import StageTimer
+
+# Fields of the body that may differ between requests of a batch
+BATCHED_FIELDS = ("input", "priority", "routing-mode", "user")
+
+
+def embeddings_inputs(json_body: dict) -> List[Any] | None:
+    """
+    Inputs of an embeddings request as a list, or None if they cannot be batched.
+    A list of token ids is a single input.
+    """
+    value = json_body.get("input")
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list) or not value:
+        return None
+    if all(isinstance(item, int) for item in value):
+        return [value]
+    if all(isinstance(item, (str, list)) for item in value):
+        return value
+    return None
+
+
+def batch_key(request: "BatchedRequest"):
+    """
+    Requests can share a batch if they only differ by their inputs, and are
+    routed and admitted the same way: a batch is queued with the priority and
+    threshold of its requests. Texts and token ids are not mixed.
+    """
+    params = tuple(
+        sorted(
+            (key, repr(value))
+            for key, value in request.json_body.items()
+            if key not in BATCHED_FIELDS
+        )
+    )
+    return (
+        request.user.organization,
+        request.routing_mode,
+        request.priority,
+        request.threshold,
+        request.user.priority,
+        isinstance(request.inputs[0], str),
+        params,
+    )
+
+
+def split_usage(total: int, weights: List[int]) -> List[int]:
+    """
+    Splits the tokens of a batch proportionally to the estimated tokens of each
+    request, the rounding remainder going to the last one
+    """
+    if sum(weights) <= 0:
+        weights = [1] * len(weights)
+    shares = [total * weight // sum(weights) for weight in weights]
+    shares[-1] += total - sum(shares)
+    return shares
+
+
+def split_embeddings_response(
+    response_json: dict, batch: List["BatchedRequest"], prompt_tokens: List[int]
+) -> List[dict]:
+    """
+    Response of each request of a batch, with its own embeddings (indexed from
+    0) and its share of the usage
+    """
+    data = sorted(response_json["data"], key=lambda item: item["index"])
+    expected = sum(len(request.inputs) for request in batch)
+    if len(data) != expected:
+        raise ValueError(f"{len(data)} embeddings received for {expected} inputs")
+    usage = response_json.get("usage") or {}
+    shares = split_usage(usage.get("prompt_tokens") or 0, prompt_tokens)
+
+    responses = []
+    offset = 0
+    for request, share in zip(batch, shares):
+        embeddings = data[offset : offset + len(request.inputs)]
+        offset += len(request.inputs)
+        responses.append(
+            {
+                **response_json,
+                "data": [
+                    {**embedding, "index": index}
+                    for index, embedding in enumerate(embeddings)
+                ],
+                "usage": {"prompt_tokens": share, "total_tokens": share},
+            }
+        )
+    return responses
+
+
+@dataclass
+class BatchedRequest:  # pylint: disable=too-many-instance-attributes
+    json_body: dict
+    inputs: List[Any]
+    user: User
+    priority: int
+    threshold: int
+    routing_mode: str
+    timer: StageTimer
+    start: datetime
+    future: asyncio.Future | None = field(default=None)
+
+
+class EmbeddingsBatcher:
+    """
+    Coalesces concurrent embeddings requests into one upstream batch.
+
+    The first request of a batch waits `window` seconds for others, the batch
+    is sent earlier if it reaches `max_inputs`. `process_batch` gets the
+    requests of a batch and returns one result per request.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        max_inputs: int,
+        process_batch: Callable[[List[BatchedRequest]], Awaitable[List[Any]]],
+    ) -> None:
+        self.window = window
+        self.max_inputs = max_inputs
+        self.process_batch = process_batch
+        self.batches: Dict[Hashable, List[BatchedRequest]] = {}
+        self.flush_handles: Dict[Hashable, asyncio.TimerHandle] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, request: BatchedRequest) -> Any:
+        loop = asyncio.get_running_loop()
+        request.future = loop.create_future()
+
+        batch = self.batches.get(key, [])
+        if batch and self._size(batch) + len(request.inputs) > self.max_inputs:
+            self.flush(key)
+            batch = []
+        batch.append(request)
+        self.batches[key] = batch
+        if len(batch) == 1:
+            self.flush_handles[key] = loop.call_later(self.window, self.flush, key)
+        if self._size(batch) >= self.max_inputs:
+            self.flush(key)
+
+        return await request.future
+
+    def flush(self, key: Hashable) -> None:
+        handle = self.flush_handles.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        batch = self.batches.pop(key, None)
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: List[BatchedRequest]) -> None:
+        # Callers that went away in the meantime are not sent upstream
+        batch = [request for request in batch if not request.future.done()]
+        if not batch:
+            return
+        logging.debug(
+            "Sending a batch of %s embeddings requests (%s inputs)",
+            len(batch),
+            self._size(batch),
+        )
+        try:
+            results = await self.process_batch(batch)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        for request, result in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result(result)
+
+    @staticmethod
+    def _size(batch: List[BatchedRequest]) -> int:
+        return sum(len(request.inputs) for request in batch)
@@ -1,5 +1,6 @@
 from src.sender.entities.base import Base
 from src.sender.entities.metric import Metric
+from src.sender.entities.metric_rollup import MetricRollup
 from src.sender.entities.user import User
 
-__all__ = ["Base", "User", "Metric"]
+__all__ = ["Base", "User", "Metric", "MetricRollup"]
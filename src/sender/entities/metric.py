@@ -1,16 +1,27 @@
-from sqlalchemy import Column, DateTime, Float, Integer, String
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String
 
 from src.sender.entities.base import Base
 
 
 class Metric(Base):
     __tablename__ = "metrics"
+    # On PostgreSQL, the table is also partitioned by month of request_date (see
+    # migration 24460010ea8a and manage_metrics create-partitions)
+    __table_args__ = (
+        Index("ix_metrics_request_date_model", "request_date", "model"),
+        Index("ix_metrics_user_name_request_date", "user_name", "request_date"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_name = Column(String(length=255), nullable=False)
     user_organization = Column(String(length=255))
     request_date = Column(DateTime)
     sent_to_llm_date = Column(DateTime)
     response_date = Column(DateTime)
+    granted_date = Column(DateTime, nullable=True)
+    first_byte_date = Column(DateTime, nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    max_inter_chunk_gap = Column(Float, nullable=True)
+    mean_inter_chunk_gap = Column(Float, nullable=True)
     model = Column(String(length=255))
     server = Column(String(length=255))
     server_organization = Column(String(length=255))
@@ -21,5 +32,9 @@ class Metric(Base):
     max_parallel_requests = Column(Integer, nullable=True)
     current_parallel_requests = Column(Integer, nullable=True)
     priority = Column(Integer, nullable=True)
+    effective_priority = Column(Integer, nullable=True)
     performance_score = Column(Float, nullable=True)
     routing_mode = Column(String(length=255))
+    cache_status = Column(String(length=16), nullable=True)  # hit, coalesced or miss
+    # Number of requests sent upstream together, for batched embeddings
+    batch_size = Column(Integer, nullable=True)
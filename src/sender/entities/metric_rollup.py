@@ -0,0 +1,33 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, String
+
+from src.sender.entities.base import Base
+
+
+class MetricRollup(Base):  # pylint: disable=too-few-public-methods
+    """
+    Aggregates of the metrics of the requests started in a minute or an hour,
+    per model, server and user. Latencies are in seconds, from the request date.
+    """
+
+    __tablename__ = "metric_rollups"
+    __table_args__ = (
+        Index("ix_metric_rollups_granularity_bucket", "granularity", "bucket"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    granularity = Column(String(length=16), nullable=False)  # minute or hour
+    bucket = Column(DateTime, nullable=False)
+    model = Column(String(length=255))
+    server = Column(String(length=255))
+    server_organization = Column(String(length=255))
+    user_name = Column(String(length=255))
+    user_organization = Column(String(length=255))
+    request_count = Column(Integer, nullable=False)
+    prompt_tokens = Column(BigInteger, nullable=False)
+    completion_tokens = Column(BigInteger, nullable=False)
+    queue_wait_p50 = Column(Float, nullable=True)
+    queue_wait_p95 = Column(Float, nullable=True)
+    ttft_p50 = Column(Float, nullable=True)
+    ttft_p95 = Column(Float, nullable=True)
+    duration_p50 = Column(Float, nullable=True)
+    duration_p95 = Column(Float, nullable=True)
+    tokens_per_second_p50 = Column(Float, nullable=True)
@@ -0,0 +1,101 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.common.tracing import Span
+
+# Stages of a proxied request
+AUTH = "auth"
+QUEUE_DEPTH_CHECK = "queue_depth_check"
+RPC_WAIT = "rpc_wait"  # from publication of the request to the consumer's answer
+UPSTREAM_CONNECT = "upstream_connect"  # until the LLM server's response headers
+TTFB = "ttfb"  # from sending the request to the LLM server to its first chunk
+STREAM = "stream"  # from the first to the last chunk
+
+STAGE_DURATION = Histogram(
+    "sender_stage_duration_seconds",
+    "Time spent by requests in each stage of the proxy",
+    ["stage", "model", "routing_mode", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+PENDING_RPC_CALLS = Gauge(
+    "sender_pending_rpc_calls", "RPC calls waiting for an answer of a consumer"
+)
+OPEN_UPSTREAM_STREAMS = Gauge(
+    "sender_open_upstream_streams", "Responses being streamed from LLM servers"
+)
+UPSTREAM_RETRIES = Counter(
+    "sender_upstream_retries_total",
+    "Requests granted again on another server after a failure of the LLM server",
+    ["model"],
+)
+
+
+def outcome_from_status(status_code: int) -> str:
+    if status_code < 400:
+        return "success"
+    return f"{status_code // 100}xx"
+
+
+class StageTimer:
+    """
+    Collects the durations of the stages of a request, which are observed once
+    its model, routing mode and outcome are known. Stages are also traced as
+    children of the span of the request, if any.
+    """
+
+    def __init__(self, span: Span | None = None) -> None:
+        self.span = span
+        self.durations: dict[str, float] = {}
+        self.model = ""
+        self.routing_mode = ""
+        # Set when the outcome is not the response status (e.g. a CallResult)
+        self.outcome: str | None = None
+        # Set when the stages go on after the response is returned (streaming)
+        self.deferred = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Span | None]:
+        """
+        Times the stage, yielding its span to propagate its trace context
+        """
+        span = None
+        if self.span is not None:
+            span = self.span.tracer.start_span(name, parent=self.span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            if span is not None:
+                span.set_error(str(e))
+            raise
+        finally:
+            self.durations[name] = time.perf_counter() - start
+            if span is not None:
+                span.end()
+
+    def record(self, name: str, duration: float) -> None:
+        """
+        Records a stage that ended now
+        """
+        self.durations[name] = duration
+        if self.span is not None:
+            self.span.tracer.start_span(
+                name, parent=self.span, started_ago=duration
+            ).end()
+
+    def observe(self, status_code: int) -> None:
+        outcome = self.outcome or outcome_from_status(status_code)
+        for stage, duration in self.durations.items():
+            STAGE_DURATION.labels(
+                stage, self.model, self.routing_mode, outcome
+            ).observe(duration)
+        self.durations.clear()
+        if self.span is not None:
+            self.span.set_attribute("model", self.model)
+            self.span.set_attribute("routing_mode", self.routing_mode)
+            self.span.set_attribute("outcome", outcome)
+            self.span.set_attribute("http.status_code", status_code)
+            self.span.end()
@@ -1,18 +1,36 @@
 import asyncio
 import json
 import logging
+import time
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Tuple
 
 from aio_pika.exceptions import ChannelClosed
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
-from httpx import AsyncClient, Response
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from httpx import AsyncClient, ConnectError, ConnectTimeout
+from httpx import Response as UpstreamResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import ValidationError
 from starlette.background import BackgroundTask, BackgroundTasks
 
 from src.common.message_data import MessageData
+from src.common.tracing import SERVER, TRACEPARENT_HEADER, create_tracer
 from src.sender.db import Database
+from src.sender.embeddings_batcher import (
+    BATCHED_FIELDS,
+    BatchedRequest,
+    EmbeddingsBatcher,
+    batch_key,
+    embeddings_inputs,
+    split_embeddings_response,
+)
 from src.sender.entities import Metric, User
 from src.sender.exceptions import (
     InvalidTokenException,
@@ -20,14 +38,66 @@ from src.sender.exceptions import (
     ServerError,
     UnauthorizedException,
 )
+from src.sender.instrumentation import (
+    AUTH,
+    OPEN_UPSTREAM_STREAMS,
+    PENDING_RPC_CALLS,
+    STREAM,
+    TTFB,
+    UPSTREAM_CONNECT,
+    UPSTREAM_RETRIES,
+    StageTimer,
+)
 from src.sender.models import get_model_by_id, get_models
+from src.sender.prefix import compute_prefix_hash
+from src.sender.response_cache import (
+    COALESCED,
+    EMBEDDINGS_PATH,
+    HIT,
+    MISS,
+    CachedResponse,
+    PendingResponse,
+    ResponseCache,
+)
 from src.sender.rpc_client import CallResult, RPCClient
 from src.sender.settings import Settings
+from src.sender.tokens import (
+    estimate_prompt_tokens,
+    load_tokenizer,
+    requested_max_tokens,
+)
 
 settings = Settings()
+tracer = create_tracer(
+    "aristote-sender",
+    settings.TRACING_EXPORTER,
+    settings.TRACING_SAMPLE_RATIO,
+    settings.TRACING_FILE,
+)
+response_cache = (
+    ResponseCache(
+        max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+        max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+        ttl=settings.RESPONSE_CACHE_TTL,
+        model_ttls=settings.RESPONSE_CACHE_MODEL_TTLS,
+        scope=settings.RESPONSE_CACHE_SCOPE,
+        disk_dir=settings.RESPONSE_CACHE_DIR,
+        disk_max_bytes=settings.RESPONSE_CACHE_DISK_MAX_BYTES,
+        pending_timeout=settings.PROXY_CLIENT_REQUEST_TIMEOUT,
+    )
+    if settings.RESPONSE_CACHE
+    else None
+)
+
+# Answers of LLM servers on which requests are retried on another server
+RETRIED_STATUS_CODES = {429, 503}
 
 database: Database = None
 rpc_client: RPCClient = None
+embeddings_batcher: EmbeddingsBatcher | None = None  # pylint: disable=invalid-name
+tokenizer = None  # pylint: disable=invalid-name
+# Reads of upstream responses shared by identical requests
+fill_tasks: set[asyncio.Task] = set()
 
 logging.basicConfig(
     level=settings.LOG_LEVEL, format="%(asctime)s:%(levelname)s:%(name)s: %(message)s"
@@ -47,6 +117,18 @@ async def lifespan(_: FastAPI):
     rpc_client = RPCClient(settings=settings)
     await rpc_client.first_connect()
     logging.info("RPC connection opened")
+    PENDING_RPC_CALLS.set_function(lambda: len(rpc_client.futures))
+
+    global tokenizer  # pylint: disable=global-statement
+    tokenizer = await asyncio.to_thread(load_tokenizer, settings.TOKENIZER)
+
+    if settings.EMBEDDINGS_BATCHING:
+        global embeddings_batcher  # pylint: disable=global-statement
+        embeddings_batcher = EmbeddingsBatcher(
+            settings.EMBEDDINGS_BATCH_WINDOW,
+            settings.EMBEDDINGS_BATCH_MAX_INPUTS,
+            process_embeddings_batch,
+        )
 
     yield
 
@@ -78,6 +160,40 @@ def authorize(request: Request):
     return user
 
 
+def unavailable_response(user: User, error: str) -> JSONResponse:
+    response_content = {"error": error}
+    match str(user.client_type):
+        case "chat":
+            return JSONResponse(content=response_content, status_code=200)
+        case _:
+            return JSONResponse(content=response_content, status_code=503)
+
+
+def retry_allowed(retries: int, start: datetime) -> bool:
+    """
+    Whether a request failed by its LLM server can be granted again on another one
+    """
+    return (
+        retries < settings.UPSTREAM_MAX_RETRIES
+        and (datetime.now() - start).total_seconds() < settings.UPSTREAM_RETRY_DEADLINE
+    )
+
+
+def completion_payload(
+    correlation_id: str, requested_model: str, user_name: str | None, llm_url: str
+) -> dict:
+    """
+    Completion message releasing the grant of a request on the consumer side
+    """
+    return {
+        "message_id": str(correlation_id),
+        "completed_at": datetime.utcnow().isoformat(),
+        "model": requested_model,
+        "user": user_name,
+        "server": llm_url,
+    }
+
+
 async def store_usage_metrics(
     response_body: bytes, metric: Metric, stream: bool
 ) -> None:
@@ -111,17 +227,368 @@ async def store_usage_metrics(
         session.commit()
 
 
-async def stream_and_accumulate_response(
-    response: Response, background_tasks: BackgroundTasks, metric: Metric, stream: bool
+async def stream_and_accumulate_response(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    response: UpstreamResponse | CachedResponse | PendingResponse,
+    background_tasks: BackgroundTasks,
+    metric: Metric,
+    stream: bool,
+    timer: StageTimer,
+    sent_at: float,
 ):
+    """
+    Streams the response of the LLM server, or a response replayed from the
+    cache or from an identical request in flight
+    """
     full_response_bytes = b""
-    async for chunk in response.aiter_bytes():
-        full_response_bytes += chunk
-        yield chunk
+    first_chunk_at = None
+    last_chunk_at = None
+    chunk_count = 0
+    max_gap = 0.0
+    upstream = isinstance(response, UpstreamResponse)
+    if upstream:
+        OPEN_UPSTREAM_STREAMS.inc()
+    try:
+        async for chunk in response.aiter_bytes():
+            now = time.perf_counter()
+            if first_chunk_at is None:
+                first_chunk_at = now
+                timer.record(TTFB, first_chunk_at - sent_at)
+            else:
+                max_gap = max(max_gap, now - last_chunk_at)
+            last_chunk_at = now
+            chunk_count += 1
+            full_response_bytes += chunk
+            yield chunk
+    finally:
+        if upstream:
+            OPEN_UPSTREAM_STREAMS.dec()
+        if first_chunk_at is not None:
+            timer.record(STREAM, last_chunk_at - first_chunk_at)
+        if first_chunk_at is not None and metric.sent_to_llm_date is not None:
+            # Durations come from the monotonic clock, dates are anchored on
+            # sent_to_llm_date so that they are consistent with each other
+            metric.first_byte_date = metric.sent_to_llm_date + timedelta(
+                seconds=first_chunk_at - sent_at
+            )
+        metric.chunk_count = chunk_count
+        if chunk_count > 1:
+            metric.max_inter_chunk_gap = max_gap
+            metric.mean_inter_chunk_gap = (last_chunk_at - first_chunk_at) / (
+                chunk_count - 1
+            )
+        timer.observe(response.status_code)
 
     background_tasks.add_task(store_usage_metrics, full_response_bytes, metric, stream)
 
 
+async def fill_pending_response(
+    response: UpstreamResponse,
+    pending: PendingResponse,
+    upstream_tasks: BackgroundTasks,
+    requested_model: str,
+) -> None:
+    """
+    Reads the response of the LLM server into `pending`, from which the request
+    that called it and identical requests are replayed, then caches it
+    """
+    completed = False
+    OPEN_UPSTREAM_STREAMS.inc()
+    try:
+        async for chunk in response.aiter_bytes():
+            pending.append(chunk)
+        completed = True
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.error("Failed to read the response of %s: %s", pending.server, e)
+    finally:
+        OPEN_UPSTREAM_STREAMS.dec()
+        response_cache.finish(pending, failed=not completed)
+        await upstream_tasks()
+    if completed:
+        await response_cache.store(pending, requested_model)
+
+
+def replay_cached_response(
+    cached_response: CachedResponse | PendingResponse,
+    cache_status: str,
+    metric: Metric,
+    stream: bool,
+    timer: StageTimer,
+) -> StreamingResponse:
+    timer.outcome = cache_status
+    timer.deferred = True
+    background_tasks = BackgroundTasks()
+    response = StreamingResponse(
+        stream_and_accumulate_response(
+            cached_response,
+            background_tasks,
+            metric,
+            stream,
+            timer,
+            time.perf_counter(),
+        ),
+        status_code=cached_response.status_code,
+        media_type=cached_response.content_type,
+        background=background_tasks,
+    )
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
+async def proxy_batched_embeddings_request(
+    request: Request, batched_request: BatchedRequest
+) -> Response:
+    response, llm_url = await embeddings_batcher.submit(
+        batch_key(batched_request), batched_request
+    )
+    pending = getattr(request.state, "pending_response", None)
+    if pending is not None and response.status_code == 200:
+        pending.start(response.media_type, llm_url)
+        pending.append(response.body)
+        response_cache.finish(pending)
+        await response_cache.store(pending, batched_request.json_body["model"])
+    return response
+
+
+async def post_batch(
+    batch: List[BatchedRequest], llm_params: MessageData, release_payload: dict
+) -> UpstreamResponse:
+    """
+    Sends the inputs of a batch to the LLM server it was granted, the response is
+    read entirely and the grant released as soon as it is received
+    """
+    first = batch[0]
+    body = {
+        key: value
+        for key, value in first.json_body.items()
+        if key not in BATCHED_FIELDS
+    }
+    body["input"] = [item for request in batch for item in request.inputs]
+    if isinstance(llm_params.forwarded_priority, int):
+        body["priority"] = llm_params.forwarded_priority
+    headers = {"Content-Type": "application/json"}
+    if llm_params.llm_token:
+        headers["Authorization"] = f"Bearer {llm_params.llm_token}"
+
+    logging.info(
+        "Batch of %s embeddings requests (%s inputs) sent to %s",
+        len(batch),
+        len(body["input"]),
+        llm_params.llm_url,
+    )
+    try:
+        async with AsyncClient(
+            base_url=llm_params.llm_url,
+            timeout=settings.PROXY_CLIENT_REQUEST_TIMEOUT,
+        ) as http_client:
+            with first.timer.stage(UPSTREAM_CONNECT) as span:
+                if span is not None:
+                    headers[TRACEPARENT_HEADER] = span.traceparent
+                return await http_client.post(
+                    EMBEDDINGS_PATH, json=body, headers=headers
+                )
+    finally:
+        await rpc_client.send_completion_message(
+            first.json_body["model"], release_payload
+        )
+
+
+def batch_responses(
+    batch: List[BatchedRequest],
+    res: UpstreamResponse,
+    llm_params: MessageData,
+    sent_to_llm_date: datetime,
+    prompt_tokens: List[int],
+) -> List[Tuple[Response, str | None]]:
+    """
+    Response of each request of a batch from the response of the LLM server,
+    with the url of the server
+    """
+    llm_url = llm_params.llm_url
+    if res.status_code != 200:
+        return [
+            (
+                Response(
+                    content=res.content,
+                    status_code=res.status_code,
+                    media_type=res.headers.get("content-type"),
+                ),
+                llm_url,
+            )
+            for _ in batch
+        ]
+    responses = []
+    for request, response_content in zip(
+        batch, split_embeddings_response(res.json(), batch, prompt_tokens)
+    ):
+        # Usage of each request is its share of the usage of the batch
+        metric = Metric(
+            user_name=request.user.name,
+            user_organization=request.user.organization,
+            model=request.json_body["model"],
+            server=llm_url,
+            server_organization=llm_params.llm_organization,
+            request_date=request.start,
+            sent_to_llm_date=sent_to_llm_date,
+            strategy=llm_params.strategy,
+            requeue_count=llm_params.requeue_count,
+            max_parallel_requests=llm_params.max_parallel_requests,
+            current_parallel_requests=llm_params.current_parallel_requests,
+            priority=request.priority,
+            effective_priority=llm_params.effective_priority,
+            performance_score=llm_params.performance_score,
+            routing_mode=request.routing_mode,
+            granted_date=(
+                llm_params.granted_at.astimezone().replace(tzinfo=None)
+                if llm_params.granted_at
+                else None
+            ),
+            batch_size=len(batch),
+        )
+        content = json.dumps(response_content).encode("utf-8")
+        responses.append(
+            (
+                Response(
+                    content=content,
+                    media_type="application/json",
+                    background=BackgroundTask(
+                        store_usage_metrics, content, metric, False
+                    ),
+                ),
+                llm_url,
+            )
+        )
+    return responses
+
+
+async def process_embeddings_batch(
+    batch: List[BatchedRequest],
+) -> List[Tuple[Response, str | None]]:
+    """
+    Sends a batch of embeddings requests upstream with a single grant, and
+    returns the response of each request with the url of the LLM server
+    """
+    # The stages of the batch are recorded on the timer of its first request
+    first = batch[0]
+    requested_model = first.json_body["model"]
+    prompt_tokens = [
+        await estimate_prompt_tokens(
+            request.json_body,
+            settings.TOKEN_ESTIMATE_CHARS_PER_TOKEN,
+            tokenizer,
+        )
+        for request in batch
+    ]
+
+    # Requests of a batch share their priority and threshold (see batch_key)
+    start = min(request.start for request in batch)
+    users = {request.user.name for request in batch}
+    batch_user = users.pop() if len(users) == 1 else None
+    # Servers that failed to answer, the batch is granted again on another one
+    excluded_servers: List[str] = []
+    while True:
+        rpc_response = await rpc_client.call(
+            first.priority,
+            first.threshold,
+            requested_model,
+            first.user.organization,
+            first.routing_mode,
+            user=batch_user,
+            user_priority=first.user.priority,
+            prompt_tokens=sum(prompt_tokens),
+            excluded_servers=excluded_servers,
+            timer=first.timer,
+        )
+
+        if isinstance(rpc_response, CallResult):
+            for request in batch:
+                request.timer.outcome = rpc_response.name.lower()
+            if rpc_response not in {CallResult.QUEUE_OVERLOADED, CallResult.TIMEOUT}:
+                raise ServerError()
+            return [
+                (
+                    unavailable_response(
+                        request.user, "Too many people using the service"
+                    ),
+                    None,
+                )
+                for request in batch
+            ]
+
+        try:
+            llm_params = MessageData(**json.loads(rpc_response.body.decode("utf-8")))
+        except (json.JSONDecodeError, ValidationError) as e:
+            logging.error("Invalid LLMParams message: %s", e)
+            return [
+                (
+                    JSONResponse(
+                        content={
+                            "error": "A problem occured while handling the request",
+                        },
+                        status_code=500,
+                    ),
+                    None,
+                )
+                for _ in batch
+            ]
+
+        if llm_params.llm_url is None:
+            return [
+                (
+                    unavailable_response(
+                        request.user, f"{requested_model} is busy, try again later"
+                    ),
+                    None,
+                )
+                for request in batch
+            ]
+
+        sent_to_llm_date = datetime.now()
+        # On failure, the batch is granted again on another server, within the
+        # retry budget of the unbatched requests
+        try:
+            res = await post_batch(
+                batch,
+                llm_params,
+                completion_payload(
+                    rpc_response.correlation_id,
+                    requested_model,
+                    batch_user,
+                    llm_params.llm_url,
+                ),
+            )
+        except (ConnectError, ConnectTimeout) as e:
+            failure = f"{type(e).__name__} {e}"
+            if not retry_allowed(len(excluded_servers), start):
+                logging.warning(
+                    "%s failed (%s), no retry left for batch started at %s",
+                    llm_params.llm_url,
+                    failure,
+                    start,
+                )
+                raise
+        else:
+            if res.status_code not in RETRIED_STATUS_CODES:
+                break
+            failure = f"status {res.status_code}"
+            if not retry_allowed(len(excluded_servers), start):
+                # The answer of the server goes to the users
+                logging.warning(
+                    "%s failed (%s), no retry left for batch started at %s",
+                    llm_params.llm_url,
+                    failure,
+                    start,
+                )
+                break
+
+        logging.warning(
+            "%s failed (%s), retrying on another server", llm_params.llm_url, failure
+        )
+        UPSTREAM_RETRIES.labels(requested_model).inc()
+        excluded_servers.append(llm_params.llm_url)
+
+    return batch_responses(batch, res, llm_params, sent_to_llm_date, prompt_tokens)
+
+
 @app.get("/v1/models")
 async def models():
     return JSONResponse(
@@ -147,7 +614,6 @@ async def model(model_id):
 
 @app.middleware("http")
 async def proxy(request: Request, call_next):
-    start = datetime.now()
     logging.info("Received request on path %s", request.url.path)
 
     if request.method == "GET" and request.url.path == "/health/liveness":
@@ -160,9 +626,42 @@ async def proxy(request: Request, call_next):
             return PlainTextResponse(content="OK", status_code=200)
         return PlainTextResponse(content="KO", status_code=503)
 
+    if request.method == "GET" and request.url.path == "/metrics":
+        return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    timer = StageTimer(
+        tracer.start_span(
+            "proxy_request",
+            parent=request.headers.get(TRACEPARENT_HEADER),
+            kind=SERVER,
+            attributes={"http.method": request.method, "url.path": request.url.path},
+        )
+    )
+    try:
+        response = await proxy_request(request, call_next, timer)
+    except Exception as e:
+        timer.span.set_error(str(e))
+        timer.span.end()
+        raise
+    finally:
+        pending = getattr(request.state, "pending_response", None)
+        if pending is not None and pending.status_code is None:
+            # No response of the LLM server to share, identical requests waiting
+            # for it go on by themselves
+            response_cache.finish(pending, failed=True)
+    # Streamed responses are observed once the stream ends
+    if not timer.deferred:
+        timer.observe(response.status_code)
+    return response
+
+
+async def proxy_request(request: Request, call_next, timer: StageTimer):
+    start = datetime.now()
+
     # Authorization
     try:
-        user = authorize(request)
+        with timer.stage(AUTH):
+            user = authorize(request)
     except (NoTokenException, InvalidTokenException, UnauthorizedException) as e:
         return JSONResponse(status_code=e.status_code, content={"error": e.detail})
 
@@ -193,6 +692,7 @@ async def proxy(request: Request, call_next):
 
     requested_model = json_body["model"]
     stream = json_body.get("stream", True)
+    timer.model = requested_model
 
     if not await get_model_by_id(settings, requested_model):
         return JSONResponse(
@@ -205,6 +705,7 @@ async def proxy(request: Request, call_next):
 
     default_routing_mode = user.default_routing_mode
     routing_mode = json_body.get("routing-mode", default_routing_mode)
+    timer.routing_mode = str(routing_mode)
     if routing_mode not in ["any", "private-first", "private-only"]:
         return JSONResponse(
             content={
@@ -228,94 +729,208 @@ async def proxy(request: Request, call_next):
 
     priority = min(json_body.get("priority", user.priority), user.priority)
 
-    try:
-        rpc_response = await rpc_client.call(
-            priority,
-            threshold,
+    cache_key = None
+    if response_cache is not None and "no-cache" not in request.headers.get(
+        "cache-control", ""
+    ):
+        cache_key = response_cache.key(
+            request.url.path,
+            json_body,
             requested_model,
+            user.name,
             user.organization,
-            routing_mode,
         )
-    except ChannelClosed:
-        # the queue may have been deleted (ex: consumer does not exist anymore)
-        logging.debug(
-            "Queue %s seems to not be existing anymore. Refreshing models...",
-            requested_model,
+    if cache_key is not None:
+        cached_response = await response_cache.get(cache_key, requested_model)
+        cache_status = HIT
+        if cached_response is None:
+            # Wait for the identical request in flight, if any, instead of
+            # calling the LLM server again
+            cached_response = response_cache.pending.get(cache_key)
+            cache_status = COALESCED
+            if cached_response is not None and not await cached_response.wait_started():
+                cached_response = None
+        if cached_response is not None:
+            logging.info("Response of user %s served from the cache", user.name)
+            metric = Metric(
+                user_name=user.name,
+                user_organization=user.organization,
+                model=requested_model,
+                server=cached_response.server,
+                request_date=start,
+                priority=priority,
+                routing_mode=routing_mode,
+                cache_status=cache_status,
+            )
+            return replay_cached_response(
+                cached_response, cache_status, metric, stream, timer
+            )
+        request.state.pending_response = response_cache.start(cache_key)
+
+    inputs = None
+    if embeddings_batcher is not None and request.url.path == EMBEDDINGS_PATH:
+        inputs = embeddings_inputs(json_body)
+
+    # Servers that failed to answer, the request is granted again on another one
+    excluded_servers: List[str] = []
+    while True:
+        try:
+            if inputs is not None:
+                return await proxy_batched_embeddings_request(
+                    request,
+                    BatchedRequest(
+                        json_body=json_body,
+                        inputs=inputs,
+                        user=user,
+                        priority=priority,
+                        threshold=threshold,
+                        routing_mode=routing_mode,
+                        timer=timer,
+                        start=start,
+                    ),
+                )
+            rpc_response = await rpc_client.call(
+                priority,
+                threshold,
+                requested_model,
+                user.organization,
+                routing_mode,
+                user=user.name,
+                user_priority=user.priority,
+                prefix_hash=compute_prefix_hash(
+                    json_body, settings.PREFIX_HASH_MAX_CHARS
+                ),
+                prompt_tokens=await estimate_prompt_tokens(
+                    json_body,
+                    settings.TOKEN_ESTIMATE_CHARS_PER_TOKEN,
+                    tokenizer,
+                ),
+                max_tokens=requested_max_tokens(json_body),
+                excluded_servers=excluded_servers,
+                timer=timer,
+            )
+        except ChannelClosed:
+            # the queue may have been deleted (ex: consumer does not exist anymore)
+            logging.debug(
+                "Queue %s seems to not be existing anymore. Refreshing models...",
+                requested_model,
+            )
+            asyncio.create_task(get_models(settings))
+            return JSONResponse(
+                content={
+                    "object": "error",
+                    "error": "Unknown model",
+                },
+                status_code=404,
+            )
+
+        if isinstance(rpc_response, CallResult):
+            timer.outcome = rpc_response.name.lower()
+            if rpc_response not in {CallResult.QUEUE_OVERLOADED, CallResult.TIMEOUT}:
+                raise ServerError()
+
+            return unavailable_response(user, "Too many people using the service")
+
+        logging.info("RPC response received")
+
+        llm_params_dict = json.loads(rpc_response.body.decode("utf-8"))
+        try:
+            llm_params = MessageData(**llm_params_dict)
+        except ValidationError as e:
+            logging.error("Invalid LLMParams message: %s", e)
+            response_content = {
+                "error": "A problem occured while handling the request",
+            }
+            return JSONResponse(content=response_content, status_code=500)
+
+        llm_url = llm_params.llm_url
+        llm_token = llm_params.llm_token
+        llm_organization = llm_params.llm_organization
+        llm_forwarded_priority = llm_params.forwarded_priority
+
+        if llm_url is None:
+            return unavailable_response(
+                user, f"{requested_model} is busy, try again later"
+            )
+
+        content_type = request.headers.get("content-type")
+
+        if content_type is None:
+            content_type = "application/json"
+
+        headers = {"Content-Type": content_type}
+        if llm_token:
+            headers["Authorization"] = f"Bearer {llm_token}"
+
+        logging.info("LLM Url received : %s", llm_url)
+
+        upstream_body = body
+        if llm_forwarded_priority is not None and isinstance(
+            llm_forwarded_priority, int
+        ):
+            upstream_body = json.dumps(
+                {**json_body, "priority": llm_forwarded_priority}
+            )
+
+        http_client = AsyncClient(
+            base_url=llm_url, timeout=settings.PROXY_CLIENT_REQUEST_TIMEOUT
         )
-        asyncio.create_task(get_models(settings))
-        return JSONResponse(
-            content={
-                "object": "error",
-                "error": "Unknown model",
-            },
-            status_code=404,
+        req = http_client.build_request(
+            method=request.method,
+            url=request.url.path,
+            content=upstream_body,
+            headers=headers,
         )
 
-    if isinstance(rpc_response, CallResult):
-        if rpc_response not in {CallResult.QUEUE_OVERLOADED, CallResult.TIMEOUT}:
-            raise ServerError()
-
-        response_content = {"error": "Too many people using the service"}
-        match str(user.client_type):
-            case "chat":
-                return JSONResponse(content=response_content, status_code=200)
-            case _:
-                return JSONResponse(content=response_content, status_code=503)
-
-    logging.info("RPC response received")
-
-    llm_params_dict = json.loads(rpc_response.body.decode("utf-8"))
-    try:
-        llm_params = MessageData(**llm_params_dict)
-    except ValidationError as e:
-        logging.error("Invalid LLMParams message: %s", e)
-        response_content = {
-            "error": "A problem occured while handling the request",
-        }
-        return JSONResponse(content=response_content, status_code=500)
-
-    llm_url = llm_params.llm_url
-    llm_token = llm_params.llm_token
-    llm_organization = llm_params.llm_organization
-    llm_forwarded_priority = llm_params.forwarded_priority
-
-    if llm_url is None:
-        response_content = {
-            "error": f"{requested_model} is busy, try again later",
-        }
-        match str(user.client_type):
-            case "chat":
-                return JSONResponse(content=response_content, status_code=200)
-            case _:
-                return JSONResponse(content=response_content, status_code=503)
-
-    content_type = request.headers.get("content-type")
-
-    if content_type is None:
-        content_type = "application/json"
-
-    headers = {"Content-Type": content_type}
-    if llm_token:
-        headers["Authorization"] = f"Bearer {llm_token}"
-
-    logging.info("LLM Url received : %s", llm_url)
-
-    if llm_forwarded_priority is not None and isinstance(llm_forwarded_priority, int):
-        json_body["priority"] = llm_forwarded_priority
-        body = json.dumps(json_body)
-
-    http_client = AsyncClient(
-        base_url=llm_url, timeout=settings.PROXY_CLIENT_REQUEST_TIMEOUT
-    )
-    req = http_client.build_request(
-        method=request.method, url=request.url.path, content=body, headers=headers
-    )
+        logging.info(
+            "Request ( Method: %s ; URL: %s )", request.method, request.url.path
+        )
+        logging.debug(" > Request content: %s", upstream_body)
 
-    logging.info("Request ( Method: %s ; URL: %s )", request.method, request.url.path)
-    logging.debug(" > Request content: %s", body)
+        sent_to_llm_date = datetime.now()
+        sent_at = time.perf_counter()
+        release_payload = completion_payload(
+            rpc_response.correlation_id, requested_model, user.name, llm_url
+        )
+        # Nothing was sent to the user yet: on failure, the grant is released and
+        # the request granted again on another server, within the retry budget
+        try:
+            with timer.stage(UPSTREAM_CONNECT) as span:
+                req.headers[TRACEPARENT_HEADER] = span.traceparent
+                res = await http_client.send(req, stream=stream)
+        except (ConnectError, ConnectTimeout) as e:
+            failure = f"{type(e).__name__} {e}"
+            await http_client.aclose()
+            await rpc_client.send_completion_message(requested_model, release_payload)
+            if not retry_allowed(len(excluded_servers), start):
+                logging.warning(
+                    "%s failed (%s), no retry left for request started at %s",
+                    llm_url,
+                    failure,
+                    start,
+                )
+                raise
+        else:
+            if res.status_code not in RETRIED_STATUS_CODES:
+                break
+            failure = f"status {res.status_code}"
+            if not retry_allowed(len(excluded_servers), start):
+                # The answer of the server goes to the user
+                logging.warning(
+                    "%s failed (%s), no retry left for request started at %s",
+                    llm_url,
+                    failure,
+                    start,
+                )
+                break
+            await res.aclose()
+            await http_client.aclose()
+            await rpc_client.send_completion_message(requested_model, release_payload)
+
+        logging.warning("%s failed (%s), retrying on another server", llm_url, failure)
+        UPSTREAM_RETRIES.labels(requested_model).inc()
+        excluded_servers.append(llm_url)
 
-    sent_to_llm_date = datetime.now()
-    res = await http_client.send(req, stream=stream)
     logging.info("Proxy request sent")
 
     metric = Metric(
@@ -331,31 +946,55 @@ async def proxy(request: Request, call_next):
         max_parallel_requests=llm_params.max_parallel_requests,
         current_parallel_requests=llm_params.current_parallel_requests,
         priority=priority,
+        effective_priority=llm_params.effective_priority,
         performance_score=llm_params.performance_score,
         routing_mode=routing_mode,
+        granted_date=(
+            # Stored as naive local time, like the other dates
+            llm_params.granted_at.astimezone().replace(tzinfo=None)
+            if llm_params.granted_at
+            else None
+        ),
     )
 
-    background_tasks = BackgroundTasks(
-        [
-            BackgroundTask(res.aclose),
-            BackgroundTask(http_client.aclose),
-            BackgroundTask(logging.info, f"Finished request started at {start}"),
-            BackgroundTask(
-                rpc_client.send_completion_message,
-                requested_model,
-                {
-                    "message_id": str(rpc_response.correlation_id),
-                    "completed_at": datetime.utcnow().isoformat(),
-                    "model": requested_model,
-                    "user": user.name,
-                    "server": llm_url,
-                },
+    upstream_tasks = [
+        BackgroundTask(res.aclose),
+        BackgroundTask(http_client.aclose),
+        BackgroundTask(
+            rpc_client.send_completion_message,
+            requested_model,
+            completion_payload(
+                rpc_response.correlation_id, requested_model, user.name, llm_url
             ),
-        ]
+        ),
+    ]
+    background_tasks = BackgroundTasks(
+        [BackgroundTask(logging.info, f"Finished request started at {start}")]
     )
 
+    response = res
+    pending = getattr(request.state, "pending_response", None)
+    if pending is not None and res.status_code == 200:
+        pending.start(res.headers.get("content-type"), llm_url)
+        metric.cache_status = MISS
+        # The upstream response is read apart from this client, so that identical
+        # requests replaying it are not cut if it goes away
+        fill_task = asyncio.create_task(
+            fill_pending_response(
+                res, pending, BackgroundTasks(upstream_tasks), requested_model
+            )
+        )
+        fill_tasks.add(fill_task)
+        fill_task.add_done_callback(fill_tasks.discard)
+        response = pending
+    else:
+        background_tasks.tasks[:0] = upstream_tasks
+
+    timer.deferred = True
     return StreamingResponse(
-        stream_and_accumulate_response(res, background_tasks, metric, stream),
+        stream_and_accumulate_response(
+            response, background_tasks, metric, stream, timer, sent_at
+        ),
         headers=res.headers,
         background=background_tasks,
     )
@@ -0,0 +1,51 @@
+import hashlib
+import json
+
+
+def leading_prompt(json_body: dict) -> str | None:
+    """
+    Extract the leading part of the prompt of an OpenAI-like request body: the
+    leading system and developer messages for chat completions (the first message
+    if there are none), the prompt otherwise.
+    Requests sharing a system prompt get the same leading prompt whatever their
+    user turns, as they share the prefix cached by vllm.
+    """
+    messages = json_body.get("messages")
+    if isinstance(messages, list) and messages:
+        leading_messages = []
+        for message in messages:
+            if not isinstance(message, dict) or message.get("role") not in (
+                "system",
+                "developer",
+            ):
+                break
+            leading_messages.append(message)
+        return json.dumps(
+            leading_messages or messages[:1], sort_keys=True, ensure_ascii=False
+        )
+
+    prompt = json_body.get("prompt")
+    if isinstance(prompt, list) and prompt:
+        prompt = prompt[0]
+    if isinstance(prompt, str) and prompt:
+        return prompt
+
+    return None
+
+
+def compute_prefix_hash(json_body: dict, max_chars: int) -> str | None:
+    """
+    Cheap hash of the first `max_chars` characters of the leading prompt, so that
+    requests sharing a system prompt (or a first message, without one) can be
+    routed to the same server and reuse its prefix cache.
+    """
+    if max_chars == 0:
+        return None
+
+    prefix = leading_prompt(json_body)
+    if prefix is None:
+        return None
+
+    return hashlib.blake2b(
+        prefix[:max_chars].encode("utf-8"), digest_size=8
+    ).hexdigest()
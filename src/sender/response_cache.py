@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, List
+
+# Endpoints whose responses are cached, embeddings are always deterministic
+GENERATION_PATHS = ("/v1/chat/completions", "/v1/completions")
+EMBEDDINGS_PATH = "/v1/embeddings"
+# Fields of the body that do not change the response
+IGNORED_FIELDS = ("priority", "routing-mode")
+
+HIT = "hit"
+COALESCED = "coalesced"
+MISS = "miss"
+
+
+class UpstreamResponseFailed(Exception):
+    """
+    The upstream response replayed to a request ended before its completion
+    """
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    content_type: str | None
+    server: str | None
+    chunks: List[bytes]
+    stored_at: float = field(default_factory=time.time)
+
+    @property
+    def size(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks)
+
+    async def aiter_bytes(self) -> AsyncIterator[bytes]:
+        for chunk in self.chunks:
+            yield chunk
+
+
+class PendingResponse:  # pylint: disable=too-many-instance-attributes
+    """
+    Response of an upstream call shared with identical requests received while it
+    is in flight: its chunks are replayed to them as they arrive.
+    """
+
+    def __init__(self, key: str, timeout: float) -> None:
+        self.key = key
+        self.timeout = timeout
+        self.status_code: int | None = None
+        self.content_type: str | None = None
+        self.server: str | None = None
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.failed = False
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def start(self, content_type: str | None, server: str) -> None:
+        self.status_code = 200
+        self.content_type = content_type
+        self.server = server
+        self._notify()
+
+    def append(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, failed: bool = False) -> None:
+        self.done = True
+        self.failed = failed
+        self._notify()
+
+    async def wait_started(self) -> bool:
+        """
+        Waits for the upstream response, returns False if there will be none
+        """
+        try:
+            while self.status_code is None and not self.done:
+                await asyncio.wait_for(self._changed.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.status_code is not None and not self.failed
+
+    async def aiter_bytes(self) -> AsyncIterator[bytes]:
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done:
+                if self.failed:
+                    # Aborts the replay rather than ending it as if it were complete
+                    raise UpstreamResponseFailed(self.key)
+                return
+            await asyncio.wait_for(changed.wait(), self.timeout)
+
+    def to_cached_response(self) -> CachedResponse:
+        return CachedResponse(
+            status_code=self.status_code,
+            content_type=self.content_type,
+            server=self.server,
+            chunks=self.chunks,
+        )
+
+
+class ResponseCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Exact-match cache of deterministic responses, streamed ones included, keyed by
+    a hash of the normalized body, the model and the scope of the user.
+
+    Responses are kept in memory in LRU order up to `max_bytes`, and, when
+    `disk_dir` is set, in files evicted oldest first beyond `disk_max_bytes`.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        max_bytes: int,
+        max_entry_bytes: int,
+        ttl: float,
+        model_ttls: Dict[str, float],
+        scope: str,
+        disk_dir: str | None = None,
+        disk_max_bytes: int = 0,
+        pending_timeout: float = 600,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.model_ttls = model_ttls
+        self.scope = scope
+        self.pending_timeout = pending_timeout
+        self.memory: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.memory_bytes = 0
+        self.pending: Dict[str, PendingResponse] = {}
+
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_entries: OrderedDict[str, int] = OrderedDict()
+        self.disk_bytes = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            for path in sorted(
+                self.disk_dir.glob("*.cache"), key=lambda path: path.stat().st_mtime
+            ):
+                self.disk_entries[path.stem] = path.stat().st_size
+                self.disk_bytes += path.stat().st_size
+
+    def key(
+        self,
+        path: str,
+        json_body: dict,
+        model: str,
+        user_name: str,
+        organization: str | None,
+    ) -> str | None:
+        """
+        Cache key of the request, or None if its response is not deterministic
+        """
+        if path != EMBEDDINGS_PATH and (
+            path not in GENERATION_PATHS or json_body.get("temperature") != 0
+        ):
+            return None
+        if json_body.get("n", 1) != 1:
+            return None
+        scope = {"user": user_name, "organization": organization, "global": None}[
+            self.scope
+        ]
+        body = {
+            key: value for key, value in json_body.items() if key not in IGNORED_FIELDS
+        }
+        normalized = json.dumps(
+            [path, model, scope, body], sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def model_ttl(self, model: str) -> float:
+        return self.model_ttls.get(model, self.ttl)
+
+    async def get(self, key: str, model: str) -> CachedResponse | None:
+        response = self.memory.get(key)
+        if response is None and key in self.disk_entries:
+            try:
+                response = await asyncio.to_thread(self._read_disk, key)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.warning("Could not read cached response %s: %s", key, e)
+                self._remove_disk(key)
+            if response is not None:
+                self._store_memory(key, response)
+
+        if response is None:
+            return None
+        if time.time() - response.stored_at > self.model_ttl(model):
+            self._remove_memory(key)
+            self._remove_disk(key)
+            return None
+        if key in self.memory:
+            self.memory.move_to_end(key)
+        return response
+
+    def start(self, key: str) -> PendingResponse:
+        """
+        Registers the upstream call of the first of identical requests
+        """
+        pending = PendingResponse(key, self.pending_timeout)
+        self.pending[key] = pending
+        return pending
+
+    def finish(self, pending: PendingResponse, failed: bool = False) -> None:
+        """
+        Ends the replays of the upstream call, identical requests received from
+        now on go through the cache (or on their own if it failed)
+        """
+        pending.finish(failed)
+        if self.pending.get(pending.key) is pending:
+            del self.pending[pending.key]
+
+    async def store(self, pending: PendingResponse, model: str) -> None:
+        response = pending.to_cached_response()
+        if response.size > self.max_entry_bytes or self.model_ttl(model) <= 0:
+            return
+        self._store_memory(pending.key, response)
+        if self.disk_dir is not None:
+            try:
+                size = await asyncio.to_thread(self._write_disk, pending.key, response)
+            except OSError as e:
+                logging.warning("Could not write cached response: %s", e)
+                return
+            self._remove_disk_entry(pending.key)
+            self.disk_entries[pending.key] = size
+            self.disk_bytes += size
+            while self.disk_bytes > self.disk_max_bytes and self.disk_entries:
+                self._remove_disk(next(iter(self.disk_entries)))
+
+    def _store_memory(self, key: str, response: CachedResponse) -> None:
+        self._remove_memory(key)
+        self.memory[key] = response
+        self.memory_bytes += response.size
+        while self.memory_bytes > self.max_bytes and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted.size
+
+    def _remove_memory(self, key: str) -> None:
+        response = self.memory.pop(key, None)
+        if response is not None:
+            self.memory_bytes -= response.size
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.cache"
+
+    def _read_disk(self, key: str) -> CachedResponse:
+        # A JSON header line followed by the chunks
+        with self._disk_path(key).open("rb") as file:
+            header = json.loads(file.readline())
+            chunks = [file.read(size) for size in header.pop("chunk_sizes")]
+        return CachedResponse(chunks=chunks, **header)
+
+    def _write_disk(self, key: str, response: CachedResponse) -> int:
+        header = {
+            "status_code": response.status_code,
+            "content_type": response.content_type,
+            "server": response.server,
+            "stored_at": response.stored_at,
+            "chunk_sizes": [len(chunk) for chunk in response.chunks],
+        }
+        path = self._disk_path(key)
+        temporary_path = path.with_suffix(".tmp")
+        with temporary_path.open("wb") as file:
+            file.write(json.dumps(header).encode("utf-8") + b"\n")
+            for chunk in response.chunks:
+                file.write(chunk)
+        os.replace(temporary_path, path)
+        return path.stat().st_size
+
+    def _remove_disk_entry(self, key: str) -> None:
+        size = self.disk_entries.pop(key, None)
+        if size is not None:
+            self.disk_bytes -= size
+
+    def _remove_disk(self, key: str) -> None:
+        if key not in self.disk_entries:
+            return
+        self._remove_disk_entry(key)
+        try:
+            self._disk_path(key).unlink()
+        except OSError:
+            pass
@@ -2,8 +2,9 @@ import asyncio
 import json
 import logging
 import uuid
+from datetime import datetime, timezone
 from enum import Enum
-from typing import MutableMapping, Union
+from typing import List, MutableMapping, Union
 
 from aio_pika import DeliveryMode, Message, connect_robust
 from aio_pika.abc import (
@@ -13,6 +14,9 @@ from aio_pika.abc import (
     AbstractQueue,
 )
 
+from src.common.request_data import RequestData
+from src.common.tracing import TRACEPARENT_HEADER
+from src.sender.instrumentation import QUEUE_DEPTH_CHECK, RPC_WAIT, StageTimer
 from src.sender.settings import Settings
 
 
@@ -80,15 +84,24 @@ class RPCClient:
         logging.debug(" > Response body: %s", message.body)
         future.set_result(message)
 
-    async def call(
+    async def call(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
         self,
         priority: int,
         threshold: int,
         model: str,
         organization: str,
         routing_mode: str,
+        user: str | None = None,
+        user_priority: int | None = None,
+        prefix_hash: str | None = None,
+        prompt_tokens: int | None = None,
+        max_tokens: int | None = None,
+        excluded_servers: List[str] | None = None,
+        timer: StageTimer | None = None,
     ) -> Union[AbstractIncomingMessage, CallResult]:
-        model_queue = await self.channel.get_queue(name=model)
+        timer = timer or StageTimer()
+        with timer.stage(QUEUE_DEPTH_CHECK):
+            model_queue = await self.channel.get_queue(name=model)
         nb_messages = model_queue.declaration_result.message_count
         logging.debug("%s messages in the model queue : %s", nb_messages, model)
         if nb_messages > threshold:
@@ -100,47 +113,50 @@ class RPCClient:
         future = loop.create_future()
         self.futures[correlation_id] = future
 
+        request_data = RequestData(
+            routing_mode=routing_mode,
+            organization=organization,
+            user=user,
+            user_priority=user_priority,
+            prefix_hash=prefix_hash,
+            prompt_tokens=prompt_tokens,
+            max_tokens=max_tokens,
+            excluded_servers=excluded_servers or [],
+        )
         if routing_mode == "any":
-            await self.channel.default_exchange.publish(
-                message=Message(
-                    body=b"AVAILABLE?",
-                    headers={"x-requeue-count": 0},
-                    delivery_mode=DeliveryMode.PERSISTENT,
-                    correlation_id=correlation_id,
-                    reply_to=self.callback_queue.name,
-                    priority=priority,
-                ),
-                routing_key=model,
-            )
-            logging.debug("Message pushed to model queue %s", model)
-
+            routing_key = model
         else:
-            payload = {
-                "routing_mode": routing_mode,
-                "organization": organization,
-            }
+            routing_key = f"{model}_{organization}_private"
+
+        with timer.stage(RPC_WAIT) as span:
+            headers = {"x-requeue-count": 0}
+            if span is not None:
+                # The consumer's spans are children of this one
+                headers[TRACEPARENT_HEADER] = span.traceparent
             await self.channel.default_exchange.publish(
                 message=Message(
-                    body=json.dumps(payload).encode("utf-8"),
-                    headers={"x-requeue-count": 0},
+                    body=request_data.model_dump_json().encode("utf-8"),
+                    headers=headers,
                     delivery_mode=DeliveryMode.PERSISTENT,
                     correlation_id=correlation_id,
                     reply_to=self.callback_queue.name,
                     priority=priority,
+                    timestamp=datetime.now(timezone.utc),
                 ),
-                routing_key=f"{model}_{organization}_private",
+                routing_key=routing_key,
             )
-            logging.debug("Message pushed to model queue %s %s", model, organization)
-        try:
-            response = await asyncio.wait_for(
-                future, timeout=self.settings.MESSAGE_TIMEOUT
-            )  # Timeout in seconds
-            logging.info("Received URL for model %s", model)
-            return response
-        except asyncio.TimeoutError:
-            self.futures.pop(correlation_id, None)  # Clean up
-            logging.warning("Timeout waiting for response from consumer")
-            return CallResult.TIMEOUT
+            logging.debug("Message pushed to queue %s", routing_key)
+
+            try:
+                response = await asyncio.wait_for(
+                    future, timeout=self.settings.MESSAGE_TIMEOUT
+                )  # Timeout in seconds
+                logging.info("Received URL for model %s", model)
+                return response
+            except asyncio.TimeoutError:
+                self.futures.pop(correlation_id, None)  # Clean up
+                logging.warning("Timeout waiting for response from consumer")
+                return CallResult.TIMEOUT
 
     async def send_completion_message(self, model: str, payload: dict) -> None:
         try:
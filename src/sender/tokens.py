@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import math
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # tokenizers is an optional dependency
+    Tokenizer = None
+
+
+def _texts(value) -> list[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [text for item in value for text in _texts(item)]
+    if isinstance(value, dict):
+        # message ({"content": ...}) or content part ({"type": "text", "text": ...})
+        return _texts(value.get("content")) + _texts(value.get("text"))
+    return []
+
+
+def prompt_texts(json_body: dict) -> list[str]:
+    """
+    Texts sent to the model in an OpenAI-like request body
+    (chat messages, completion prompt or embeddings input)
+    """
+    for key in ("messages", "prompt", "input"):
+        if key in json_body:
+            return _texts(json_body[key])
+    return []
+
+
+def load_tokenizer(name: str | None):
+    """
+    Loads the tokenizer once at startup: it may be downloaded from the Hugging
+    Face hub
+    """
+    if not name:
+        return None
+    if Tokenizer is None:
+        logging.warning(
+            "tokenizers is not installed, prompt tokens are estimated from the "
+            "number of characters"
+        )
+        return None
+    try:
+        return Tokenizer.from_pretrained(name)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.warning("Could not load tokenizer %s: %s", name, e)
+        return None
+
+
+def count_tokens(tokenizer, texts: list[str]) -> int:
+    return sum(len(encoding.ids) for encoding in tokenizer.encode_batch(texts))
+
+
+async def estimate_prompt_tokens(
+    json_body: dict, chars_per_token: float, tokenizer=None
+) -> int:
+    texts = prompt_texts(json_body)
+
+    if tokenizer is not None:
+        # Encoding is CPU bound, it must not block the event loop
+        return await asyncio.to_thread(count_tokens, tokenizer, texts)
+
+    return math.ceil(sum(len(text) for text in texts) / chars_per_token)
+
+
+def requested_max_tokens(json_body: dict) -> int | None:
+    max_tokens = json_body.get("max_completion_tokens", json_body.get("max_tokens"))
+    if isinstance(max_tokens, int) and max_tokens >= 0:
+        return max_tokens
+    return None
@@ -0,0 +1,7 @@
+import os
+
+# Settings are read from the environment when their modules are imported
+os.environ.setdefault("VLLM_SERVERS", '{"http://a:8000": {"organization": "o"}}')
+os.environ.setdefault("MODEL", "m")
+os.environ.setdefault("ROUTING_STRATEGY", "least-busy")
+os.environ.setdefault("MODEL_HOST_MAPPING", '{"m": ["o"]}')
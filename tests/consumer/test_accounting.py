@@ -0,0 +1,133 @@
+import time
+
+from src.common.request_data import RequestData
+from src.consumer.accounting.request_accounting import RequestAccounting
+from src.consumer.accounting.token_accounting import TokenAccounting
+from src.consumer.vllm_server import VLLMServer
+
+
+def make_server(
+    max_parallel_requests=4, max_outstanding_tokens=500_000, reservations=()
+):
+    return VLLMServer(
+        url="http://a:8000",
+        token=None,
+        organization="o",
+        max_parallel_requests=max_parallel_requests,
+        max_outstanding_tokens=max_outstanding_tokens,
+        reservations=reservations,
+    )
+
+
+def test_request_accounting_counts_grants():
+    server = make_server(max_parallel_requests=2)
+    accounting = RequestAccounting([server])
+
+    accounting.grant(server, "1")
+    accounting.grant(server, "2")
+    assert accounting.load(server) == 2
+    assert accounting.is_saturated(server)
+
+    assert accounting.release(server, "1")
+    assert not accounting.release(server, "1")
+    assert accounting.load(server) == 1
+    assert not accounting.is_saturated(server)
+
+
+def test_request_accounting_effective_capacity_keeps_one_request():
+    server = make_server(max_parallel_requests=10)
+    accounting = RequestAccounting([server])
+
+    assert accounting.effective_capacity(server, 0.25) == 3
+    assert accounting.effective_capacity(server, 0.01) == 1
+
+
+def test_token_accounting_cost():
+    accounting = TokenAccounting([make_server()], 1000, 0.5)
+
+    assert accounting.cost(None) == 1000
+    assert accounting.cost(RequestData(prompt_tokens=200)) == 1100
+    assert accounting.cost(RequestData(prompt_tokens=200, max_tokens=10)) == 110
+
+
+def test_token_accounting_admits_on_the_cost_of_the_request():
+    server = make_server(max_outstanding_tokens=500_000)
+    accounting = TokenAccounting([server], 1000, 1.0)
+    accounting.grant(server, "1", RequestData(prompt_tokens=498_000, max_tokens=1000))
+
+    assert accounting.load(server) == 499_000
+    assert accounting.is_saturated(
+        server, RequestData(prompt_tokens=29_000, max_tokens=1000)
+    )
+    assert not accounting.is_saturated(
+        server, RequestData(prompt_tokens=0, max_tokens=1000)
+    )
+
+
+def test_idle_server_admits_oversized_request():
+    server = make_server(max_outstanding_tokens=1000)
+    accounting = TokenAccounting([server], 1000, 1.0)
+    oversized = RequestData(prompt_tokens=5000, max_tokens=100)
+
+    assert not accounting.is_saturated(server, oversized)
+    accounting.grant(server, "1", oversized)
+    assert accounting.is_saturated(server, RequestData(prompt_tokens=0, max_tokens=1))
+
+
+def test_reservations_are_held_back_from_other_organizations():
+    server = make_server(max_parallel_requests=4, reservations=(("r", 2),))
+    accounting = RequestAccounting([server], reservation_idle_seconds=60)
+    accounting.record_demand("r")
+    accounting.grant(server, "1", RequestData(organization="x"))
+    accounting.grant(server, "2", RequestData(organization="x"))
+
+    # The 2 requests left are reserved to r, which asked for the model recently
+    assert accounting.usage(server, "x") == 4
+    assert accounting.is_saturated(server, RequestData(organization="x"))
+    assert accounting.usage(server, "r") == 2
+    assert not accounting.is_saturated(server, RequestData(organization="r"))
+
+    # Reservations used by r are not held back twice
+    accounting.grant(server, "3", RequestData(organization="r"))
+    assert accounting.usage(server, "x") == 4
+
+
+def test_reservations_of_idle_organizations_are_lent():
+    server = make_server(max_parallel_requests=4, reservations=(("r", 2),))
+    accounting = RequestAccounting([server], reservation_idle_seconds=60)
+    accounting.grant(server, "1", RequestData(organization="x"))
+
+    # r never asked for the model
+    assert accounting.usage(server, "x") == 1
+
+    accounting.last_demand["r"] = time.monotonic() - 120
+    assert accounting.usage(server, "x") == 1
+
+
+def test_remote_grants_count_in_the_load():
+    server = make_server(max_parallel_requests=2)
+    accounting = RequestAccounting([server])
+    accounting.grant(server, "local")
+    accounting.remote_in_flight["replica"] = {
+        server.url: {"remote": accounting.in_flight[server]["local"]}
+    }
+
+    assert accounting.count(server) == 2
+    assert accounting.is_saturated(server)
+
+
+def test_grants_and_releases_are_notified():
+    server = make_server()
+    accounting = RequestAccounting([server])
+    events = []
+    accounting.on_grant = lambda server, correlation_id, grant: events.append(
+        ("grant", correlation_id)
+    )
+    accounting.on_release = lambda server, correlation_id: events.append(
+        ("release", correlation_id)
+    )
+
+    accounting.grant(server, "1")
+    accounting.release(server, "1")
+    accounting.release(server, "1")
+    assert events == [("grant", "1"), ("release", "1")]
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+from src.common.request_data import RequestData
+from src.consumer.fair_scheduler import FairScheduler
+
+
+def push(scheduler, name, user, priority=0, user_priority=None):
+    scheduler.push(
+        SimpleNamespace(name=name, priority=priority),
+        RequestData(user=user, user_priority=user_priority),
+    )
+
+
+def drain(scheduler):
+    names = []
+    while (item := scheduler.pop()) is not None:
+        names.append(item[0].name)
+    return names
+
+
+def test_users_are_served_in_turn():
+    scheduler = FairScheduler()
+    for i in range(3):
+        push(scheduler, f"a{i}", "a")
+    push(scheduler, "b0", "b")
+    push(scheduler, "c0", "c")
+
+    assert len(scheduler) == 5
+    assert drain(scheduler) == ["a0", "b0", "c0", "a1", "a2"]
+    assert len(scheduler) == 0
+
+
+def test_higher_priorities_are_served_first():
+    scheduler = FairScheduler()
+    push(scheduler, "low", "a", priority=1)
+    push(scheduler, "high", "b", priority=3)
+
+    assert drain(scheduler) == ["high", "low"]
+
+
+def test_shares_are_proportional_to_user_priority():
+    scheduler = FairScheduler()
+    for i in range(4):
+        push(scheduler, f"a{i}", "a", user_priority=2)
+        push(scheduler, f"b{i}", "b", user_priority=1)
+
+    assert drain(scheduler)[:6] == ["a0", "a1", "b0", "a2", "a3", "b1"]
+
+
+def test_fractional_quantum():
+    scheduler = FairScheduler(quantum=0.5)
+    for i in range(2):
+        push(scheduler, f"a{i}", "a")
+        push(scheduler, f"b{i}", "b")
+
+    assert drain(scheduler) == ["a0", "b0", "a1", "b1"]
+
+
+def test_clear():
+    scheduler = FairScheduler()
+    push(scheduler, "a0", "a")
+    push(scheduler, "b0", "b")
+
+    assert scheduler.clear() == 2
+    assert scheduler.pop() is None
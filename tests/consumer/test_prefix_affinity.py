@@ -0,0 +1,69 @@
+import asyncio
+
+from src.common.request_data import RequestData
+from src.consumer.strategy.prefix_affinity import PrefixAffinity
+from src.consumer.vllm_server import VLLMServer
+
+
+def make_servers(count):
+    return [
+        VLLMServer(
+            url=f"http://{i}:8000",
+            token=None,
+            organization="o",
+            max_parallel_requests=4,
+            max_outstanding_tokens=1000,
+        )
+        for i in range(count)
+    ]
+
+
+def test_ring_walk_yields_each_server_once():
+    servers = make_servers(3)
+    strategy = PrefixAffinity(servers, table_size=10, virtual_nodes=50)
+
+    walk = strategy.ring_walk("prefix")
+    assert sorted(walk, key=lambda server: server.url) == servers
+    assert walk == strategy.ring_walk("prefix")
+
+
+def test_same_prefix_sticks_to_its_server():
+    strategy = PrefixAffinity(make_servers(4), table_size=10, virtual_nodes=20)
+    request_data = RequestData(prefix_hash="prefix")
+
+    server, _ = strategy.choose_server(request_data)
+    for _ in range(5):
+        assert strategy.choose_server(request_data)[0] == server
+    assert strategy.affinity_table == {"prefix": server.url}
+
+
+def test_spills_over_to_the_next_server_when_saturated():
+    strategy = PrefixAffinity(make_servers(3), table_size=10, virtual_nodes=20)
+    request_data = RequestData(prefix_hash="prefix")
+    preferred, spillover = strategy.ring_walk("prefix")[:2]
+
+    strategy.saturation_check = lambda server, _: server == preferred
+    assert strategy.choose_server(request_data)[0] == spillover
+    # The prefix now lives on the server which served it last
+    strategy.saturation_check = lambda *_: False
+    assert strategy.choose_server(request_data)[0] == spillover
+
+    strategy.saturation_check = lambda *_: True
+    assert strategy.choose_server(request_data)[0] == spillover
+
+
+def test_affinity_table_is_bounded():
+    strategy = PrefixAffinity(make_servers(2), table_size=2, virtual_nodes=10)
+    for prefix in ("a", "b", "c"):
+        strategy.choose_server(RequestData(prefix_hash=prefix))
+
+    assert list(strategy.affinity_table) == ["b", "c"]
+
+
+def test_removed_servers_leave_the_ring():
+    servers = make_servers(3)
+    strategy = PrefixAffinity(servers, table_size=10, virtual_nodes=20)
+    asyncio.run(strategy.update_servers(servers[:2]))
+
+    assert strategy.ring_server_count == 2
+    assert set(strategy.ring_walk("prefix")) == set(servers[:2])
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src.consumer.quality_of_service_policy.utils import (
+    aged_priority,
+    first_published_at,
+)
+from src.consumer.settings import settings
+
+
+@pytest.fixture
+def aging(monkeypatch):
+    monkeypatch.setattr(settings, "BEST_PRIORITY", 5)
+    monkeypatch.setattr(settings, "RPC_MAX_PRIORITY", 5)
+    monkeypatch.setattr(settings, "PRIORITY_AGING_REQUEUE_STEP", 2)
+    monkeypatch.setattr(settings, "PRIORITY_AGING_WAIT_STEP", 10)
+
+
+def test_aging_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "PRIORITY_AGING_REQUEUE_STEP", 0)
+    monkeypatch.setattr(settings, "PRIORITY_AGING_WAIT_STEP", 0)
+
+    assert aged_priority(1, 10, 1000) == 1
+
+
+@pytest.mark.usefixtures("aging")
+def test_priority_ages_with_requeues_or_wait():
+    assert aged_priority(None, 10, 1000) is None
+    assert aged_priority(0, 1, 5) == 0
+    assert aged_priority(0, 2, 5) == 1
+    assert aged_priority(0, 2, 20) == 2
+
+
+@pytest.mark.usefixtures("aging")
+def test_aging_stays_below_the_qos_bypass():
+    # BEST_PRIORITY - 1 bypasses QoS policies, aging stops right below it
+    assert aged_priority(0, 100, 0) == 3
+    assert aged_priority(4, 100, 0) == 4
+
+
+def test_first_published_at():
+    published = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    message = SimpleNamespace(headers={}, timestamp=published)
+    assert first_published_at(message) == published.timestamp()
+
+    message.headers["x-first-published-at"] = 12.5
+    assert first_published_at(message) == 12.5
+
+    assert first_published_at(SimpleNamespace(headers=None, timestamp=None)) is None
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from src.sender.response_cache import (
+    EMBEDDINGS_PATH,
+    ResponseCache,
+    UpstreamResponseFailed,
+)
+
+
+def make_cache(**kwargs):
+    options = {
+        "max_bytes": 10,
+        "max_entry_bytes": 10,
+        "ttl": 60,
+        "model_ttls": {},
+        "scope": "global",
+    }
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+
+async def store(cache, key, chunks, model="m"):
+    pending = cache.start(key)
+    pending.start("application/json", "http://a:8000")
+    for chunk in chunks:
+        pending.append(chunk)
+    cache.finish(pending)
+    await cache.store(pending, model)
+
+
+async def replay(pending):
+    return [chunk async for chunk in pending.aiter_bytes()]
+
+
+def test_key_only_for_deterministic_requests():
+    cache = make_cache()
+    chat = "/v1/chat/completions"
+
+    assert cache.key(chat, {"temperature": 1}, "m", "u", "o") is None
+    assert cache.key(chat, {"temperature": 0, "n": 2}, "m", "u", "o") is None
+    assert cache.key(EMBEDDINGS_PATH, {"input": "x"}, "m", "u", "o") is not None
+    assert cache.key(chat, {"temperature": 0, "priority": 1}, "m", "u", "o") == (
+        cache.key(chat, {"temperature": 0}, "m", "other", None)
+    )
+
+
+def test_memory_is_evicted_in_lru_order():
+    async def scenario():
+        cache = make_cache(max_bytes=10)
+        await store(cache, "a", [b"aaaa"])
+        await store(cache, "b", [b"bbbb"])
+        assert await cache.get("a", "m") is not None
+        await store(cache, "c", [b"cccc"])
+
+        assert list(cache.memory) == ["a", "c"]
+        assert cache.memory_bytes == 8
+        assert await cache.get("b", "m") is None
+
+    asyncio.run(scenario())
+
+
+def test_large_responses_are_not_cached():
+    async def scenario():
+        cache = make_cache(max_entry_bytes=4)
+        await store(cache, "a", [b"aaa", b"aa"])
+        assert await cache.get("a", "m") is None
+
+    asyncio.run(scenario())
+
+
+def test_expired_responses_are_dropped():
+    async def scenario():
+        cache = make_cache(model_ttls={"m": 60})
+        await store(cache, "a", [b"a"])
+        cache.memory["a"].stored_at -= 120
+        assert await cache.get("a", "m") is None
+        assert "a" not in cache.memory
+
+    asyncio.run(scenario())
+
+
+def test_disk_tier_keeps_evicted_responses(tmp_path):
+    async def scenario():
+        cache = make_cache(max_bytes=4, disk_dir=str(tmp_path), disk_max_bytes=1000)
+        await store(cache, "a", [b"ab", b"cd"])
+        await store(cache, "b", [b"efgh"])
+        assert list(cache.memory) == ["b"]
+
+        response = await cache.get("a", "m")
+        assert response.chunks == [b"ab", b"cd"]
+        assert response.server == "http://a:8000"
+        assert list(cache.memory) == ["a"]
+
+        # Entries on disk are found again by a new cache
+        reopened = make_cache(disk_dir=str(tmp_path), disk_max_bytes=1000)
+        assert (await reopened.get("b", "m")).chunks == [b"efgh"]
+
+    asyncio.run(scenario())
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    async def scenario():
+        cache = make_cache(disk_dir=str(tmp_path), disk_max_bytes=1)
+        await store(cache, "a", [b"a"])
+
+        assert not cache.disk_entries
+        assert not list(tmp_path.glob("*.cache"))
+
+    asyncio.run(scenario())
+
+
+def test_pending_response_is_replayed_as_it_arrives():
+    async def scenario():
+        cache = make_cache()
+        pending = cache.start("a")
+        replayed = asyncio.create_task(replay(pending))
+        await asyncio.sleep(0)
+
+        pending.start("text/event-stream", "http://a:8000")
+        assert await pending.wait_started()
+        pending.append(b"1")
+        await asyncio.sleep(0)
+        pending.append(b"2")
+        cache.finish(pending)
+
+        assert await replayed == [b"1", b"2"]
+        assert "a" not in cache.pending
+
+    asyncio.run(scenario())
+
+
+def test_pending_response_replay_is_aborted_on_failure():
+    async def scenario():
+        cache = make_cache()
+        pending = cache.start("a")
+        pending.start("text/event-stream", "http://a:8000")
+        pending.append(b"1")
+        replayed = asyncio.create_task(replay(pending))
+        await asyncio.sleep(0)
+        cache.finish(pending, failed=True)
+
+        with pytest.raises(UpstreamResponseFailed):
+            await replayed
+        # Requests waiting for the response to start go on their own
+        assert not await pending.wait_started()
+
+    asyncio.run(scenario())
+
+
+def test_pending_response_never_started():
+    async def scenario():
+        pending = make_cache(pending_timeout=0.01).start("a")
+        assert not await pending.wait_started()
+
+    asyncio.run(scenario())